@@ -0,0 +1,94 @@
+"""
+Per-call cost of allow() for every limiter on the local (non-Lua) storages.
+
+    PYTHONPATH=. python benchmarks/bench_allow_overhead.py
+
+Limits are set high enough that every call is allowed, so the numbers are
+the fixed overhead of one decision. With --baseline, each limiter is also
+timed with the dispatch used before Storage.supports_lua: try the Lua
+script on every call and fall back to the local path on NotImplementedError.
+"""
+
+import argparse
+import time
+
+from gatekeeper import (
+    Decision,
+    FixedWindowLimiter,
+    InMemoryStorage,
+    LeakyBucketLimiter,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    SQLiteStorage,
+    TokenBucketLimiter,
+)
+from gatekeeper.algorithms.base import _parse_script_result
+
+LIMITERS = {
+    "fixed_window": lambda s: FixedWindowLimiter(10**9, 3600, storage=s),
+    "sliding_log": lambda s: SlidingWindowLogLimiter(10**9, 1, storage=s),
+    "sliding_counter": lambda s: SlidingWindowCounterLimiter(10**9, 3600, storage=s),
+    "token_bucket": lambda s: TokenBucketLimiter(10**9, 10**9, storage=s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(10**9, 10**9, storage=s),
+}
+
+STORAGES = {
+    "memory": InMemoryStorage,
+    "sqlite": lambda: SQLiteStorage(":memory:"),
+}
+
+
+def exception_dispatch(limiter):
+    """Make `limiter` decide the way it did before supports_lua existed."""
+    script = limiter.script
+
+    def decide(key: str, cost: int, now: float) -> Decision:
+        if script is not None:
+            try:
+                result = limiter.storage.execute_lua(
+                    script, *limiter._script_call(key, cost, now)
+                )
+                return _parse_script_result(result)
+            except NotImplementedError:
+                pass
+        return limiter._allow_local(key, cost, now)
+
+    limiter._decide = decide
+    return limiter
+
+
+def run(make_limiter, make_storage, calls: int, baseline: bool = False) -> float:
+    limiter = make_limiter(make_storage())
+    if baseline:
+        exception_dispatch(limiter)
+    keys = [f"user:{i % 100}" for i in range(calls)]
+    start = time.perf_counter()
+    for key in keys:
+        limiter.allow(key)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument(
+        "--baseline",
+        action="store_true",
+        help="also time the old exception-based dispatch",
+    )
+    args = parser.parse_args()
+
+    modes = [False, True] if args.baseline else [False]
+    columns = [
+        (name + (" old" if baseline else ""), make_storage, baseline)
+        for name, make_storage in STORAGES.items()
+        for baseline in modes
+    ]
+    print(f"{'limiter':>16} " + " ".join(f"{c[0] + ' us':>13}" for c in columns))
+    for name, make_limiter in LIMITERS.items():
+        cells = [run(make_limiter, s, args.calls, b) for _, s, b in columns]
+        print(f"{name:>16} " + " ".join(f"{c:>13.2f}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Memory, speed and accuracy of CountMinSketchLimiter vs. exact per-key state.
+
+    PYTHONPATH=. python benchmarks/bench_count_min_sketch.py --keys 1000000
+
+Sends one request each for --keys distinct keys plus a few heavy hitters
+through a sliding window counter on InMemoryStorage (exact, one entry per
+key) and through in-process sketches of several widths. Reports traced
+memory, decisions per second, and the share of light keys a sketch wrongly
+denies (their estimate has to exceed --limit for that).
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from gatekeeper import (
+    CountMinSketchLimiter,
+    InMemoryStorage,
+    SlidingWindowCounterLimiter,
+)
+
+
+def workload(keys: int, hot: int, hot_requests: int, seed: int):
+    rng = random.Random(seed)
+    light = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(keys)]
+    heavy = [f"192.0.2.{i}" for i in range(hot)]
+    requests = light + heavy * hot_requests
+    rng.shuffle(requests)
+    return requests, set(light)
+
+
+def run(limiter, requests, light):
+    tracemalloc.start()
+    start = time.perf_counter()
+    denied_light = 0
+    for key in requests:
+        if not limiter.allow(key) and key in light:
+            denied_light += 1
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory, len(requests) / elapsed, denied_light / len(light)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=200_000)
+    parser.add_argument("--hot", type=int, default=10)
+    parser.add_argument("--hot-requests", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--widths", type=int, nargs="+", default=[2**14, 2**16, 2**18])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    requests, light = workload(args.keys, args.hot, args.hot_requests, args.seed)
+    print(f"{len(requests):,} requests, {args.keys:,} distinct light keys")
+    print(f"{'limiter':>24} {'memory':>10} {'decisions/s':>12} {'light denied':>13}")
+
+    limiters = {
+        "exact (sliding counter)": lambda: SlidingWindowCounterLimiter(
+            args.limit, 3600, InMemoryStorage()
+        )
+    }
+    for width in args.widths:
+        limiters[f"sketch width 2^{width.bit_length() - 1}"] = lambda width=width: (
+            CountMinSketchLimiter(args.limit, 3600, width=width)
+        )
+
+    for name, factory in limiters.items():
+        memory, rate, denied = run(factory(), requests, light)
+        print(f"{name:>24} {memory / 2**20:>8.1f}MB {rate:>12,.0f} {denied:>12.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Cost of Metrics instrumentation per allow() call on InMemoryStorage.
+
+    PYTHONPATH=. python benchmarks/bench_instrumentation.py
+
+"off" is a limiter that was never instrumented (another one in the same
+process is, to show that instrumentation is per instance). "limiter" times
+decisions only; "limiter+storage" also times every storage operation.
+Limits are high enough that every call is allowed.
+"""
+
+import argparse
+import time
+
+from gatekeeper import (
+    FixedWindowLimiter,
+    InMemoryStorage,
+    LeakyBucketLimiter,
+    Metrics,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+LIMITERS = {
+    "fixed_window": lambda s: FixedWindowLimiter(10**9, 3600, storage=s),
+    "sliding_log": lambda s: SlidingWindowLogLimiter(10**9, 1, storage=s),
+    "sliding_counter": lambda s: SlidingWindowCounterLimiter(10**9, 3600, storage=s),
+    "token_bucket": lambda s: TokenBucketLimiter(10**9, 10**9, storage=s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(10**9, 10**9, storage=s),
+}
+
+MODES = ("off", "limiter", "limiter+storage")
+
+
+def run(make_limiter, mode: str, calls: int) -> float:
+    metrics = Metrics()
+    storage = InMemoryStorage()
+    if mode == "limiter+storage":
+        metrics.instrument(storage)
+    limiter = make_limiter(storage)
+    if mode == "off":
+        metrics.instrument(make_limiter(InMemoryStorage()))
+    else:
+        metrics.instrument(limiter)
+
+    keys = [f"user:{i % 100}" for i in range(calls)]
+    start = time.perf_counter()
+    for key in keys:
+        limiter.allow(key)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    print(f"{'limiter':>16} " + " ".join(f"{mode + ' us':>18}" for mode in MODES))
+    for name, make_limiter in LIMITERS.items():
+        cells = [
+            min(run(make_limiter, mode, args.calls) for _ in range(args.repeat))
+            for mode in MODES
+        ]
+        print(f"{name:>16} " + " ".join(f"{c:>18.2f}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
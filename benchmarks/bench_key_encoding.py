@@ -0,0 +1,117 @@
+"""
+Redis memory and request size with raw vs. hashed storage keys.
+
+    PYTHONPATH=. python benchmarks/bench_key_encoding.py --clients 50000
+
+Every limiter decides once for each of --clients long client identifiers
+(API-key-like strings of --key-length characters), first with the raw key
+layout and then with HashedKeyEncoder. Reports, per limiter, the bytes of
+key names stored in Redis, the key bytes sent per decision, and the Redis
+memory used (INFO used_memory, only with a spawned redis-server: fakeredis
+does not account memory like Redis does).
+
+Uses the same local Redis as bench_suite.py (a spawned redis-server, else
+fakeredis).
+"""
+
+import argparse
+import random
+import string
+
+from bench_suite import redis_client
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    HashedKeyEncoder,
+    LeakyBucketLimiter,
+    RedisStorage,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+LIMITERS = {
+    "fixed_window": lambda s: FixedWindowLimiter(100, 60, s),
+    "sliding_log": lambda s: SlidingWindowLogLimiter(100, 60, s),
+    "sliding_counter": lambda s: SlidingWindowCounterLimiter(100, 60, s),
+    "token_bucket": lambda s: TokenBucketLimiter(100, 1, s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(100, 1, s),
+    "bucketed_window": lambda s: BucketedSlidingWindowLimiter(100, 60, 10, s),
+    "gcra": lambda s: GCRALimiter(100, 60, storage=s),
+}
+
+
+def client_keys(count: int, length: int, seed: int):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits
+    prefix = "sk_live_"
+    return [
+        prefix + "".join(rng.choices(alphabet, k=max(1, length - len(prefix))))
+        for _ in range(count)
+    ]
+
+
+def measure(client, real_server: bool, factory, keys, encoder):
+    client.flushdb()
+    before = client.info("memory")["used_memory"] if real_server else 0
+
+    limiter = factory(RedisStorage(client, key_encoder=encoder))
+    sent = 0
+    for i in range(0, len(keys), 500):
+        batch = keys[i : i + 500]
+        sent += sum(
+            len(k.encode())
+            for key in batch
+            for k in limiter._script_call(key, 1, 1_000_000.0)[0]
+        )
+        limiter.allow_many(batch)
+
+    stored = sum(len(name) for name in client.scan_iter(count=1000))
+    used = client.info("memory")["used_memory"] - before if real_server else None
+    return stored, sent / len(keys), used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20_000)
+    parser.add_argument("--key-length", type=int, default=100)
+    parser.add_argument("--digest-size", type=int, default=8)
+    parser.add_argument(
+        "--limiters", nargs="+", choices=LIMITERS, default=list(LIMITERS)
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    keys = client_keys(args.clients, args.key_length, args.seed)
+    encoder = HashedKeyEncoder(digest_size=args.digest_size)
+
+    with redis_client() as client:
+        if client is None:
+            return
+        real_server = not type(client).__module__.startswith("fakeredis")
+        print(
+            f"{args.clients} clients, {args.key_length}-character keys, "
+            f"{args.digest_size}-byte digests"
+        )
+        print(
+            f"{'limiter':>16} {'key bytes raw':>14} {'hashed':>10} "
+            f"{'sent/decision':>14} {'hashed':>7} {'memory raw':>11} {'hashed':>11}"
+        )
+        for name in args.limiters:
+            factory = LIMITERS[name]
+            raw = measure(client, real_server, factory, keys, None)
+            hashed = measure(client, real_server, factory, keys, encoder)
+            memory = (
+                f"{raw[2] / 2**20:>9.1f}MB {hashed[2] / 2**20:>9.1f}MB"
+                if real_server
+                else f"{'n/a':>11} {'n/a':>11}"
+            )
+            print(
+                f"{name:>16} {raw[0]:>14,} {hashed[0]:>10,} "
+                f"{raw[1]:>13.0f}B {hashed[1]:>6.0f}B {memory}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Throughput of InMemoryStorage with one lock vs. lock striping, by thread count.
+
+    PYTHONPATH=. python benchmarks/bench_memory_stripes.py
+
+Striping only pays off when threads run in parallel, i.e. on a free-threaded
+(no-GIL) interpreter. With the GIL enabled both modes are expected to be
+roughly flat.
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from gatekeeper import InMemoryStorage, TokenBucketLimiter
+
+
+def run(stripes: int, threads: int, ops: int, keys: int) -> float:
+    limiter = TokenBucketLimiter(
+        capacity=1_000_000, refill_rate=1000, storage=InMemoryStorage(stripes=stripes)
+    )
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(offset: int):
+        names = [f"user:{(offset + i) % keys}" for i in range(ops)]
+        start_barrier.wait()
+        for name in names:
+            limiter.allow(name)
+
+    workers = [
+        threading.Thread(target=worker, args=(n * 7919,)) for n in range(threads)
+    ]
+    for w in workers:
+        w.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return threads * ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=50_000, help="ops per thread")
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--stripes", type=int, default=16)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    print(f"{'threads':>8} {'1 lock ops/s':>14} {f'{args.stripes} stripes ops/s':>18}")
+    for threads in args.threads:
+        single = run(1, threads, args.ops, args.keys)
+        striped = run(args.stripes, threads, args.ops, args.keys)
+        print(f"{threads:>8} {single:>14,.0f} {striped:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Per-call cost of SlidingWindowLogLimiter on InMemoryStorage by window size.
+
+    PYTHONPATH=. python benchmarks/bench_sliding_log.py
+
+Each run keeps the log full (max_requests entries inside the window) while
+timestamps keep sliding out of it, the steady state of a busy key.
+"""
+
+import argparse
+import time
+
+from gatekeeper import InMemoryStorage, SlidingWindowLogLimiter
+
+
+def run(max_requests: int, calls: int) -> float:
+    limiter = SlidingWindowLogLimiter(
+        max_requests=max_requests, window_seconds=3600, storage=InMemoryStorage()
+    )
+    # Drive a fake clock so the window stays exactly full: every call trims
+    # one expired entry, counts ~max_requests entries and appends one.
+    clock = [1_000_000.0]
+    real_time = time.time
+    time.time = lambda: clock[0]
+    try:
+        step = 3600 / max_requests
+        for _ in range(max_requests):
+            clock[0] += step
+            limiter.allow("key")
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            clock[0] += step
+            limiter.allow("key")
+        elapsed = time.perf_counter() - start
+    finally:
+        time.time = real_time
+    return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5_000)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1_000, 10_000, 100_000]
+    )
+    args = parser.parse_args()
+
+    print(f"{'max_requests':>12} {'us/allow':>10}")
+    for size in args.sizes:
+        print(f"{size:>12} {run(size, args.calls):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
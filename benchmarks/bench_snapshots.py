@@ -0,0 +1,90 @@
+"""
+InMemoryStorage snapshot size, save time and warm-restart load time.
+
+    PYTHONPATH=. python benchmarks/bench_snapshots.py --keys 1000000
+
+Fills a storage with --keys clients split over a fixed window, a token
+bucket and a sliding window log limiter, then saves a snapshot and loads it
+into a fresh storage. Also reports the longest time one stripe lock was
+held by the save, i.e. the worst pause a concurrent decision could see.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from gatekeeper import (
+    FixedWindowLimiter,
+    InMemoryStorage,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+
+def fill(storage: InMemoryStorage, keys: int):
+    limiters = [
+        FixedWindowLimiter(100, 3600, storage),
+        TokenBucketLimiter(100, 1, storage),
+        SlidingWindowLogLimiter(100, 3600, storage),
+    ]
+    for i in range(0, keys, 1000):
+        names = [f"client:{n}" for n in range(i, min(keys, i + 1000))]
+        for limiter in limiters:
+            limiter.allow_many(names)
+
+
+def longest_lock_hold(storage: InMemoryStorage, path: str) -> float:
+    """Save a snapshot while timing how long a probe waits for a lock."""
+    done = threading.Event()
+    waits = [0.0]
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            storage.get("probe")
+            waits[0] = max(waits[0], time.perf_counter() - start)
+            time.sleep(0.0005)
+
+    thread = threading.Thread(target=probe)
+    thread.start()
+    storage.save_snapshot(path)
+    done.set()
+    thread.join()
+    return waits[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=200_000)
+    parser.add_argument("--stripes", type=int, default=1)
+    args = parser.parse_args()
+
+    storage = InMemoryStorage(stripes=args.stripes)
+    start = time.perf_counter()
+    fill(storage, args.keys)
+    print(
+        f"{storage.stats()['keys']:,} storage keys for {args.keys:,} clients "
+        f"(filled in {time.perf_counter() - start:.1f}s, {args.stripes} stripe(s))"
+    )
+
+    path = os.path.join(tempfile.mkdtemp(), "limits.snapshot")
+    start = time.perf_counter()
+    saved = storage.save_snapshot(path)
+    save = time.perf_counter() - start
+    pause = longest_lock_hold(storage, path)
+
+    start = time.perf_counter()
+    loaded = InMemoryStorage(stripes=args.stripes).load_snapshot(path)
+    load = time.perf_counter() - start
+
+    size = os.path.getsize(path)
+    print(f"snapshot: {saved:,} entries, {size / 2**20:.1f} MB")
+    print(f"save: {save:.2f}s (longest lock wait seen: {pause * 1000:.0f} ms)")
+    print(f"load: {load:.2f}s for {loaded:,} entries")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Decisions per second of a file-backed SQLiteStorage in its durability modes.
+
+    PYTHONPATH=. python benchmarks/bench_sqlite_modes.py
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from gatekeeper import FixedWindowLimiter, SQLiteStorage
+
+MODES = {
+    "default (rollback journal, FULL)": {},
+    "wal (synchronous=NORMAL)": {"wal": True},
+    "wal + group commit 5ms": {"wal": True, "commit_interval": 0.005},
+}
+
+
+def run(options: dict, threads: int, ops: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "bench.db"), **options)
+        limiter = FixedWindowLimiter(10**9, 3600, storage=storage)
+
+        def worker(n: int):
+            for i in range(ops):
+                limiter.allow(f"user:{n}:{i % 100}")
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        storage.close()
+    return threads * ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2_000, help="ops per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    for name, options in MODES.items():
+        for threads in args.threads:
+            rate = run(options, threads, args.ops)
+            print(f"{name:<34} threads={threads:<3} {rate:>10,.0f} decisions/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Throughput and latency of every limiter on every storage, by thread count,
+key cardinality and key skew.
+
+    PYTHONPATH=. python benchmarks/bench_suite.py --output results.json
+    PYTHONPATH=. python benchmarks/bench_suite.py --compare results.json
+
+Storages: memory, shared-memory (a temporary mapped table), sqlite-memory
+(":memory:"), sqlite-file (a temporary database) and redis. Redis runs use a `redis-server` spawned on a free local
+port when one is on PATH, else an in-process fakeredis server (pip install
+"fakeredis[lua]"), else they are skipped. Fakeredis numbers show the
+client-side cost only and are not comparable with a real server.
+
+Each thread replays a pre-generated key sequence (seeded, so runs are
+reproducible) drawn uniformly or from a Zipf distribution over the key
+space. Every allow() call is timed to report p50/p99 latency.
+
+--output writes the results as JSON, together with the commit and interpreter
+they were measured on. --compare loads such a file, runs the same matrix and
+prints the throughput change per configuration.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    InMemoryStorage,
+    LeakyBucketLimiter,
+    RedisStorage,
+    SharedMemoryStorage,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    SQLiteStorage,
+    TokenBucketLimiter,
+)
+
+# Quotas sized so that hot keys are limited part of the time while most
+# requests on cold keys pass
+LIMITERS: Dict[str, Callable[[Any], Any]] = {
+    "fixed_window": lambda s: FixedWindowLimiter(100, 1, storage=s),
+    "sliding_log": lambda s: SlidingWindowLogLimiter(100, 1, storage=s),
+    "sliding_counter": lambda s: SlidingWindowCounterLimiter(100, 1, storage=s),
+    "token_bucket": lambda s: TokenBucketLimiter(100, 100, storage=s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(100, 100, storage=s),
+    "bucketed_window": lambda s: BucketedSlidingWindowLimiter(100, 1, storage=s),
+    "gcra": lambda s: GCRALimiter(100, 1, storage=s),
+}
+
+STORAGES = ("memory", "shared-memory", "sqlite-memory", "sqlite-file", "redis")
+
+# Fields identifying one configuration, used to match runs in --compare
+CONFIG_FIELDS = ("limiter", "storage", "threads", "keys", "skew")
+
+
+def key_sequence(rng: random.Random, keys: int, skew: str, s: float, n: int):
+    if skew == "uniform":
+        indices = [rng.randrange(keys) for _ in range(n)]
+    else:
+        weights = [1.0 / (rank + 1) ** s for rank in range(keys)]
+        cum_weights = list(itertools.accumulate(weights))
+        indices = rng.choices(range(keys), cum_weights=cum_weights, k=n)
+    return [f"user:{i}" for i in indices]
+
+
+def percentile(sorted_values: List[int], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run(limiter, threads: int, sequences: List[List[str]]) -> Dict[str, Any]:
+    start_barrier = threading.Barrier(threads + 1)
+    latencies: List[List[int]] = [[] for _ in range(threads)]
+    allowed = [0] * threads
+
+    def worker(n: int):
+        names = sequences[n]
+        timings = latencies[n]
+        clock = time.perf_counter_ns
+        passed = 0
+        start_barrier.wait()
+        for name in names:
+            t0 = clock()
+            ok = limiter.allow(name)
+            timings.append(clock() - t0)
+            passed += ok
+        allowed[n] = passed
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    merged = sorted(itertools.chain.from_iterable(latencies))
+    return {
+        "ops": len(merged),
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(len(merged) / elapsed, 1),
+        "p50_us": round(percentile(merged, 0.50) / 1000, 2),
+        "p99_us": round(percentile(merged, 0.99) / 1000, 2),
+        "allowed_ratio": round(sum(allowed) / len(merged), 4),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def redis_client(enabled: bool = True) -> Iterator[Optional[Any]]:
+    """A client for a local stand-in Redis, or None if none is available."""
+    if not enabled:
+        yield None
+        return
+
+    server = shutil.which("redis-server")
+    if server:
+        import redis
+
+        port = free_port()
+        proc = subprocess.Popen(
+            [server, "--port", str(port), "--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            client = redis.Redis(port=port)
+            for _ in range(100):
+                try:
+                    client.ping()
+                    break
+                except redis.ConnectionError:
+                    time.sleep(0.05)
+            print(f"redis: spawned {server} on port {port}")
+            yield client
+        finally:
+            proc.terminate()
+            proc.wait()
+        return
+
+    try:
+        import fakeredis
+    except ImportError:
+        print("redis: no redis-server or fakeredis available, skipping")
+        yield None
+        return
+    print("redis: using in-process fakeredis (client-side cost only)")
+    yield fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+
+@contextmanager
+def make_storage(name: str, redis_conn: Optional[Any]) -> Iterator[Any]:
+    if name == "memory":
+        yield InMemoryStorage()
+    elif name == "shared-memory":
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SharedMemoryStorage(os.path.join(tmp, "bench.limits"))
+            try:
+                yield storage
+            finally:
+                storage.close()
+    elif name == "sqlite-memory":
+        yield SQLiteStorage(":memory:")
+    elif name == "sqlite-file":
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SQLiteStorage(os.path.join(tmp, "bench.db"))
+            try:
+                yield storage
+            finally:
+                storage.close()
+    else:
+        redis_conn.flushdb()
+        yield RedisStorage(redis_conn)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]):
+    def index(doc):
+        return {tuple(r[f] for f in CONFIG_FIELDS): r for r in doc["results"]}
+
+    before = index(old)
+    print(f"\nvs {old.get('commit')} ({old.get('python')})")
+    print(
+        f"{'limiter':>16} {'storage':>13} {'thr':>3} {'keys':>6} {'skew':>7} "
+        f"{'old ops/s':>10} {'new ops/s':>10} {'change':>8}"
+    )
+    for config, row in index(new).items():
+        prev = before.get(config)
+        if prev is None:
+            continue
+        change = row["ops_per_sec"] / prev["ops_per_sec"] - 1
+        print(
+            f"{config[0]:>16} {config[1]:>13} {config[2]:>3} {config[3]:>6} "
+            f"{config[4]:>7} {prev['ops_per_sec']:>10,.0f} "
+            f"{row['ops_per_sec']:>10,.0f} {change:>+8.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000, help="ops per thread")
+    parser.add_argument(
+        "--limiters", nargs="+", choices=LIMITERS, default=list(LIMITERS)
+    )
+    parser.add_argument(
+        "--storages", nargs="+", choices=STORAGES, default=list(STORAGES)
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--keys", type=int, nargs="+", default=[100, 10_000])
+    parser.add_argument(
+        "--skew", nargs="+", choices=("uniform", "zipf"), default=["uniform", "zipf"]
+    )
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        # Same matrix and workload as the baseline run
+        params = baseline["params"]
+        for name in ("ops", "threads", "keys", "skew", "zipf_s", "seed"):
+            setattr(args, name, params[name])
+
+    results = []
+    print(
+        f"{'limiter':>16} {'storage':>13} {'thr':>3} {'keys':>6} {'skew':>7} "
+        f"{'ops/s':>10} {'p50 us':>8} {'p99 us':>8} {'allowed':>8}"
+    )
+    with redis_client("redis" in args.storages) as redis_conn:
+        for storage_name, limiter_name, threads, keys, skew in itertools.product(
+            args.storages, args.limiters, args.threads, args.keys, args.skew
+        ):
+            if storage_name == "redis" and redis_conn is None:
+                continue
+            rng = random.Random(f"{args.seed}:{threads}:{keys}:{skew}")
+            sequences = [
+                key_sequence(rng, keys, skew, args.zipf_s, args.ops)
+                for _ in range(threads)
+            ]
+            with make_storage(storage_name, redis_conn) as storage:
+                stats = run(LIMITERS[limiter_name](storage), threads, sequences)
+            row = {
+                "limiter": limiter_name,
+                "storage": storage_name,
+                "threads": threads,
+                "keys": keys,
+                "skew": skew,
+                **stats,
+            }
+            results.append(row)
+            print(
+                f"{limiter_name:>16} {storage_name:>13} {threads:>3} {keys:>6} "
+                f"{skew:>7} {stats['ops_per_sec']:>10,.0f} {stats['p50_us']:>8} "
+                f"{stats['p99_us']:>8} {stats['allowed_ratio']:>8.1%}"
+            )
+
+    document = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": {
+            "ops": args.ops,
+            "threads": args.threads,
+            "keys": args.keys,
+            "skew": args.skew,
+            "zipf_s": args.zipf_s,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"\nwrote {len(results)} results to {args.output}")
+    if baseline is not None:
+        compare(baseline, document)
+
+
+if __name__ == "__main__":
+    main()
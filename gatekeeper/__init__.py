@@ -1,21 +1,73 @@
-from .storage import InMemoryStorage, RedisStorage, SQLiteStorage
+from .storage import (
+    InMemoryStorage,
+    RedisStorage,
+    ShardedRedisStorage,
+    SharedMemoryStorage,
+    SQLiteStorage,
+    AsyncInMemoryStorage,
+    AsyncSharedMemoryStorage,
+    AsyncSQLiteStorage,
+    AsyncRedisStorage,
+)
 from .algorithms import (
+    Decision,
     FixedWindowLimiter,
     SlidingWindowLogLimiter,
     SlidingWindowCounterLimiter,
     TokenBucketLimiter,
     LeakyBucketLimiter,
+    BucketedSlidingWindowLimiter,
+    GCRALimiter,
+    CountMinSketchLimiter,
+    CompositeLimiter,
+    LeasedLimiter,
+    AsyncFixedWindowLimiter,
+    AsyncSlidingWindowLogLimiter,
+    AsyncSlidingWindowCounterLimiter,
+    AsyncTokenBucketLimiter,
+    AsyncLeakyBucketLimiter,
+    AsyncBucketedSlidingWindowLimiter,
+    AsyncGCRALimiter,
+    AsyncCountMinSketchLimiter,
+    AsyncCompositeLimiter,
 )
 
+from .keys import HashedKeyEncoder, KeyEncoder
+from .metrics import Metrics
+
 __version__ = "0.1.0"
 
 __all__ = [
     "InMemoryStorage",
     "RedisStorage",
+    "ShardedRedisStorage",
+    "SharedMemoryStorage",
     "SQLiteStorage",
+    "AsyncInMemoryStorage",
+    "AsyncSharedMemoryStorage",
+    "AsyncSQLiteStorage",
+    "AsyncRedisStorage",
+    "Decision",
     "FixedWindowLimiter",
     "SlidingWindowLogLimiter",
     "SlidingWindowCounterLimiter",
     "TokenBucketLimiter",
     "LeakyBucketLimiter",
+    "BucketedSlidingWindowLimiter",
+    "GCRALimiter",
+    "CountMinSketchLimiter",
+    "CompositeLimiter",
+    "LeasedLimiter",
+    "AsyncFixedWindowLimiter",
+    "AsyncSlidingWindowLogLimiter",
+    "AsyncSlidingWindowCounterLimiter",
+    "AsyncTokenBucketLimiter",
+    "AsyncLeakyBucketLimiter",
+    "AsyncBucketedSlidingWindowLimiter",
+    "AsyncGCRALimiter",
+    "AsyncCountMinSketchLimiter",
+    "AsyncCompositeLimiter",
+    "KeyEncoder",
+    "HashedKeyEncoder",
+    "Metrics",
 ]
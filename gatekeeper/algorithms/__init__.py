@@ -1,15 +1,43 @@
-from .base import RateLimiter
-from .fixed_window import FixedWindowLimiter
-from .sliding_window_log import SlidingWindowLogLimiter
-from .sliding_window_counter import SlidingWindowCounterLimiter
-from .token_bucket import TokenBucketLimiter
-from .leaky_bucket import LeakyBucketLimiter
+from .base import Decision, RateLimiter
+from .async_base import AsyncRateLimiter
+from .fixed_window import FixedWindowLimiter, AsyncFixedWindowLimiter
+from .sliding_window_log import SlidingWindowLogLimiter, AsyncSlidingWindowLogLimiter
+from .sliding_window_counter import (
+    SlidingWindowCounterLimiter,
+    AsyncSlidingWindowCounterLimiter,
+)
+from .token_bucket import TokenBucketLimiter, AsyncTokenBucketLimiter
+from .leaky_bucket import LeakyBucketLimiter, AsyncLeakyBucketLimiter
+from .bucketed_sliding_window import (
+    BucketedSlidingWindowLimiter,
+    AsyncBucketedSlidingWindowLimiter,
+)
+from .gcra import GCRALimiter, AsyncGCRALimiter
+from .count_min_sketch import CountMinSketchLimiter, AsyncCountMinSketchLimiter
+from .composite import CompositeLimiter, AsyncCompositeLimiter
+from .leased import LeasedLimiter
 
 __all__ = [
+    "Decision",
     "RateLimiter",
     "FixedWindowLimiter",
     "SlidingWindowLogLimiter",
     "SlidingWindowCounterLimiter",
     "TokenBucketLimiter",
     "LeakyBucketLimiter",
+    "BucketedSlidingWindowLimiter",
+    "GCRALimiter",
+    "CountMinSketchLimiter",
+    "CompositeLimiter",
+    "LeasedLimiter",
+    "AsyncRateLimiter",
+    "AsyncFixedWindowLimiter",
+    "AsyncSlidingWindowLogLimiter",
+    "AsyncSlidingWindowCounterLimiter",
+    "AsyncTokenBucketLimiter",
+    "AsyncLeakyBucketLimiter",
+    "AsyncBucketedSlidingWindowLimiter",
+    "AsyncGCRALimiter",
+    "AsyncCountMinSketchLimiter",
+    "AsyncCompositeLimiter",
 ]
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from abc import ABC
+from functools import cached_property
+from typing import Any, List, Optional, Sequence
+from .base import (
+    Decision,
+    RateLimiter,
+    _acquire_delay,
+    _parse_script_result,
+    _resolve_costs,
+)
+from ..storage import AsyncStorage, AsyncInMemoryStorage, Storage
+
+
+class AsyncRateLimiter(ABC):
+    """
+    asyncio counterpart of RateLimiter. The algorithm itself lives in the
+    wrapped synchronous limiter: its Lua script is awaited on Lua-capable
+    storages, otherwise its local path runs through the storage adapter.
+    """
+
+    # The synchronous limiter implementing the algorithm, set by subclasses
+    _limiter: RateLimiter
+
+    def __init__(self, storage: Optional[AsyncStorage] = None):
+        self.storage = storage or AsyncInMemoryStorage()
+        # Storage the subclass builds _limiter with: the wrapped synchronous
+        # storage, or a stand-in with the settings of a natively async one
+        self._sync_storage: Storage = self.storage.sync_storage or _ScriptStorage(
+            self.storage
+        )
+
+    @cached_property
+    def _use_lua(self) -> bool:
+        # Resolved on first use, once the subclass has set _limiter. Scripts
+        # run on this storage rather than on the wrapped limiter's.
+        return self._limiter.script is not None and self.storage.supports_lua
+
+    async def allow(self, key: str, cost: int = 1) -> bool:
+        """
+        Check if a request of `cost` units is allowed for the given key.
+        Returns True if allowed, False otherwise.
+        """
+        return (await self._evaluate([key], [cost]))[0].allowed
+
+    async def check(self, key: str, cost: int = 1) -> Decision:
+        """Async version of RateLimiter.check."""
+        return (await self._evaluate([key], [cost]))[0]
+
+    async def acquire(
+        self, key: str, cost: int = 1, timeout: Optional[float] = None
+    ) -> bool:
+        """Async version of RateLimiter.acquire; waits with asyncio.sleep."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            decision = await self.check(key, cost)
+            if decision.allowed:
+                return True
+            delay = _acquire_delay(decision, deadline)
+            if delay is None:
+                return False
+            await asyncio.sleep(delay)
+
+    async def allow_many(
+        self, keys: Sequence[str], costs: Optional[Sequence[int]] = None
+    ) -> List[bool]:
+        """Async version of RateLimiter.allow_many."""
+        return [d.allowed for d in await self.check_many(keys, costs)]
+
+    async def check_many(
+        self, keys: Sequence[str], costs: Optional[Sequence[int]] = None
+    ) -> List[Decision]:
+        """Async version of RateLimiter.check_many."""
+        return await self._evaluate(keys, _resolve_costs(keys, costs))
+
+    async def _evaluate(
+        self, keys: Sequence[str], costs: Sequence[int]
+    ) -> List[Decision]:
+        limiter = self._limiter
+        now = time.time()
+
+        # The deny cache lives on the wrapped limiter
+        results: List[Any] = [
+            limiter._cached_denial(k, c, now) for k, c in zip(keys, costs)
+        ]
+        todo = [i for i, r in enumerate(results) if r is None]
+        if not todo:
+            return results
+        keys = [keys[i] for i in todo]
+        costs = [costs[i] for i in todo]
+
+        if self._use_lua:
+            assert limiter.script is not None
+            calls = [limiter._script_call(k, c, now) for k, c in zip(keys, costs)]
+            if len(calls) == 1:
+                raw = [await self.storage.execute_lua(limiter.script, *calls[0])]
+            else:
+                raw = await self.storage.execute_lua_many(limiter.script, calls)
+            outcomes = [_parse_script_result(r) for r in raw]
+        else:
+
+            def decide() -> List[Decision]:
+                return [limiter._allow_local(k, c, now) for k, c in zip(keys, costs)]
+
+            outcomes = await self.storage.run_sync(decide)
+
+        for i, key, cost, outcome in zip(todo, keys, costs, outcomes):
+            results[i] = limiter._remember(key, cost, now, outcome)
+        return results
+
+
+def _unsupported() -> NotImplementedError:
+    return NotImplementedError(
+        "Operations run on the async storage, not on this stand-in"
+    )
+
+
+class _ScriptStorage(Storage):
+    """
+    Storage of the synchronous limiter wrapped around a natively async
+    storage (e.g. AsyncRedisStorage). Its scripts are awaited on the async
+    storage, so this only carries that storage's settings.
+    """
+
+    def __init__(self, storage: AsyncStorage):
+        self.cross_slot_scripts = storage.cross_slot_scripts
+        self.key_encoder = storage.key_encoder
+        self._supports_lua = storage.supports_lua
+
+    @property
+    def supports_lua(self) -> bool:
+        return self._supports_lua
+
+    def get(self, key: str) -> Optional[Any]:
+        raise _unsupported()
+
+    def set(self, key: str, value: Any, expiry: Optional[int] = None):
+        raise _unsupported()
+
+    def incr(self, key: str, amount: int = 1, expiry: Optional[int] = None) -> int:
+        raise _unsupported()
+
+    def add_timestamp(self, key: str, timestamp: float, expiry: Optional[int] = None):
+        raise _unsupported()
+
+    def count_timestamps(self, key: str, start: float, end: float) -> int:
+        raise _unsupported()
+
+    def remove_timestamps(self, key: str, max_timestamp: float):
+        raise _unsupported()
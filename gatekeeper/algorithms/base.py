@@ -1,16 +1,286 @@
+import math
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+from .deny_cache import DenyCache
+from ..keys import KeyEncoder
 from ..storage import Storage, InMemoryStorage
 
+# Wait used by acquire() when a limiter cannot tell when a denial ends
+UNKNOWN_RETRY_DELAY = 0.05
+
+
+class Decision(NamedTuple):
+    """Outcome of one rate limit check."""
+
+    allowed: bool
+    # Units that could still be taken right now (after this request if allowed)
+    remaining: int
+    # Seconds until the request could be allowed: 0.0 when allowed or not
+    # known, inf when it never can (cost above the limit)
+    retry_after: float
+
 
 class RateLimiter(ABC):
-    def __init__(self, storage: Optional[Storage] = None):
+    # Lua source used on storages that support execute_lua (e.g. Redis).
+    # Scripts return {allowed, remaining, retry_after} with retry_after as a
+    # string, since Redis truncates Lua numbers to integers.
+    script: Optional[str] = None
+    # Lua run with the keys and args of a denied `script` call to revert what
+    # the denial wrote; only needed by limiters that count denied requests
+    undo_script: Optional[str] = None
+    # Prepended to every storage key (CompositeLimiter gives each rule its own)
+    _namespace = ""
+
+    def __init__(
+        self,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
         self.storage = storage or InMemoryStorage()
+        # Layout of storage keys; the storage's encoder unless one is given
+        self.key_encoder: Optional[KeyEncoder] = (
+            key_encoder if key_encoder is not None else self.storage.key_encoder
+        )
+        # Decided once here so that allow() dispatches straight to one path
+        self._use_lua = self.script is not None and self.storage.supports_lua
+        # Optional negative cache answering repeat denials locally
+        self.deny_cache: Optional[DenyCache] = (
+            DenyCache(deny_cache_size) if deny_cache_size else None
+        )
+        # Whether scripts may also touch keys outside the client's hash slot
+        self._cross_slot = self.storage.cross_slot_scripts
 
     @abstractmethod
-    def allow(self, key: str) -> bool:
+    def allow(self, key: str, cost: int = 1) -> bool:
         """
-        Check if the request is allowed for the given key.
+        Check if a request of `cost` units is allowed for the given key.
         Returns True if allowed, False otherwise.
         """
         pass
+
+    def check(self, key: str, cost: int = 1) -> Decision:
+        """Like allow(), but also report the remaining quota and retry time."""
+        now = time.time()
+        cached = self._cached_denial(key, cost, now)
+        if cached is not None:
+            return cached
+        return self._remember(key, cost, now, self._decide(key, cost, now))
+
+    def acquire(self, key: str, cost: int = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Block until `cost` units are granted for `key`. Sleeps for the retry
+        time reported by each denial instead of polling. Returns False without
+        waiting further once the next retry would pass `timeout` seconds, or
+        if the request can never be allowed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            decision = self.check(key, cost)
+            if decision.allowed:
+                return True
+            delay = _acquire_delay(decision, deadline)
+            if delay is None:
+                return False
+            time.sleep(delay)
+
+    def allow_many(
+        self, keys: Sequence[str], costs: Optional[Sequence[int]] = None
+    ) -> List[bool]:
+        """
+        Check a batch of keys at once, consuming costs[i] units for keys[i]
+        (1 each by default). Returns one decision per key, in order.
+
+        Lua-capable storages run the whole batch in one round trip; other
+        storages take their lock or transaction once for the batch.
+        """
+        return [d.allowed for d in self.check_many(keys, costs)]
+
+    def check_many(
+        self, keys: Sequence[str], costs: Optional[Sequence[int]] = None
+    ) -> List[Decision]:
+        """Like allow_many(), returning a Decision per key."""
+        costs = _resolve_costs(keys, costs)
+        now = time.time()
+
+        results: List[Any] = [None] * len(keys)
+        todo = []
+        for i in range(len(keys)):
+            results[i] = self._cached_denial(keys[i], costs[i], now)
+            if results[i] is None:
+                todo.append(i)
+        if todo:
+            outcomes = self._decide_many(
+                [keys[i] for i in todo], [costs[i] for i in todo], now
+            )
+            for i, outcome in zip(todo, outcomes):
+                results[i] = self._remember(keys[i], costs[i], now, outcome)
+        return results
+
+    def _check(self, key: str, cost: int) -> bool:
+        """allow() fast path: one decision, from the deny cache when possible."""
+        now = time.time()
+        cache = self.deny_cache
+        if cache is not None and cache.denies(key, cost, now):
+            return False
+        return self._remember(key, cost, now, self._decide(key, cost, now)).allowed
+
+    def _key(self, prefix: str, key: str) -> str:
+        """
+        Storage key for `key`. The client key is wrapped in a hash tag, so
+        every key of one client maps to the same Redis Cluster slot (and the
+        same ShardedRedisStorage node) and multi-key scripts stay legal.
+        With a key encoder the encoder builds the key instead. Empty client
+        keys are rejected: Redis ignores an empty hash tag (`{}`), which
+        would scatter the keys of one client over several slots.
+        """
+        if not key:
+            raise ValueError("client keys must not be empty")
+        if self.key_encoder is not None:
+            return self._namespace + self.key_encoder.encode(prefix, key)
+        return f"{self._namespace}{prefix}:{{{key}}}"
+
+    def _cached_denial(self, key: str, cost: int, now: float) -> Optional[Decision]:
+        if self.deny_cache is None:
+            return None
+        until = self.deny_cache.denied_until(key, cost, now)
+        if until is None:
+            return None
+        return Decision(False, 0, until - now)
+
+    def _remember(self, key: str, cost: int, now: float, outcome: Decision) -> Decision:
+        if (
+            not outcome.allowed
+            and outcome.retry_after > 0
+            and self.deny_cache is not None
+        ):
+            self.deny_cache.add(key, cost, now + outcome.retry_after)
+        return outcome
+
+    def _decide(self, key: str, cost: int, now: float) -> Decision:
+        if self._use_lua:
+            assert self.script is not None
+            result = self.storage.execute_lua(
+                self.script, *self._script_call(key, cost, now)
+            )
+            return _parse_script_result(result)
+        return self._allow_local(key, cost, now)
+
+    def _decide_many(
+        self, keys: Sequence[str], costs: Sequence[int], now: float
+    ) -> List[Decision]:
+        if self._use_lua:
+            assert self.script is not None
+            results = self.storage.execute_lua_many(
+                self.script,
+                [self._script_call(k, c, now) for k, c in zip(keys, costs)],
+            )
+            return [_parse_script_result(r) for r in results]
+
+        with self.storage.batch():
+            return [self._allow_local(k, c, now) for k, c in zip(keys, costs)]
+
+    def _script_call(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        """Return the (keys, args) passed to `script` for one decision."""
+        return self._script_args(key, cost, now)
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        """
+        Build the (keys, args) of a script call, also taken by undo_script.
+        Only _script_call() is a decision (Metrics counts its calls).
+        """
+        raise NotImplementedError
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        """Decide using the storage primitives (no Lua)."""
+        if cost != 1:
+            raise NotImplementedError(
+                f"{type(self).__name__} does not support weighted costs"
+            )
+        return Decision(self.allow(key), 0, 0.0)
+
+    def _undo_denied(self, key: str, cost: int, now: float):
+        """Revert what a denied _allow_local() call wrote (see undo_script)."""
+        pass
+
+    def _decided_by_lease(self, allowed: int, denied: int):
+        """
+        Called by a LeasedLimiter wrapping this limiter with the decisions it
+        made without calling check() or check_many(): those served from
+        leased quota, and denied lease-sized requests (a hook for Metrics).
+        """
+        pass
+
+    def _undo_denied_many(self, keys: Sequence[str], costs: Sequence[int], now: float):
+        """Revert what denied _decide_many() decisions at `now` wrote."""
+        if not self._use_lua:
+            with self.storage.batch():
+                for key, cost in zip(keys, costs):
+                    self._undo_denied(key, cost, now)
+        elif self.undo_script is not None:
+            self.storage.execute_lua_many(
+                self.undo_script,
+                [self._script_args(k, c, now) for k, c in zip(keys, costs)],
+            )
+
+
+def _resolve_costs(
+    keys: Sequence[str], costs: Optional[Sequence[int]]
+) -> Sequence[int]:
+    if costs is None:
+        return [1] * len(keys)
+    if len(costs) != len(keys):
+        raise ValueError("costs must have the same length as keys")
+    return costs
+
+
+def _parse_script_result(result: Any) -> Decision:
+    allowed, remaining, retry_after = result
+    return Decision(bool(int(allowed)), int(remaining), float(retry_after))
+
+
+def _migrate_legacy_buckets(
+    limiter: RateLimiter, prefix: str, suffix: str, batch_size: int
+) -> int:
+    """
+    Run a zero-cost decision for every client that still has a legacy
+    `{prefix}{key}{suffix}` key, which makes the script convert its state.
+    """
+    scan_keys = getattr(limiter.storage, "scan_keys", None)
+    if (
+        not limiter._use_lua
+        or not limiter._cross_slot
+        or limiter.key_encoder is not None
+        or scan_keys is None
+    ):
+        return 0
+
+    migrated = 0
+    batch: List[str] = []
+    for name in scan_keys(f"{prefix}*{suffix}", type="string"):
+        batch.append(name[len(prefix) : -len(suffix)])
+        if len(batch) >= batch_size:
+            limiter._decide_many(batch, [0] * len(batch), time.time())
+            migrated += len(batch)
+            batch = []
+    if batch:
+        limiter._decide_many(batch, [0] * len(batch), time.time())
+        migrated += len(batch)
+    return migrated
+
+
+def _acquire_delay(decision: Decision, deadline: Optional[float]) -> Optional[float]:
+    """How long acquire() sleeps after a denial, or None to give up."""
+    delay = decision.retry_after
+    if delay == math.inf:
+        return None
+    if delay <= 0:
+        delay = UNKNOWN_RETRY_DELAY
+    if deadline is not None and time.monotonic() + delay > deadline:
+        return None
+    return delay
@@ -0,0 +1,147 @@
+import math
+from typing import Any, List, Optional, Sequence, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+from ..storage.redis_storage import BUCKET_RING_ADD
+
+# The storage step (see BUCKET_RING_ADD), then the decision
+BUCKETED_SLIDING_WINDOW_SCRIPT = (
+    BUCKET_RING_ADD
+    + """
+local buckets = tonumber(ARGV[1])
+local bucket = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local width = tonumber(ARGV[6])
+local now = tonumber(ARGV[7])
+
+local added, counts, total = bucket_ring_add(KEYS, ARGV)
+if added then
+    return {1, limit - total, '0'}
+end
+
+-- Denied until enough of the oldest buckets have left the window
+local remaining = math.max(0, limit - total)
+if cost > limit then
+    return {0, remaining, 'inf'}
+end
+local freed = 0
+for i = 1, buckets do
+    freed = freed + counts[i]
+    if total - freed + cost <= limit then
+        return {0, remaining, tostring((bucket + i) * width - now)}
+    end
+end
+return {0, remaining, '0'}
+"""
+)
+
+
+class BucketedSlidingWindowLimiter(RateLimiter):
+    """
+    Approximate sliding window log with O(buckets) memory and work per key.
+
+    The window is split into `buckets` sub-buckets of window_seconds/buckets
+    each, kept in a ring of counters (a Redis hash, a fixed array in memory,
+    one row in SQLite). A request is allowed if the counts of the current
+    bucket and the buckets before it, `buckets` in total, leave room for it.
+
+    Requests leave the count a whole bucket at a time, so the count covers
+    between window_seconds * (1 - 1/buckets) and window_seconds of history:
+    quota frees up at most window_seconds/buckets early. More buckets trade
+    memory for precision.
+    """
+
+    script = BUCKETED_SLIDING_WINDOW_SCRIPT
+
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        buckets: int = 10,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        if buckets < 1:
+            raise ValueError("buckets must be at least 1")
+        super().__init__(storage, deny_cache_size, key_encoder)
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_width = window_seconds / buckets
+
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.bucket_width)
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        return (
+            [self._key("bsw", key)],
+            [
+                self.buckets,
+                self._bucket(now),
+                self.max_requests,
+                cost,
+                math.ceil(self.window_seconds * 1000),
+                self.bucket_width,
+                now,
+            ],
+        )
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        bucket = self._bucket(now)
+        granted, window = self.storage.bucket_ring_add(
+            self._key("bsw", key),
+            self.buckets,
+            bucket,
+            self.max_requests,
+            cost,
+            self.window_seconds,
+        )
+        total = sum(window)
+        if granted:
+            return Decision(True, self.max_requests - total, 0.0)
+        remaining = max(0, self.max_requests - total)
+        return Decision(False, remaining, self._retry_after(window, bucket, cost, now))
+
+    def _retry_after(
+        self, window: Sequence[int], bucket: int, cost: int, now: float
+    ) -> float:
+        """Seconds until enough of the oldest buckets have left the window."""
+        if cost > self.max_requests:
+            return math.inf
+        total = sum(window)
+        freed = 0
+        for offset, count in enumerate(window):
+            freed += count
+            if total - freed + cost <= self.max_requests:
+                return (bucket + 1 + offset) * self.bucket_width - now
+        return 0.0
+
+
+class AsyncBucketedSlidingWindowLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        buckets: int = 10,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = BucketedSlidingWindowLimiter(
+            max_requests,
+            window_seconds,
+            buckets,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
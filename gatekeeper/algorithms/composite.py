@@ -0,0 +1,209 @@
+import copy
+import math
+from typing import Any, List, Optional, Sequence, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from .count_min_sketch import CountMinSketchLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+
+# Runs the scripts of every rule in one call. ARGV[1] is the request cost,
+# then for each rule: its key count, its arg count, its args for a zero-cost
+# probe and its args for the request. KEYS holds the keys of every rule.
+COMPOSITE_SCRIPT = """
+%s
+local rules = {%s}
+
+local cost = tonumber(ARGV[1])
+local calls = {}
+local k, a = 0, 1
+for i = 1, #rules do
+    local nkeys, nargs = tonumber(ARGV[a + 1]), tonumber(ARGV[a + 2])
+    local keys, probe, args = {}, {}, {}
+    for j = 1, nkeys do
+        keys[j] = KEYS[k + j]
+    end
+    for j = 1, nargs do
+        probe[j] = ARGV[a + 2 + j]
+        args[j] = ARGV[a + 2 + nargs + j]
+    end
+    calls[i] = {keys, probe, args}
+    k = k + nkeys
+    a = a + 2 + 2 * nargs
+end
+
+-- Zero-cost probes report what each rule has left without taking any
+local remaining = nil
+local short = {}
+for i = 1, #rules do
+    local left = tonumber(rules[i][1](calls[i][1], calls[i][2])[2])
+    if remaining == nil or left < remaining then
+        remaining = left
+    end
+    if left < cost then
+        table.insert(short, i)
+    end
+end
+
+if #short == 0 then
+    local allowed = 1
+    remaining = nil
+    for i = 1, #rules do
+        local result = rules[i][1](calls[i][1], calls[i][3])
+        allowed = math.min(allowed, result[1])
+        local left = tonumber(result[2])
+        if remaining == nil or left < remaining then
+            remaining = left
+        end
+    end
+    return {allowed, remaining, '0'}
+end
+
+-- Denied until the slowest short rule has room. Rules only consume when
+-- they allow, or undo what their denial wrote.
+local retry, retry_text = -1, '0'
+for _, i in ipairs(short) do
+    local result = rules[i][1](calls[i][1], calls[i][3])
+    if result[1] == 0 and rules[i][2] then
+        rules[i][2](calls[i][1], calls[i][3])
+    end
+    local wait = math.huge
+    if result[3] ~= 'inf' then
+        wait = tonumber(result[3])
+    end
+    if wait > retry then
+        retry, retry_text = wait, result[3]
+    end
+end
+return {0, math.max(0, remaining), retry_text}
+"""
+
+
+def _lua_function(name: str, source: str) -> str:
+    # KEYS and ARGV are parameters, so the body runs unchanged
+    return f"local function {name}(KEYS, ARGV)\n{source}\nend"
+
+
+def _composite_script(rules: Sequence[RateLimiter]) -> str:
+    functions = []
+    entries = []
+    for i, rule in enumerate(rules, 1):
+        assert rule.script is not None  # checked by CompositeLimiter
+        functions.append(_lua_function(f"rule_{i}", rule.script))
+        undo = "nil"
+        if rule.undo_script is not None:
+            functions.append(_lua_function(f"undo_{i}", rule.undo_script))
+            undo = f"undo_{i}"
+        entries.append(f"{{rule_{i}, {undo}}}")
+    return COMPOSITE_SCRIPT % ("\n".join(functions), ", ".join(entries))
+
+
+class CompositeLimiter(RateLimiter):
+    """
+    Several limits on the same key, e.g. 10/s, 500/min and 20k/day, decided
+    as one: a request is allowed only if every rule allows it, and then
+    consumes from all of them. A request denied by one rule is not counted
+    by the others.
+
+    Each decision is one atomic step on every backend: a single Lua script
+    on Redis (all rule keys share the client's hash tag, so it also runs on
+    Redis Cluster), one transaction on SQLite, one lock in memory. The rules
+    are first asked with a zero-cost probe how much they have left; only if
+    all of them have room is the request taken from each.
+
+    `rules` are limiters of the built-in algorithms, used for their
+    parameters only: their state lives in this limiter's storage, under keys
+    of their own (`rule0:tb:{key}`, ...), and their storage and deny cache
+    are not used. Keep the order of the rules to keep their state.
+
+    Allowed decisions report the smallest remaining quota of all rules;
+    denials report the longest retry time of the rules that lack room.
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[RateLimiter],
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        if not rules:
+            raise ValueError("at least one rule is required")
+        for rule in rules:
+            # Sketch counters are shared by all clients, not kept per key
+            if rule.script is None or isinstance(
+                rule, (CompositeLimiter, CountMinSketchLimiter)
+            ):
+                raise ValueError(
+                    f"{type(rule).__name__} cannot be used as a composite rule"
+                )
+        self.script = _composite_script(rules)
+        super().__init__(storage, deny_cache_size, key_encoder)
+        self.rules = list(rules)
+
+        self._rules: List[RateLimiter] = []
+        for i, rule in enumerate(rules):
+            bound = copy.copy(rule)
+            bound.storage = self.storage
+            bound.key_encoder = self.key_encoder
+            bound._namespace = f"rule{i}:"
+            # Rules never had state under the legacy key layouts
+            bound._cross_slot = False
+            self._rules.append(bound)
+
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        keys: List[str] = []
+        args: List[Any] = [cost]
+        for rule in self._rules:
+            rule_keys, probe = rule._script_args(key, 0, now)
+            _, rule_args = rule._script_args(key, cost, now)
+            keys += rule_keys
+            args += [len(rule_keys), len(probe), *probe, *rule_args]
+        return keys, args
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        with self.storage.batch():
+            probes = [rule._allow_local(key, 0, now) for rule in self._rules]
+            remaining = min(probe.remaining for probe in probes)
+            short = [
+                rule
+                for rule, probe in zip(self._rules, probes)
+                if probe.remaining < cost
+            ]
+            if not short:
+                decisions = [rule._allow_local(key, cost, now) for rule in self._rules]
+                return Decision(
+                    all(d.allowed for d in decisions),
+                    min(d.remaining for d in decisions),
+                    0.0,
+                )
+
+            retry = -math.inf
+            for rule in short:
+                decision = rule._allow_local(key, cost, now)
+                if not decision.allowed:
+                    rule._undo_denied(key, cost, now)
+                retry = max(retry, decision.retry_after)
+            return Decision(False, max(0, remaining), retry)
+
+
+class AsyncCompositeLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        rules: Sequence[RateLimiter],
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = CompositeLimiter(
+            rules,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
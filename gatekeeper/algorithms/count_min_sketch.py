@@ -0,0 +1,368 @@
+import hashlib
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+
+# Largest value of one sketch counter (u32, saturating)
+MAX_COUNT = 2**32 - 1
+
+# KEYS are the sketches of the sub-windows in the window, oldest first, then
+# the top-K sorted set. Each sketch is one string of u32 counters read and
+# incremented with BITFIELD; ARGV[8:] are the counter offsets of the key, one
+# per row. Unwritten counters read as 0, so new sub-windows need no reset.
+COUNT_MIN_SKETCH_SCRIPT = """
+local buckets = #KEYS - 1
+local limit, cost = tonumber(ARGV[1]), tonumber(ARGV[2])
+local ttl_ms, top_k = ARGV[3], tonumber(ARGV[4])
+local width, now = tonumber(ARGV[5]), tonumber(ARGV[6])
+local bucket = tonumber(ARGV[7])
+local member = ARGV[8]
+
+local get, incr = {}, {'OVERFLOW', 'SAT'}
+for i = 9, #ARGV do
+    table.insert(get, 'GET')
+    table.insert(get, 'u32')
+    table.insert(get, ARGV[i])
+    table.insert(incr, 'INCRBY')
+    table.insert(incr, 'u32')
+    table.insert(incr, ARGV[i])
+    table.insert(incr, cost)
+end
+local rows = #ARGV - 8
+
+-- counts[b][r]: counter of row r in sub-window b; sums[r]: row r's total
+local counts, sums = {}, {}
+for r = 1, rows do
+    sums[r] = 0
+end
+for b = 1, buckets do
+    counts[b] = redis.call('BITFIELD', KEYS[b], unpack(get))
+    for r = 1, rows do
+        sums[r] = sums[r] + counts[b][r]
+    end
+end
+local function estimate()
+    local low = sums[1]
+    for r = 2, rows do
+        low = math.min(low, sums[r])
+    end
+    return low
+end
+
+local function track(score)
+    if top_k > 0 and cost > 0 then
+        local top = KEYS[#KEYS]
+        redis.call('ZADD', top, score, member)
+        local extra = redis.call('ZCARD', top) - top_k
+        if extra > 0 then
+            redis.call('ZREMRANGEBYRANK', top, 0, extra - 1)
+        end
+        redis.call('PEXPIRE', top, ttl_ms)
+    end
+end
+
+local count = estimate()
+if count + cost <= limit then
+    if cost > 0 then
+        redis.call('BITFIELD', KEYS[buckets], unpack(incr))
+        redis.call('PEXPIRE', KEYS[buckets], ttl_ms)
+    end
+    track(count + cost)
+    return {1, limit - count - cost, '0'}
+end
+
+track(count)
+local remaining = math.max(0, limit - count)
+if cost > limit then
+    return {0, remaining, 'inf'}
+end
+-- Denied until enough of the oldest sub-windows have left the window
+for b = 1, buckets do
+    for r = 1, rows do
+        sums[r] = sums[r] - counts[b][r]
+    end
+    if estimate() + cost <= limit then
+        return {0, remaining, tostring((bucket + b) * width - now)}
+    end
+end
+return {0, remaining, '0'}
+"""
+
+HEAVY_HITTERS_SCRIPT = """
+return redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1, 'WITHSCORES')
+"""
+
+
+class CountMinSketchLimiter(RateLimiter):
+    """
+    Approximate sliding window limiter for huge key spaces (e.g. per-IP
+    limits at the edge), with memory fixed by its parameters instead of
+    growing with the number of distinct keys.
+
+    Requests are counted in a Count-Min Sketch per sub-window: `depth` rows
+    of `width` counters, where each key adds its cost to one counter per row
+    (picked by a hash of the key) and its count is read as the smallest of
+    its row totals. The window is split into `sub_windows` sketches kept in
+    a ring like BucketedSlidingWindowLimiter's buckets, so counts leave the
+    window one sub-window at a time: between window_seconds * (1 -
+    1/sub_windows) and window_seconds of history is counted.
+
+    Error bounds: counts are never underestimated, so no key gets more than
+    `max_requests` per window. Keys that share counters with others are
+    overestimated: with N units counted in the window over all keys, a
+    key's estimate exceeds its true count by more than e/width * N with
+    probability at most e^-depth. The defaults (width=2**16, depth=4) allow
+    an error of 4.1e-5 * N with probability 98%; widen the sketch until
+    e/width * N is small against max_requests to keep light keys from being
+    denied.
+
+    Memory is 4 * width * depth * sub_windows bytes (6 MiB by default):
+    arrays in this process with storages without Lua, whose primitives are
+    not used; on Redis, one string per sub-window (`cms:{name}:<index>`)
+    shared by every node using the same `name`, all in one hash slot.
+
+    With `top_k`, the `top_k` keys with the highest estimates, as of their
+    last request in the window, are tracked for heavy_hitters().
+    """
+
+    script = COUNT_MIN_SKETCH_SCRIPT
+
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        width: int = 2**16,
+        depth: int = 4,
+        sub_windows: int = 6,
+        top_k: int = 0,
+        name: str = "default",
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        if width < 1 or depth < 1:
+            raise ValueError("width and depth must be at least 1")
+        if sub_windows < 1:
+            raise ValueError("sub_windows must be at least 1")
+        if top_k < 0:
+            raise ValueError("top_k must not be negative")
+        super().__init__(storage, deny_cache_size, key_encoder)
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.width = width
+        self.depth = depth
+        self.sub_windows = sub_windows
+        self.top_k = top_k
+        self.name = name
+        self.bucket_width = window_seconds / sub_windows
+
+        # Local sketches, allocated on first use: ring slot -> counters
+        self._sketches: List[Optional[array]] = [None] * sub_windows
+        self._slot_buckets = [-1] * sub_windows
+        self._latest = -1
+        # Tracked keys -> (estimate, sub-window of their last request)
+        self._top: Dict[str, Tuple[int, int]] = {}
+        # Lower bound of the tracked estimates, to turn most keys away early
+        self._top_floor = 0
+        self._top_bucket = -1
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def heavy_hitters(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        The tracked keys with the highest estimated counts, highest first,
+        as (key, estimate) pairs; empty unless `top_k` is set.
+        """
+        n = self.top_k if n is None else min(n, self.top_k)
+        if n <= 0:
+            return []
+        if self._use_lua:
+            return _parse_heavy_hitters(
+                self.storage.execute_lua(*self._heavy_hitters_call(n))
+            )
+        with self._lock:
+            oldest = max(self._bucket(time.time()), self._latest) - self.sub_windows + 1
+            top = [(k, score) for k, (score, b) in self._top.items() if b >= oldest]
+        top.sort(key=lambda item: -item[1])
+        return top[:n]
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.bucket_width)
+
+    def _offsets(self, key: str) -> List[int]:
+        """Counter index of `key` in each row (double hashing of one digest)."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def _sketch_key(self, suffix: Any) -> str:
+        return f"{self._key('cms', self.name)}:{suffix}"
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        bucket = self._bucket(now)
+        keys = [
+            self._sketch_key(b)
+            for b in range(bucket - self.sub_windows + 1, bucket + 1)
+        ]
+        keys.append(self._sketch_key("top"))
+        return keys, [
+            self.max_requests,
+            cost,
+            math.ceil(self.window_seconds * 1000),
+            self.top_k,
+            self.bucket_width,
+            now,
+            bucket,
+            key if self.top_k else "",
+            *[f"#{offset}" for offset in self._offsets(key)],
+        ]
+
+    def _heavy_hitters_call(self, n: int) -> Tuple[str, List[str], List[Any]]:
+        return HEAVY_HITTERS_SCRIPT, [self._sketch_key("top")], [n]
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        offsets = self._offsets(key)
+        limit = self.max_requests
+        with self._lock:
+            # Never step back to an older ring position than another thread
+            bucket = max(self._bucket(now), self._latest)
+            self._latest = bucket
+
+            # counts[b][r]: row r's counter in the b-th sub-window, oldest first
+            counts = []
+            for b in range(bucket - self.sub_windows + 1, bucket + 1):
+                slot = b % self.sub_windows
+                sketch = self._sketches[slot]
+                if sketch is None or self._slot_buckets[slot] != b:
+                    counts.append([0] * self.depth)
+                else:
+                    counts.append([sketch[o] for o in offsets])
+            count = min(map(sum, zip(*counts)))
+
+            if count + cost <= limit:
+                if cost > 0:
+                    sketch = self._current_sketch(bucket)
+                    for o in offsets:
+                        sketch[o] = min(sketch[o] + cost, MAX_COUNT)
+                    self._track(key, count + cost, bucket)
+                return Decision(True, limit - count - cost, 0.0)
+
+            if cost > 0:
+                self._track(key, count, bucket)
+        remaining = max(0, limit - count)
+        if cost > limit:
+            return Decision(False, remaining, math.inf)
+        return Decision(False, remaining, self._retry_after(counts, bucket, cost, now))
+
+    def _current_sketch(self, bucket: int) -> array:
+        """The sketch of `bucket`, recycling the ring slot it replaces."""
+        slot = bucket % self.sub_windows
+        sketch = self._sketches[slot]
+        if sketch is None or self._slot_buckets[slot] != bucket:
+            sketch = array("I", bytes(4 * self.width * self.depth))
+            self._sketches[slot] = sketch
+            self._slot_buckets[slot] = bucket
+        return sketch
+
+    def _track(self, key: str, score: int, bucket: int):
+        """Keep `key` among the top_k highest estimates (lock held)."""
+        top = self.top_k
+        if not top:
+            return
+        tracked = self._top
+        if bucket != self._top_bucket:
+            # Drop keys whose last request has left the window, as the set
+            # expires on Redis
+            oldest = bucket - self.sub_windows + 1
+            for stale in [k for k, (_, b) in tracked.items() if b < oldest]:
+                del tracked[stale]
+            self._top_bucket = bucket
+            self._top_floor = 0
+        if key in tracked or len(tracked) < top:
+            # A tracked key's estimate falls as the window slides
+            tracked[key] = (score, bucket)
+            self._top_floor = min(self._top_floor, score)
+        elif score > self._top_floor:
+            victim = min(tracked, key=lambda k: tracked[k][0])
+            low = tracked[victim][0]
+            if score <= low:
+                self._top_floor = low
+                return
+            del tracked[victim]
+            tracked[key] = (score, bucket)
+            self._top_floor = min(s for s, _ in tracked.values())
+
+    def _retry_after(
+        self, counts: Sequence[Sequence[int]], bucket: int, cost: int, now: float
+    ) -> float:
+        """Seconds until enough of the oldest sub-windows have left the window."""
+        sums = [sum(row) for row in zip(*counts)]
+        for b, window in enumerate(counts, 1):
+            sums = [total - c for total, c in zip(sums, window)]
+            if min(sums) + cost <= self.max_requests:
+                return (bucket + b) * self.bucket_width - now
+        return 0.0
+
+
+def _parse_heavy_hitters(raw: Sequence[Any]) -> List[Tuple[str, int]]:
+    top = []
+    for member, score in zip(raw[::2], raw[1::2]):
+        if isinstance(member, bytes):
+            member = member.decode("utf-8")
+        top.append((member, int(float(score))))
+    return top
+
+
+class AsyncCountMinSketchLimiter(AsyncRateLimiter):
+    _limiter: CountMinSketchLimiter
+
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        width: int = 2**16,
+        depth: int = 4,
+        sub_windows: int = 6,
+        top_k: int = 0,
+        name: str = "default",
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = CountMinSketchLimiter(
+            max_requests,
+            window_seconds,
+            width,
+            depth,
+            sub_windows,
+            top_k,
+            name,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
+
+    async def heavy_hitters(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Async version of CountMinSketchLimiter.heavy_hitters."""
+        limiter = self._limiter
+        n = limiter.top_k if n is None else min(n, limiter.top_k)
+        if n <= 0:
+            return []
+        if self._use_lua:
+            return _parse_heavy_hitters(
+                await self.storage.execute_lua(*limiter._heavy_hitters_call(n))
+            )
+        return limiter.heavy_hitters(n)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class DenyCache:
+    """
+    Bounded in-process cache of recent denials.
+
+    After a denial the limiter knows the earliest time the key could pass
+    again (window end, refill or leak time). Until then, requests for that
+    key with at least the denied cost are answered locally without touching
+    the storage backend. Entries are only ever conservative: other clients
+    can consume more quota, never give it back, so a cached denial cannot
+    turn out wrong.
+
+    When full, the oldest entry is dropped. Each limiter owns its cache,
+    since entries are keyed by the limiter's own client keys.
+    """
+
+    def __init__(self, max_keys: int = 10_000):
+        if max_keys < 1:
+            raise ValueError("max_keys must be at least 1")
+        self.max_keys = max_keys
+        # key -> (denied until, smallest cost known to be denied)
+        self._entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def denies(self, key: str, cost: int, now: float) -> bool:
+        """True if a request of `cost` for `key` is known to be denied at `now`."""
+        return self.denied_until(key, cost, now) is not None
+
+    def denied_until(self, key: str, cost: int, now: float) -> Optional[float]:
+        """When a cached denial of `cost` for `key` ends, or None if not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                until, denied_cost = entry
+                if now >= until:
+                    del self._entries[key]
+                elif cost >= denied_cost:
+                    self.hits += 1
+                    return until
+            self.misses += 1
+            return None
+
+    def add(self, key: str, cost: int, until: float):
+        """Record that requests of at least `cost` are denied until `until`."""
+        with self._lock:
+            self._entries[key] = (until, cost)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counts and the current number of cached denials."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
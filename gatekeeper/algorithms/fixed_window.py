@@ -1,22 +1,104 @@
-import time
-from typing import Optional
-from .base import RateLimiter
-from ..storage import Storage
+import math
+from typing import Any, List, Optional, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+
+FIXED_WINDOW_SCRIPT = """
+local count = redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+local remaining = math.max(0, tonumber(ARGV[3]) - count)
+if count <= tonumber(ARGV[3]) then
+    return {1, remaining, '0'}
+end
+-- Denied until the window ends, or for good if cost is above the limit
+if tonumber(ARGV[1]) > tonumber(ARGV[3]) then
+    return {0, remaining, 'inf'}
+end
+return {0, remaining, ARGV[4]}
+"""
+
+# Denied requests are counted too; this takes one back out
+FIXED_WINDOW_UNDO_SCRIPT = """
+redis.call('INCRBY', KEYS[1], -tonumber(ARGV[1]))
+"""
 
 
 class FixedWindowLimiter(RateLimiter):
+    script = FIXED_WINDOW_SCRIPT
+    undo_script = FIXED_WINDOW_UNDO_SCRIPT
+
     def __init__(
-        self, max_requests: int, window_seconds: int, storage: Optional[Storage] = None
+        self,
+        max_requests: int,
+        window_seconds: int,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
     ):
-        super().__init__(storage)
+        super().__init__(storage, deny_cache_size, key_encoder)
         self.max_requests = max_requests
         self.window_seconds = window_seconds
 
-    def allow(self, key: str) -> bool:
-        now = int(time.time())
-        window_start = now // self.window_seconds
-        storage_key = f"fixed:{key}:{window_start}"
+    def _storage_key(self, key: str, now: float) -> str:
+        window_start = int(now) // self.window_seconds
+        return f"{self._key('fixed', key)}:{window_start}"
+
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def _retry_after(self, now: float) -> float:
+        window = self.window_seconds
+        return (int(now) // window + 1) * window - now
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        return (
+            [self._storage_key(key, now)],
+            [
+                cost,
+                self.window_seconds,
+                self.max_requests,
+                repr(self._retry_after(now)),
+            ],
+        )
+
+    def _decide(self, key: str, cost: int, now: float) -> Decision:
+        # A single INCR is already atomic, so only batches use the script
+        return self._allow_local(key, cost, now)
 
-        current_count = self.storage.incr(storage_key, 1, self.window_seconds)
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        storage_key = self._storage_key(key, now)
 
-        return current_count <= self.max_requests
+        current_count = self.storage.incr(storage_key, cost, self.window_seconds)
+
+        remaining = max(0, self.max_requests - current_count)
+        if current_count <= self.max_requests:
+            return Decision(True, remaining, 0.0)
+        if cost > self.max_requests:
+            return Decision(False, remaining, math.inf)
+        return Decision(False, remaining, self._retry_after(now))
+
+    def _undo_denied(self, key: str, cost: int, now: float):
+        self.storage.incr(self._storage_key(key, now), -cost, self.window_seconds)
+
+
+class AsyncFixedWindowLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = FixedWindowLimiter(
+            max_requests,
+            window_seconds,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
@@ -0,0 +1,119 @@
+import math
+from typing import Any, List, Optional, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+from ..storage.redis_storage import GCRA_CONSUME
+
+# Slack for float noise when turning a time span into whole requests
+_EPSILON = 1e-9
+
+# The storage step (see GCRA_CONSUME), then the decision
+GCRA_SCRIPT = (
+    GCRA_CONSUME
+    + """
+local interval = tonumber(ARGV[1])
+local burst_offset = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+
+local consumed, tat = gcra_consume(KEYS, ARGV)
+local remaining = math.max(0, math.floor((burst_offset - (tat - now)) / interval + 1e-9))
+if consumed then
+    return {1, remaining, '0'}
+end
+
+-- Denied until the TAT has moved close enough to the clock
+if interval * cost > burst_offset then
+    return {0, remaining, 'inf'}
+end
+return {0, remaining, tostring(tat + interval * cost - burst_offset - now)}
+"""
+)
+
+
+class GCRALimiter(RateLimiter):
+    """
+    Generic Cell Rate Algorithm: a token bucket expressed as a single
+    timestamp per key.
+
+    Requests are spaced by emission_interval = window_seconds / max_requests
+    on average, and up to `burst` requests (max_requests by default) may
+    arrive back to back. The only state is the theoretical arrival time
+    (TAT) of the next request; a request is allowed if it would not push the
+    TAT more than burst * emission_interval ahead of the clock.
+
+    Each decision is one atomic step on every backend (a Lua script on
+    Redis, one UPSERT on SQLite, one update under the lock in memory), and
+    remaining quota and retry time follow from the TAT without extra reads.
+    """
+
+    script = GCRA_SCRIPT
+
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: float,
+        burst: Optional[int] = None,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        if max_requests < 1:
+            raise ValueError("max_requests must be at least 1")
+        if burst is not None and burst < 1:
+            raise ValueError("burst must be at least 1")
+        super().__init__(storage, deny_cache_size, key_encoder)
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.burst = max_requests if burst is None else burst
+        self.emission_interval = window_seconds / max_requests
+        self.burst_offset = self.emission_interval * self.burst
+
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        return (
+            [self._key("gcra", key)],
+            [self.emission_interval, self.burst_offset, cost, now],
+        )
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        increment = self.emission_interval * cost
+        granted, tat = self.storage.gcra_consume(
+            self._key("gcra", key), increment, self.burst_offset, now
+        )
+        remaining = max(0, self._requests_within(self.burst_offset - (tat - now)))
+        if granted:
+            return Decision(True, remaining, 0.0)
+        if increment > self.burst_offset:
+            return Decision(False, remaining, math.inf)
+        return Decision(False, remaining, tat + increment - self.burst_offset - now)
+
+    def _requests_within(self, span: float) -> int:
+        return math.floor(span / self.emission_interval + _EPSILON)
+
+
+class AsyncGCRALimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: float,
+        burst: Optional[int] = None,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = GCRALimiter(
+            max_requests,
+            window_seconds,
+            burst,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
@@ -1,76 +1,105 @@
-import time
-from typing import Optional
-from .base import RateLimiter
-from ..storage import Storage
+import math
+from typing import Any, List, Optional, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter, _migrate_legacy_buckets
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+from ..storage.redis_storage import LEAKY_BUCKET_ADD
+
+# The storage step (see LEAKY_BUCKET_ADD), then the decision. KEYS[2] and
+# KEYS[3], when given, are the two plain keys used by earlier versions;
+# state found there is moved into the hash on first use.
+LEAKY_BUCKET_SCRIPT = (
+    LEAKY_BUCKET_ADD
+    + """
+local capacity = tonumber(ARGV[1])
+local leak_rate = tonumber(ARGV[2])
+local amount = tonumber(ARGV[4])
+
+local added, level = leaky_bucket_add(KEYS, ARGV)
+local remaining = math.floor(capacity - level)
+if added then
+    return {1, remaining, '0'}
+end
+
+-- Denied until enough has leaked out
+if amount > capacity or leak_rate <= 0 then
+    return {0, remaining, 'inf'}
+end
+return {0, remaining, tostring((level + amount - capacity) / leak_rate)}
+"""
+)
 
 
 class LeakyBucketLimiter(RateLimiter):
+    script = LEAKY_BUCKET_SCRIPT
+
     def __init__(
-        self, capacity: int, leak_rate: float, storage: Optional[Storage] = None
+        self,
+        capacity: int,
+        leak_rate: float,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
     ):
-        super().__init__(storage)
+        super().__init__(storage, deny_cache_size, key_encoder)
         self.capacity = capacity
         self.leak_rate = leak_rate  # requests per second
 
-    def allow(self, key: str) -> bool:
-        level_key = f"lb:{key}:level"
-        ts_key = f"lb:{key}:ts"
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
 
-        now = time.time()
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        keys = [self._key("lb", key)]
+        if self._cross_slot and self.key_encoder is None:
+            # Where earlier versions kept the state (see migrate_legacy_keys)
+            keys += [f"lb:{key}:level", f"lb:{key}:ts"]
+        return (
+            keys,
+            [self.capacity, self.leak_rate, now, cost],
+        )
 
-        try:
-            script = """
-            local level_key = KEYS[1]
-            local ts_key = KEYS[2]
-            local capacity = tonumber(ARGV[1])
-            local leak_rate = tonumber(ARGV[2])
-            local now = tonumber(ARGV[3])
-            
-            local last_level = tonumber(redis.call('GET', level_key) or "0")
-            local last_ts = tonumber(redis.call('GET', ts_key) or now)
-            
-            local delta = math.max(0, now - last_ts)
-            local leaked = delta * leak_rate
-            
-            local current_level = math.max(0, last_level - leaked)
-            
-            if current_level + 1 <= capacity then
-                redis.call('SET', level_key, current_level + 1)
-                redis.call('SET', ts_key, now)
-                return 1
-            end
-            
-            -- We can optionally update ts for leak calculation even on reject?
-            -- Usually "GCRA" does update state to punish arrival rate? 
-            -- Simple Leaky Bucket just drops. Keeping state as is (besides leak calc) is fine.
-            
-            return 0
-            """
-            result = self.storage.execute_lua(
-                script, [level_key, ts_key], [self.capacity, self.leak_rate, now]
-            )
-            return bool(result)
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        granted, level = self.storage.leaky_bucket_add(
+            self._key("lb", key), self.capacity, self.leak_rate, cost, now
+        )
+        remaining = math.floor(self.capacity - level)
+        if granted:
+            return Decision(True, remaining, 0.0)
+        if cost > self.capacity or self.leak_rate <= 0:
+            return Decision(False, remaining, math.inf)
+        return Decision(
+            False, remaining, (level + cost - self.capacity) / self.leak_rate
+        )
 
-        except NotImplementedError:
-            last_level = self.storage.get(level_key)
-            if last_level is None:
-                last_level = 0
-            else:
-                last_level = float(last_level)
+    def migrate_legacy_keys(self, batch_size: int = 500) -> int:
+        """
+        Move bucket state written to Redis by earlier versions (two plain
+        keys per client, without expiry) into the expiring hash layout.
+        Returns the number of buckets converted.
 
-            last_ts = self.storage.get(ts_key)
-            if last_ts is None:
-                last_ts = now
-            else:
-                last_ts = float(last_ts)
+        Buckets are also converted on their next decision, so this is only
+        needed to reclaim the keys of clients that do not come back.
+        """
+        return _migrate_legacy_buckets(self, "lb:", ":ts", batch_size)
 
-            delta = max(0, now - last_ts)
-            leaked = delta * self.leak_rate
 
-            current_level = max(0, last_level - leaked)
-
-            if current_level + 1 <= self.capacity:
-                self.storage.set(level_key, current_level + 1)
-                self.storage.set(ts_key, now)
-                return True
-            return False
+class AsyncLeakyBucketLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        capacity: int,
+        leak_rate: float,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = LeakyBucketLimiter(
+            capacity,
+            leak_rate,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
@@ -0,0 +1,174 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from .base import Decision, RateLimiter, _resolve_costs
+from .fixed_window import FixedWindowLimiter
+
+
+class _Lease:
+    __slots__ = ("remaining", "expires_at")
+
+    def __init__(self, remaining: int, expires_at: float):
+        self.remaining = remaining
+        self.expires_at = expires_at
+
+
+class LeasedLimiter(RateLimiter):
+    """
+    Two-tier limiter: leases quota from a shared limiter in blocks and serves
+    decisions from local memory until the lease is used up or expires.
+
+    Intended for hot keys on a remote backend, e.g. a TokenBucketLimiter or
+    FixedWindowLimiter on RedisStorage shared by many processes. With a lease
+    of N units, a key needs one backend round trip per N local decisions
+    instead of one per decision.
+
+    Each lease is taken from the shared limiter as one weighted decision of
+    lease_size units. When the shared limiter cannot grant a whole lease, the
+    request itself is forwarded (cost units), so the tail of the quota stays
+    usable.
+
+    Accuracy bounds, with P processes sharing a key:
+        Overshoot: leased units are already counted by the shared limiter, so
+            totals never exceed it; but units leased at time t may be spent
+            until t + lease_ttl. Over any interval, at most P * lease_size
+            units more than the shared limiter would have allowed in that
+            interval are admitted. For FixedWindowLimiter leases end at the
+            window boundary, so windows are never exceeded.
+        Undershoot: units still leased when a lease expires are lost, at most
+            P * lease_size per lease_ttl. Limiters that count denied requests
+            (FixedWindowLimiter) get a denied lease request refunded, so the
+            tail of a window is not lost to it.
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        lease_size: int,
+        lease_ttl: float = 1.0,
+        max_leases: int = 10_000,
+    ):
+        if lease_size < 1:
+            raise ValueError("lease_size must be at least 1")
+        if lease_ttl <= 0:
+            raise ValueError("lease_ttl must be positive")
+        super().__init__(limiter.storage)
+        self.limiter = limiter
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.max_leases = max_leases
+        self._leases: Dict[str, _Lease] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._leased([key], [cost])[0].allowed
+
+    def check(self, key: str, cost: int = 1) -> Decision:
+        return self._leased([key], [cost])[0]
+
+    def check_many(
+        self, keys: Sequence[str], costs: Optional[Sequence[int]] = None
+    ) -> List[Decision]:
+        return self._leased(keys, _resolve_costs(keys, costs))
+
+    def _leased(self, keys: Sequence[str], costs: Sequence[int]) -> List[Decision]:
+        now = time.time()
+        results: List[Any] = [None] * len(keys)
+        pending = []
+
+        with self._lock:
+            for i, (key, cost) in enumerate(zip(keys, costs)):
+                left = self._take(key, cost, now)
+                if left is not None:
+                    results[i] = Decision(True, left, 0.0)
+                else:
+                    pending.append(i)
+
+        if not pending:
+            self._decided_by_lease(len(keys), 0)
+            return results
+
+        # Lease for every key that ran dry, in one call to the shared limiter.
+        # Lease requests skip its deny cache, which holds request denials.
+        amounts = [max(self.lease_size, costs[i]) for i in pending]
+        granted = self.limiter._decide_many([keys[i] for i in pending], amounts, now)
+
+        refused = [
+            j
+            for j, i in enumerate(pending)
+            if not granted[j].allowed and amounts[j] > costs[i]
+        ]
+        if refused:
+            # Give back what the denied lease requests were counted for
+            self.limiter._undo_denied_many(
+                [keys[pending[j]] for j in refused], [amounts[j] for j in refused], now
+            )
+
+        retry = []
+        with self._lock:
+            expires_at = self._lease_expiry(now)
+            for i, amount, decision in zip(pending, amounts, granted):
+                if decision.allowed:
+                    left = self._add_lease(keys[i], amount - costs[i], expires_at, now)
+                    results[i] = Decision(True, left, 0.0)
+                elif amount > costs[i]:
+                    retry.append(i)
+                else:
+                    results[i] = self.limiter._remember(
+                        keys[i], costs[i], now, decision
+                    )
+
+        denied = len(pending) - len(retry) - sum(d.allowed for d in granted)
+        self._decided_by_lease(len(keys) - len(retry) - denied, denied)
+        if retry:
+            # Not enough quota left for a whole lease: ask for the request only
+            direct = self.limiter.check_many(
+                [keys[i] for i in retry], [costs[i] for i in retry]
+            )
+            for i, decision in zip(retry, direct):
+                results[i] = decision
+
+        return results
+
+    def _decided_by_lease(self, allowed: int, denied: int):
+        self.limiter._decided_by_lease(allowed, denied)
+
+    def _take(self, key: str, cost: int, now: float) -> Optional[int]:
+        """Spend `cost` leased units; returns the units left, None if short."""
+        lease = self._leases.get(key)
+        if lease is None:
+            return None
+        if lease.expires_at <= now:
+            del self._leases[key]
+            return None
+        if lease.remaining < cost:
+            return None
+        lease.remaining -= cost
+        return lease.remaining
+
+    def _add_lease(self, key: str, units: int, expires_at: float, now: float) -> int:
+        lease = self._leases.get(key)
+        if lease is not None and lease.expires_at > now:
+            # Another thread leased concurrently; keep both blocks
+            lease.remaining += units
+            lease.expires_at = max(lease.expires_at, expires_at)
+            return lease.remaining
+
+        if len(self._leases) >= self.max_leases:
+            self._prune(now)
+        self._leases[key] = _Lease(units, expires_at)
+        return units
+
+    def _prune(self, now: float):
+        for key in [k for k, lease in self._leases.items() if lease.expires_at <= now]:
+            del self._leases[key]
+        # Still full: drop the oldest leases (their units are forfeited)
+        while len(self._leases) >= self.max_leases:
+            del self._leases[next(iter(self._leases))]
+
+    def _lease_expiry(self, now: float) -> float:
+        expires_at = now + self.lease_ttl
+        if isinstance(self.limiter, FixedWindowLimiter):
+            window = self.limiter.window_seconds
+            expires_at = min(expires_at, (int(now) // window + 1) * window)
+        return expires_at
@@ -1,26 +1,77 @@
-import time
-from typing import Optional
-from .base import RateLimiter
-from ..storage import Storage
+import math
+from typing import Any, List, Optional, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+from ..storage.redis_storage import SLIDING_COUNTER_ADD
+
+# The storage step (see SLIDING_COUNTER_ADD), then the decision
+SLIDING_WINDOW_COUNTER_SCRIPT = (
+    SLIDING_COUNTER_ADD
+    + """
+local weight = tonumber(ARGV[1])
+local max_req = tonumber(ARGV[2])
+local cost = tonumber(ARGV[4])
+local window_size = tonumber(ARGV[5])
+
+local added, curr, prev = sliding_counter_add(KEYS, ARGV)
+local est = curr + (prev * weight)
+if added then
+    return {1, math.max(0, math.ceil(max_req - est - cost)), '0'}
+end
+
+-- Denied until the previous window's weight has decayed enough
+local remaining = math.max(0, math.ceil(max_req - est))
+if cost > max_req then
+    return {0, remaining, 'inf'}
+end
+local room = max_req - cost + 1 - curr
+local retry
+if room > 0 then
+    retry = window_size * (weight - room / prev)
+else
+    -- Wait for the window to end, then for the current count (now the
+    -- previous window) to decay
+    retry = window_size * (weight + 1 - (max_req - cost + 1) / curr)
+end
+return {0, remaining, tostring(retry + ARGV[6])}
+"""
+)
+
+
+# The check is a strict `<`, so at the computed instant itself the request is
+# still denied; retry times are reported just past it
+BOUNDARY_MARGIN = 1e-6
 
 
 class SlidingWindowCounterLimiter(RateLimiter):
+    script = SLIDING_WINDOW_COUNTER_SCRIPT
+
     def __init__(
-        self, max_requests: int, window_seconds: int, storage: Optional[Storage] = None
+        self,
+        max_requests: int,
+        window_seconds: int,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
     ):
-        super().__init__(storage)
+        super().__init__(storage, deny_cache_size, key_encoder)
         self.max_requests = max_requests
         self.window_seconds = window_seconds
 
-    def allow(self, key: str) -> bool:
-        now = time.time()
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def _window(self, key: str, now: float) -> Tuple[str, str, float, int]:
         window_size = self.window_seconds
 
         current_window = int(now // window_size)
         prev_window = current_window - 1
 
-        curr_key = f"swc:{key}:{current_window}"
-        prev_key = f"swc:{key}:{prev_window}"
+        base_key = self._key("swc", key)
+        curr_key = f"{base_key}:{current_window}"
+        prev_key = f"{base_key}:{prev_window}"
 
         # Calculate weight of previous window
         # How much of the previous window overlaps with the sliding window?
@@ -29,51 +80,73 @@ class SlidingWindowCounterLimiter(RateLimiter):
         time_into_window = now % window_size
         weight = (window_size - time_into_window) / window_size
 
-        # Keys for Lua
-        keys = [curr_key, prev_key]
         expiry = int(window_size * 2 + 10)  # Keep long enough for next window LOOKUP
+        return curr_key, prev_key, weight, expiry
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        curr_key, prev_key, weight, expiry = self._window(key, now)
+        return (
+            [curr_key, prev_key],
+            [
+                weight,
+                self.max_requests,
+                expiry,
+                cost,
+                self.window_seconds,
+                BOUNDARY_MARGIN,
+            ],
+        )
 
-        try:
-            script = """
-            local curr_key = KEYS[1]
-            local prev_key = KEYS[2]
-            local weight = tonumber(ARGV[1])
-            local max_req = tonumber(ARGV[2])
-            local expiry = tonumber(ARGV[3])
-            
-            local curr = tonumber(redis.call('GET', curr_key) or "0")
-            local prev = tonumber(redis.call('GET', prev_key) or "0")
-            
-            local est = curr + (prev * weight)
-            
-            if est < max_req then
-                redis.call('INCR', curr_key)
-                redis.call('EXPIRE', curr_key, expiry)
-                return 1
-            end
-            return 0
-            """
-            result = self.storage.execute_lua(
-                script, keys, [weight, self.max_requests, expiry]
-            )
-            return bool(result)
-
-        except NotImplementedError:
-            curr_count = self.storage.get(curr_key)
-            if curr_count is None:
-                curr_count = 0
-            else:
-                curr_count = int(curr_count)
-
-            prev_count = self.storage.get(prev_key)
-            if prev_count is None:
-                prev_count = 0
-            else:
-                prev_count = int(prev_count)
-
-            estimated_count = curr_count + (prev_count * weight)
-
-            if estimated_count < self.max_requests:
-                self.storage.incr(curr_key, 1, expiry)
-                return True
-            return False
+    def _retry_after(
+        self, curr_count: int, prev_count: int, weight: float, cost: int
+    ) -> float:
+        """Seconds until the decaying estimate leaves room for `cost`."""
+        if cost > self.max_requests:
+            return math.inf
+        window_size = self.window_seconds
+        room = self.max_requests - cost + 1 - curr_count
+        if room > 0:
+            retry = window_size * (weight - room / prev_count)
+        else:
+            # Wait for the window to end, then for the current count (now the
+            # previous window) to decay
+            needed = (self.max_requests - cost + 1) / curr_count
+            retry = window_size * (weight + 1 - needed)
+        return retry + BOUNDARY_MARGIN
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        curr_key, prev_key, weight, expiry = self._window(key, now)
+        granted, curr_count, prev_count = self.storage.sliding_counter_add(
+            curr_key, prev_key, weight, self.max_requests, cost, expiry
+        )
+        estimated_count = curr_count + (prev_count * weight)
+
+        if granted:
+            remaining = max(0, math.ceil(self.max_requests - estimated_count - cost))
+            return Decision(True, remaining, 0.0)
+        return Decision(
+            False,
+            max(0, math.ceil(self.max_requests - estimated_count)),
+            self._retry_after(curr_count, prev_count, weight, cost),
+        )
+
+
+class AsyncSlidingWindowCounterLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = SlidingWindowCounterLimiter(
+            max_requests,
+            window_seconds,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
@@ -1,59 +1,106 @@
-import time
-from typing import Optional
-from .base import RateLimiter
-from ..storage import Storage
+import math
+from typing import Any, List, Optional, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+from ..storage.redis_storage import SLIDING_LOG_ADD
+
+# The storage step (see SLIDING_LOG_ADD), then the decision
+SLIDING_WINDOW_LOG_SCRIPT = (
+    SLIDING_LOG_ADD
+    + """
+local now = tonumber(ARGV[1])
+local max_requests = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+
+local added, count, oldest = sliding_log_add(KEYS, ARGV)
+if added then
+    return {1, max_requests - count - cost, '0'}
+end
+
+-- Denied until enough of the oldest entries have left the window
+local remaining = math.max(0, max_requests - count)
+if cost > max_requests then
+    return {0, remaining, 'inf'}
+end
+if oldest == nil then
+    return {0, remaining, '0'}
+end
+return {0, remaining, tostring(tonumber(oldest) + window - now)}
+"""
+)
 
 
 class SlidingWindowLogLimiter(RateLimiter):
+    script = SLIDING_WINDOW_LOG_SCRIPT
+
     def __init__(
-        self, max_requests: int, window_seconds: int, storage: Optional[Storage] = None
+        self,
+        max_requests: int,
+        window_seconds: int,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
     ):
-        super().__init__(storage)
+        super().__init__(storage, deny_cache_size, key_encoder)
         self.max_requests = max_requests
         self.window_seconds = window_seconds
 
-    def allow(self, key: str) -> bool:
-        now = time.time()
-        window_start = now - self.window_seconds
-        storage_key = f"sliding_log:{key}"
-
-        try:
-            # Try atomic Lua script if supported (e.g. Redis)
-            script = """
-             local key = KEYS[1]
-             local now = tonumber(ARGV[1])
-             local window_start = tonumber(ARGV[2])
-             local max_requests = tonumber(ARGV[3])
-             local expiry = tonumber(ARGV[4])
-             
-             redis.call('ZREMRANGEBYSCORE', key, '-inf', window_start)
-             local count = redis.call('ZCARD', key)
-             
-             if count < max_requests then
-                 redis.call('ZADD', key, now, now)
-                 redis.call('EXPIRE', key, expiry)
-                 return 1
-             end
-             return 0
-             """
-            # args must be strings or convertible
-            result = self.storage.execute_lua(
-                script,
-                [storage_key],
-                [now, window_start, self.max_requests, self.window_seconds],
-            )
-            return bool(result)
-
-        except NotImplementedError:
-            # Fallback for storage that doesn't support Lua (Memory, SQLite)
-            # Note: This might have race conditions in distributed non-atomic storage
-            # but Memory is locked and SQLite matches this logic.
-
-            self.storage.remove_timestamps(storage_key, window_start)
-            count = self.storage.count_timestamps(storage_key, window_start, now)
-
-            if count < self.max_requests:
-                # Pass expiry mainly to update TTL if needed
-                self.storage.add_timestamp(storage_key, now, self.window_seconds)
-                return True
-            return False
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
+
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        # args must be strings or convertible
+        return (
+            [self._key("sliding_log", key)],
+            [
+                now,
+                now - self.window_seconds,
+                self.max_requests,
+                self.window_seconds,
+                cost,
+            ],
+        )
+
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        # Trim, count and record in one storage step
+        granted, count, oldest = self.storage.sliding_log_add(
+            self._key("sliding_log", key),
+            now,
+            self.window_seconds,
+            self.max_requests,
+            cost,
+        )
+        if granted:
+            return Decision(True, self.max_requests - count - cost, 0.0)
+
+        remaining = max(0, self.max_requests - count)
+        if cost > self.max_requests:
+            return Decision(False, remaining, math.inf)
+        # Allowed again once the entry that has to leave the window does
+        if oldest is None:
+            return Decision(False, remaining, 0.0)
+        return Decision(False, remaining, oldest + self.window_seconds - now)
+
+
+class AsyncSlidingWindowLogLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = SlidingWindowLogLimiter(
+            max_requests,
+            window_seconds,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
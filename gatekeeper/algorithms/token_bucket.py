@@ -1,80 +1,102 @@
-import time
-from typing import Optional
-from .base import RateLimiter
-from ..storage import Storage
+import math
+from typing import Any, List, Optional, Tuple
+from .async_base import AsyncRateLimiter
+from .base import Decision, RateLimiter, _migrate_legacy_buckets
+from ..keys import KeyEncoder
+from ..storage import AsyncStorage, Storage
+from ..storage.redis_storage import TOKEN_BUCKET_CONSUME
+
+# The storage step (see TOKEN_BUCKET_CONSUME), then the decision. KEYS[2]
+# and KEYS[3], when given, are the two plain keys used by earlier versions;
+# state found there is moved into the hash on first use.
+TOKEN_BUCKET_SCRIPT = (
+    TOKEN_BUCKET_CONSUME
+    + """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[4])
+
+local taken, tokens = token_bucket_consume(KEYS, ARGV)
+local remaining = math.floor(tokens)
+if taken then
+    return {1, remaining, '0'}
+end
+
+-- Denied until enough tokens have been refilled
+if requested > capacity or refill_rate <= 0 then
+    return {0, remaining, 'inf'}
+end
+return {0, remaining, tostring((requested - tokens) / refill_rate)}
+"""
+)
 
 
 class TokenBucketLimiter(RateLimiter):
+    script = TOKEN_BUCKET_SCRIPT
+
     def __init__(
-        self, capacity: int, refill_rate: float, storage: Optional[Storage] = None
+        self,
+        capacity: int,
+        refill_rate: float,
+        storage: Optional[Storage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
     ):
-        super().__init__(storage)
+        super().__init__(storage, deny_cache_size, key_encoder)
         self.capacity = capacity
         self.refill_rate = refill_rate  # tokens per second
 
-    def allow(self, key: str) -> bool:
-        token_key = f"tb:{key}:tokens"
-        ts_key = f"tb:{key}:ts"
+    def allow(self, key: str, cost: int = 1) -> bool:
+        return self._check(key, cost)
 
-        now = time.time()
+    def _script_args(
+        self, key: str, cost: int, now: float
+    ) -> Tuple[List[str], List[Any]]:
+        keys = [self._key("tb", key)]
+        if self._cross_slot and self.key_encoder is None:
+            # Where earlier versions kept the state (see migrate_legacy_keys)
+            keys += [f"tb:{key}:tokens", f"tb:{key}:ts"]
+        return (
+            keys,
+            [self.capacity, self.refill_rate, now, cost],
+        )
 
-        try:
-            script = """
-            local token_key = KEYS[1]
-            local ts_key = KEYS[2]
-            local capacity = tonumber(ARGV[1])
-            local refill_rate = tonumber(ARGV[2])
-            local now = tonumber(ARGV[3])
-            local requested = 1
-            
-            local last_tokens = tonumber(redis.call('GET', token_key))
-            if last_tokens == nil then
-                last_tokens = capacity
-            end
-            
-            local last_ts = tonumber(redis.call('GET', ts_key))
-            if last_ts == nil then
-                last_ts = now
-            end
-            
-            local delta = math.max(0, now - last_ts)
-            local filled_tokens = math.min(capacity, last_tokens + (delta * refill_rate))
-            
-            if filled_tokens >= requested then
-                local new_tokens = filled_tokens - requested
-                redis.call('SET', token_key, new_tokens)
-                redis.call('SET', ts_key, now)
-                -- Optional: Set expiry
-                return 1
-            end
-            
-            return 0
-            """
-            result = self.storage.execute_lua(
-                script, [token_key, ts_key], [self.capacity, self.refill_rate, now]
-            )
-            return bool(result)
+    def _allow_local(self, key: str, cost: int, now: float) -> Decision:
+        granted, tokens = self.storage.token_bucket_consume(
+            self._key("tb", key), self.capacity, self.refill_rate, cost, now
+        )
+        if granted:
+            return Decision(True, math.floor(tokens), 0.0)
+        if cost > self.capacity or self.refill_rate <= 0:
+            return Decision(False, math.floor(tokens), math.inf)
+        return Decision(False, math.floor(tokens), (cost - tokens) / self.refill_rate)
 
-        except NotImplementedError:
-            last_tokens = self.storage.get(token_key)
-            last_ts = self.storage.get(ts_key)
+    def migrate_legacy_keys(self, batch_size: int = 500) -> int:
+        """
+        Move bucket state written to Redis by earlier versions (two plain
+        keys per client, without expiry) into the expiring hash layout.
+        Returns the number of buckets converted.
 
-            if last_tokens is None:
-                last_tokens = self.capacity
-            else:
-                last_tokens = float(last_tokens)
+        Buckets are also converted on their next decision, so this is only
+        needed to reclaim the keys of clients that do not come back.
+        """
+        return _migrate_legacy_buckets(self, "tb:", ":ts", batch_size)
 
-            if last_ts is None:
-                last_ts = now
-            else:
-                last_ts = float(last_ts)
 
-            delta = max(0, now - last_ts)
-            filled_tokens = min(self.capacity, last_tokens + (delta * self.refill_rate))
-
-            if filled_tokens >= 1:
-                new_tokens = filled_tokens - 1
-                self.storage.set(token_key, new_tokens)
-                self.storage.set(ts_key, now)
-                return True
-            return False
+class AsyncTokenBucketLimiter(AsyncRateLimiter):
+    def __init__(
+        self,
+        capacity: int,
+        refill_rate: float,
+        storage: Optional[AsyncStorage] = None,
+        deny_cache_size: int = 0,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        super().__init__(storage)
+        self._limiter = TokenBucketLimiter(
+            capacity,
+            refill_rate,
+            storage=self._sync_storage,
+            deny_cache_size=deny_cache_size,
+            key_encoder=key_encoder or self.storage.key_encoder,
+        )
@@ -0,0 +1,396 @@
+import bisect
+import inspect
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from .algorithms.leased import LeasedLimiter
+
+# Latency histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (
+    0.000005,
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    float("inf"),
+)
+
+# Limiter entry points timed per call. allow_many() goes through check_many()
+# and acquire() through check(), so each decision is recorded once.
+LIMITER_METHODS = ("allow", "check", "check_many")
+
+# Storage operations timed per call, where the backend has them
+STORAGE_METHODS = (
+    "get",
+    "set",
+    "incr",
+    "add_timestamp",
+    "count_timestamps",
+    "remove_timestamps",
+    "timestamp_at",
+    "execute_lua",
+    "execute_lua_many",
+    "token_bucket_consume",
+    "leaky_bucket_add",
+    "bucket_ring_add",
+    "sliding_counter_add",
+    "sliding_log_add",
+    "gcra_consume",
+)
+
+_HELP = {
+    "gatekeeper_decisions_total": (
+        "counter",
+        "Rate limit decisions by outcome.",
+    ),
+    "gatekeeper_decision_paths_total": (
+        "counter",
+        "Decisions computed by a Lua script or by the local fallback, or "
+        "served from LeasedLimiter leases.",
+    ),
+    "gatekeeper_deny_cache_hits_total": (
+        "counter",
+        "Denials answered from the in-process deny cache.",
+    ),
+    "gatekeeper_decision_seconds": (
+        "histogram",
+        "Latency of allow(), check() and check_many() calls.",
+    ),
+    "gatekeeper_storage_op_seconds": (
+        "histogram",
+        "Latency of storage operations.",
+    ),
+    "gatekeeper_storage_errors_total": (
+        "counter",
+        "Storage operations that raised.",
+    ),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+
+
+class Metrics:
+    """
+    In-process collector for limiter and storage instrumentation.
+
+    Objects are opted in with instrument(), which replaces their public
+    methods on that instance with timed wrappers. Nothing is patched on the
+    classes, so limiters and storages that are not instrumented run exactly
+    the code they would without this module.
+
+    Export with render_prometheus() (text exposition format, e.g. from a
+    /metrics handler) or collect(), which yields plain samples for bridging
+    into OpenTelemetry or another client library.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], _Counter] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        # Values read at collection time, e.g. deny cache hits
+        self._callbacks: List[Tuple[str, Labels, Callable[[], float]]] = []
+
+    def instrument(self, target: Any, name: Optional[str] = None) -> Any:
+        """
+        Start recording a limiter (sync or async) or a storage backend.
+        `name` is used as its label, defaulting to the class name. Returns
+        the target for chaining.
+        """
+        label = name or type(target).__name__
+        if hasattr(target, "check_many"):
+            self._instrument_limiter(target, label)
+        else:
+            self._instrument_storage(target, label)
+        return target
+
+    # Series. Wrappers look their series up once, at instrument() time, and
+    # update them under a single lock acquisition per call.
+
+    def _counter(self, name: str, labels: Labels) -> "_Counter":
+        with self._lock:
+            counter = self._counters.get((name, labels))
+            if counter is None:
+                counter = self._counters[(name, labels)] = _Counter()
+            return counter
+
+    def _histogram(self, name: str, labels: Labels) -> _Histogram:
+        with self._lock:
+            hist = self._histograms.get((name, labels))
+            if hist is None:
+                hist = self._histograms[(name, labels)] = _Histogram()
+            return hist
+
+    # Instrumentation
+
+    def _instrument_limiter(self, limiter: Any, label: str):
+        # Async limiters delegate the algorithm to a synchronous limiter
+        algorithm = getattr(limiter, "_limiter", limiter)
+
+        for method in LIMITER_METHODS:
+            original = getattr(limiter, method)
+            setattr(limiter, method, self._timed_decision(original, method, label))
+
+        # Every scripted decision builds its script call once and every local
+        # one runs _allow_local once, for single and batched calls alike
+        for method, path in (("_script_call", "lua"), ("_allow_local", "local")):
+            original = getattr(algorithm, method)
+            setattr(algorithm, method, self._counted(original, label, path))
+
+        # Decisions a LeasedLimiter makes from leased quota never reach the
+        # shared limiter's entry points, so they are counted as its decisions
+        # through this hook (a LeasedLimiter's own are counted by its wrappers)
+        setattr(
+            algorithm,
+            "_decided_by_lease",
+            self._leased(
+                algorithm._decided_by_lease,
+                label,
+                count_decisions=not isinstance(algorithm, LeasedLimiter),
+            ),
+        )
+
+        cache = getattr(algorithm, "deny_cache", None)
+        if cache is not None:
+            self._callbacks.append(
+                (
+                    "gatekeeper_deny_cache_hits_total",
+                    (("limiter", label),),
+                    lambda: cache.hits,
+                )
+            )
+
+    def _timed_decision(self, original: Callable, method: str, label: str):
+        lock = self._lock
+        clock = time.perf_counter
+        allowed = self._counter(
+            "gatekeeper_decisions_total", (("limiter", label), ("result", "allowed"))
+        )
+        denied = self._counter(
+            "gatekeeper_decisions_total", (("limiter", label), ("result", "denied"))
+        )
+        hist = self._histogram("gatekeeper_decision_seconds", (("limiter", label),))
+        counts = hist.counts
+
+        def record(result, elapsed: float):
+            if method == "allow":
+                passed, total = int(result), 1
+            elif method == "check":
+                passed, total = int(result.allowed), 1
+            else:
+                passed, total = sum(d.allowed for d in result), len(result)
+            index = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+            with lock:
+                allowed.value += passed
+                denied.value += total - passed
+                counts[index] += 1
+                hist.sum += elapsed
+
+        if inspect.iscoroutinefunction(original):
+
+            @wraps(original)
+            async def async_wrapper(*args, **kwargs):
+                start = clock()
+                result = await original(*args, **kwargs)
+                record(result, clock() - start)
+                return result
+
+            return async_wrapper
+
+        @wraps(original)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            result = original(*args, **kwargs)
+            record(result, clock() - start)
+            return result
+
+        return wrapper
+
+    def _counted(self, original: Callable, label: str, path: str):
+        lock = self._lock
+        counter = self._counter(
+            "gatekeeper_decision_paths_total", (("limiter", label), ("path", path))
+        )
+
+        @wraps(original)
+        def wrapper(*args, **kwargs):
+            with lock:
+                counter.value += 1
+            return original(*args, **kwargs)
+
+        return wrapper
+
+    def _leased(self, original: Callable, label: str, count_decisions: bool):
+        lock = self._lock
+        path = self._counter(
+            "gatekeeper_decision_paths_total", (("limiter", label), ("path", "lease"))
+        )
+        allowed = self._counter(
+            "gatekeeper_decisions_total", (("limiter", label), ("result", "allowed"))
+        )
+        denied = self._counter(
+            "gatekeeper_decisions_total", (("limiter", label), ("result", "denied"))
+        )
+
+        @wraps(original)
+        def wrapper(passed: int, failed: int):
+            with lock:
+                path.value += passed + failed
+                if count_decisions:
+                    allowed.value += passed
+                    denied.value += failed
+            return original(passed, failed)
+
+        return wrapper
+
+    def _instrument_storage(self, storage: Any, label: str):
+        for method in STORAGE_METHODS:
+            original = getattr(storage, method, None)
+            if original is None:
+                continue
+            setattr(storage, method, self._timed_op(original, label, method))
+
+    def _timed_op(self, original: Callable, label: str, op: str):
+        labels = (("storage", label), ("op", op))
+        lock = self._lock
+        clock = time.perf_counter
+        errors = self._counter("gatekeeper_storage_errors_total", labels)
+        hist = self._histogram("gatekeeper_storage_op_seconds", labels)
+        counts = hist.counts
+
+        def record(elapsed: float, failed: bool):
+            index = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+            with lock:
+                counts[index] += 1
+                hist.sum += elapsed
+                errors.value += failed
+
+        if inspect.iscoroutinefunction(original):
+
+            @wraps(original)
+            async def async_wrapper(*args, **kwargs):
+                start = clock()
+                failed = True
+                try:
+                    result = await original(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    record(clock() - start, failed)
+
+            return async_wrapper
+
+        @wraps(original)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            failed = True
+            try:
+                result = original(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                record(clock() - start, failed)
+
+        return wrapper
+
+    # Export
+
+    def collect(self) -> Iterator[Tuple[str, str, Dict[str, str], Any]]:
+        """
+        Yield (name, kind, labels, value) for every series. Counters have a
+        number as value; histograms a dict with cumulative "buckets" as
+        (upper bound, count) pairs, "sum" and "count".
+        """
+        with self._lock:
+            counters = {key: c.value for key, c in self._counters.items()}
+            histograms = {
+                key: (list(hist.counts), hist.sum)
+                for key, hist in self._histograms.items()
+            }
+        for name, labels, read in self._callbacks:
+            counters[(name, labels)] = read()
+
+        for (name, labels), value in sorted(counters.items()):
+            yield name, "counter", dict(labels), value
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            cumulative = []
+            running = 0
+            for bound, count in zip(LATENCY_BUCKETS, counts):
+                running += count
+                cumulative.append((bound, running))
+            yield (
+                name,
+                "histogram",
+                dict(labels),
+                {"buckets": cumulative, "sum": total, "count": running},
+            )
+
+    def render_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for name, kind, labels, value in self.collect():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {_HELP[name][1]}")
+                lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            for bound, count in value["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{name}_bucket{_format_labels({**labels, 'le': le})} {count}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']!r}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Zero every series; instrumented objects keep recording."""
+        with self._lock:
+            for counter in self._counters.values():
+                counter.value = 0
+            for hist in self._histograms.values():
+                hist.counts[:] = [0] * len(LATENCY_BUCKETS)
+                hist.sum = 0.0
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
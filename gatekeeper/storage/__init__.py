@@ -1,6 +1,27 @@
 from .base import Storage
 from .memory import InMemoryStorage
 from .redis_storage import RedisStorage
+from .sharded_redis_storage import ShardedRedisStorage
+from .shared_memory import SharedMemoryStorage
 from .sqlite_storage import SQLiteStorage
+from .async_base import AsyncStorage
+from .async_adapters import (
+    AsyncInMemoryStorage,
+    AsyncSharedMemoryStorage,
+    AsyncSQLiteStorage,
+)
+from .async_redis_storage import AsyncRedisStorage
 
-__all__ = ["Storage", "InMemoryStorage", "RedisStorage", "SQLiteStorage"]
+__all__ = [
+    "Storage",
+    "InMemoryStorage",
+    "RedisStorage",
+    "ShardedRedisStorage",
+    "SharedMemoryStorage",
+    "SQLiteStorage",
+    "AsyncStorage",
+    "AsyncInMemoryStorage",
+    "AsyncSharedMemoryStorage",
+    "AsyncSQLiteStorage",
+    "AsyncRedisStorage",
+]
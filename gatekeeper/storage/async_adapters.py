@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+from .async_base import AsyncStorage
+from .base import Storage
+from .memory import InMemoryStorage
+from .shared_memory import SharedMemoryStorage
+from .sqlite_storage import SQLiteStorage
+
+T = TypeVar("T")
+
+
+class _SyncStorageAdapter(AsyncStorage):
+    def __init__(self, storage: Storage):
+        self.sync_storage: Storage = storage
+        self.key_encoder = storage.key_encoder
+
+    def _run_batch(self, fn: Callable[..., T], *args: Any) -> T:
+        with self.sync_storage.batch():
+            return fn(*args)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await self.run_sync(self.sync_storage.get, key)
+
+    async def set(self, key: str, value: Any, expiry: Optional[int] = None):
+        await self.run_sync(self.sync_storage.set, key, value, expiry)
+
+    async def incr(
+        self, key: str, amount: int = 1, expiry: Optional[int] = None
+    ) -> int:
+        return await self.run_sync(self.sync_storage.incr, key, amount, expiry)
+
+    async def add_timestamp(
+        self, key: str, timestamp: float, expiry: Optional[int] = None
+    ):
+        await self.run_sync(self.sync_storage.add_timestamp, key, timestamp, expiry)
+
+    async def count_timestamps(self, key: str, start: float, end: float) -> int:
+        return await self.run_sync(self.sync_storage.count_timestamps, key, start, end)
+
+    async def remove_timestamps(self, key: str, max_timestamp: float):
+        await self.run_sync(self.sync_storage.remove_timestamps, key, max_timestamp)
+
+
+class AsyncInMemoryStorage(_SyncStorageAdapter):
+    """
+    Async adapter for InMemoryStorage. Operations only hold the lock for a
+    few dictionary lookups, so they run inline on the event loop.
+    """
+
+    def __init__(self, storage: Optional[InMemoryStorage] = None):
+        super().__init__(storage or InMemoryStorage())
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any) -> T:
+        return self._run_batch(fn, *args)
+
+
+class AsyncSharedMemoryStorage(_SyncStorageAdapter):
+    """
+    Async adapter for SharedMemoryStorage. Operations hold a stripe lock for
+    a few microseconds, so they run inline on the event loop.
+    """
+
+    def __init__(self, path: str, storage: Optional[SharedMemoryStorage] = None):
+        super().__init__(storage or SharedMemoryStorage(path))
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any) -> T:
+        return self._run_batch(fn, *args)
+
+
+class AsyncSQLiteStorage(_SyncStorageAdapter):
+    """
+    Async adapter for SQLiteStorage. Queries run on a dedicated worker thread
+    so disk I/O never blocks the event loop, and the connection is only ever
+    used from that one thread.
+    """
+
+    def __init__(
+        self, db_path: str = "gatekeeper.db", storage: Optional[SQLiteStorage] = None
+    ):
+        super().__init__(storage or SQLiteStorage(db_path))
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="gatekeeper-sqlite"
+        )
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_batch, fn, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
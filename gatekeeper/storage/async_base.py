@@ -0,0 +1,78 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple, TypeVar
+from .base import Storage
+
+if TYPE_CHECKING:
+    from ..keys import KeyEncoder
+
+T = TypeVar("T")
+
+
+class AsyncStorage(ABC):
+    """asyncio counterpart of Storage; every operation is awaitable."""
+
+    # Set by adapters that wrap a synchronous Storage (see run_sync)
+    sync_storage: Optional[Storage] = None
+
+    # See Storage.cross_slot_scripts
+    cross_slot_scripts = True
+
+    # See Storage.key_encoder
+    key_encoder: Optional["KeyEncoder"] = None
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, expiry: Optional[int] = None):
+        pass
+
+    @abstractmethod
+    async def incr(
+        self, key: str, amount: int = 1, expiry: Optional[int] = None
+    ) -> int:
+        pass
+
+    # For Sliding Window Log (Sorted Sets)
+    @abstractmethod
+    async def add_timestamp(
+        self, key: str, timestamp: float, expiry: Optional[int] = None
+    ):
+        pass
+
+    @abstractmethod
+    async def count_timestamps(self, key: str, start: float, end: float) -> int:
+        pass
+
+    @abstractmethod
+    async def remove_timestamps(self, key: str, max_timestamp: float):
+        pass
+
+    @property
+    def supports_lua(self) -> bool:
+        """Whether this backend implements execute_lua."""
+        return type(self).execute_lua is not AsyncStorage.execute_lua
+
+    async def execute_lua(self, script: str, keys: list, args: list) -> Any:
+        """Execute a Lua script (optional support)"""
+        raise NotImplementedError(
+            "Lua implementation not supported by this storage backend"
+        )
+
+    async def execute_lua_many(
+        self, script: str, calls: List[Tuple[list, list]]
+    ) -> List[Any]:
+        """Execute a Lua script once per (keys, args) pair in a single round trip"""
+        raise NotImplementedError(
+            "Lua implementation not supported by this storage backend"
+        )
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run fn(*args) against the wrapped synchronous storage as one batch.
+        Only adapters around a synchronous Storage support this.
+        """
+        raise NotImplementedError(
+            "This storage backend does not wrap a synchronous storage"
+        )
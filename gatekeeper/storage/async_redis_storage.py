@@ -0,0 +1,82 @@
+from typing import Optional, Any, List, Tuple
+import redis.asyncio
+from redis.asyncio.cluster import RedisCluster
+from redis.exceptions import NoScriptError
+from .async_base import AsyncStorage
+from ..keys import KeyEncoder
+from .scripts import script_sha
+
+
+class AsyncRedisStorage(AsyncStorage):
+    def __init__(
+        self,
+        redis_client: redis.asyncio.Redis,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        self.redis = redis_client
+        self.cross_slot_scripts = not isinstance(redis_client, RedisCluster)
+        self.key_encoder = key_encoder
+
+    async def get(self, key: str) -> Optional[Any]:
+        val = await self.redis.get(key)
+        if val:
+            return val.decode("utf-8") if isinstance(val, bytes) else val
+        return None
+
+    async def set(self, key: str, value: Any, expiry: Optional[int] = None):
+        await self.redis.set(key, value, ex=expiry)
+
+    async def incr(
+        self, key: str, amount: int = 1, expiry: Optional[int] = None
+    ) -> int:
+        pipe = self.redis.pipeline()
+        pipe.incrby(key, amount)
+        if expiry:
+            pipe.expire(key, expiry)
+        results = await pipe.execute()
+        return results[0]
+
+    async def add_timestamp(
+        self, key: str, timestamp: float, expiry: Optional[int] = None
+    ):
+        pipe = self.redis.pipeline()
+        pipe.zadd(key, {str(timestamp): timestamp})
+        if expiry:
+            pipe.expire(key, expiry)
+        await pipe.execute()
+
+    async def count_timestamps(self, key: str, start: float, end: float) -> int:
+        return await self.redis.zcount(key, start, end)
+
+    async def remove_timestamps(self, key: str, max_timestamp: float):
+        await self.redis.zremrangebyscore(key, "-inf", max_timestamp)
+
+    async def execute_lua(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        # Same EVALSHA-then-EVAL fallback as RedisStorage.execute_lua
+        try:
+            return await self.redis.evalsha(script_sha(script), len(keys), *keys, *args)
+        except NoScriptError:
+            return await self.redis.eval(script, len(keys), *keys, *args)
+
+    async def execute_lua_many(
+        self, script: str, calls: List[Tuple[List[str], List[Any]]]
+    ) -> List[Any]:
+        sha = script_sha(script)
+        pipe = self.redis.pipeline(transaction=False)
+        for keys, args in calls:
+            pipe.evalsha(sha, len(keys), *keys, *args)
+        results = await pipe.execute(raise_on_error=False)
+
+        missing = [i for i, r in enumerate(results) if isinstance(r, NoScriptError)]
+        if missing:
+            pipe = self.redis.pipeline(transaction=False)
+            for i in missing:
+                keys, args = calls[i]
+                pipe.eval(script, len(keys), *keys, *args)
+            for i, result in zip(missing, await pipe.execute(raise_on_error=False)):
+                results[i] = result
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
@@ -1,8 +1,28 @@
+import math
 from abc import ABC, abstractmethod
-from typing import Optional, Any
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterator,
+    List,
+    MutableSequence,
+    Optional,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from ..keys import KeyEncoder
 
 
 class Storage(ABC):
+    # Whether one script call may touch keys in different hash slots. False
+    # on Redis Cluster and sharded storages, where a call runs on one node.
+    cross_slot_scripts = True
+    # Default key layout for limiters on this storage (see gatekeeper.keys);
+    # None keeps the raw `prefix:{key}` keys
+    key_encoder: Optional["KeyEncoder"] = None
+
     @abstractmethod
     def get(self, key: str) -> Optional[Any]:
         pass
@@ -28,8 +48,243 @@ class Storage(ABC):
     def remove_timestamps(self, key: str, max_timestamp: float):
         pass
 
+    def timestamp_at(self, key: str, index: int) -> Optional[float]:
+        """
+        The index-th oldest timestamp stored under `key`, used to compute
+        retry times. None if there is no such entry or it is not supported.
+        """
+        return None
+
+    @property
+    def supports_lua(self) -> bool:
+        """Whether this backend implements execute_lua."""
+        return type(self).execute_lua is not Storage.execute_lua
+
     def execute_lua(self, script: str, keys: list, args: list) -> Any:
         """Execute a Lua script (optional support)"""
         raise NotImplementedError(
             "Lua implementation not supported by this storage backend"
         )
+
+    def execute_lua_many(
+        self, script: str, calls: List[Tuple[list, list]]
+    ) -> List[Any]:
+        """Execute a Lua script once per (keys, args) pair in a single round trip"""
+        raise NotImplementedError(
+            "Lua implementation not supported by this storage backend"
+        )
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Group several operations so the backend can take its lock or
+        transaction once for the whole group instead of once per call.
+        """
+        yield
+
+    # Algorithm-level operations. The defaults are built from the primitives
+    # above; backends override them to make each decision a single step.
+
+    def token_bucket_consume(
+        self, key: str, capacity: float, refill_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        """
+        Refill the token bucket stored under `key` up to `now` and take `cost`
+        tokens if that many are available. Returns whether they were taken and
+        the tokens left in the bucket.
+        """
+        token_key = f"{key}:tokens"
+        ts_key = f"{key}:ts"
+
+        with self.batch():
+            last_tokens = self.get(token_key)
+            last_ts = self.get(ts_key)
+
+            if last_tokens is None:
+                last_tokens = capacity
+            else:
+                last_tokens = float(last_tokens)
+
+            if last_ts is None:
+                last_ts = now
+            else:
+                last_ts = float(last_ts)
+
+            delta = max(0, now - last_ts)
+            filled_tokens = min(capacity, last_tokens + (delta * refill_rate))
+
+            if filled_tokens >= cost:
+                new_tokens = filled_tokens - cost
+                # Idle for capacity / rate, any bucket is full again
+                expiry = math.ceil(capacity / refill_rate) if refill_rate > 0 else None
+                self.set(token_key, new_tokens, expiry)
+                self.set(ts_key, now, expiry)
+                return True, new_tokens
+            return False, filled_tokens
+
+    def leaky_bucket_add(
+        self, key: str, capacity: float, leak_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        """
+        Leak the bucket stored under `key` up to `now` and add `cost` units if
+        they fit under `capacity`. Returns whether they were added and the
+        resulting level.
+        """
+        level_key = f"{key}:level"
+        ts_key = f"{key}:ts"
+
+        with self.batch():
+            last_level = self.get(level_key)
+            if last_level is None:
+                last_level = 0
+            else:
+                last_level = float(last_level)
+
+            last_ts = self.get(ts_key)
+            if last_ts is None:
+                last_ts = now
+            else:
+                last_ts = float(last_ts)
+
+            delta = max(0, now - last_ts)
+            leaked = delta * leak_rate
+
+            current_level = max(0, last_level - leaked)
+
+            if current_level + cost <= capacity:
+                # Idle for capacity / rate, any bucket has drained
+                expiry = math.ceil(capacity / leak_rate) if leak_rate > 0 else None
+                self.set(level_key, current_level + cost, expiry)
+                self.set(ts_key, now, expiry)
+                return True, current_level + cost
+            return False, current_level
+
+    def bucket_ring_add(
+        self,
+        key: str,
+        buckets: int,
+        bucket: int,
+        limit: int,
+        cost: int,
+        expiry: float,
+    ) -> Tuple[bool, List[int]]:
+        """
+        Add `cost` to time bucket `bucket` of the ring of `buckets` counters
+        stored under `key`, if the ring total stays within `limit`. Returns
+        whether it was added and the counts of the window, oldest first.
+        """
+        with self.batch():
+            raw = self.get(key)
+            last, counts = None, [0] * buckets
+            if raw is not None:
+                head, _, body = str(raw).partition("|")
+                stored = [int(c) for c in body.split(",")]
+                if len(stored) == buckets:
+                    last, counts = int(head), stored
+
+            granted, last, window = ring_add(counts, last, bucket, limit, cost)
+            if granted:
+                # set() takes whole seconds; rounding up keeps the ring alive
+                self.set(key, f"{last}|{','.join(map(str, counts))}", math.ceil(expiry))
+            return granted, window
+
+    def gcra_consume(
+        self, key: str, increment: float, burst_offset: float, now: float
+    ) -> Tuple[bool, float]:
+        """
+        GCRA step on the theoretical arrival time (TAT) stored under `key`:
+        the request is allowed if max(TAT, now) + increment - burst_offset is
+        not in the future, and TAT then advances by `increment`. Returns
+        whether it was allowed and the resulting TAT (unchanged if denied).
+        The stored TAT expires when it falls behind the clock.
+        """
+        with self.batch():
+            stored = self.get(key)
+            tat = max(float(stored), now) if stored is not None else now
+            new_tat = tat + increment
+            if new_tat - burst_offset > now:
+                return False, tat
+            # Whole seconds for set(); a TAT kept past its time reads as `now`
+            self.set(key, repr(new_tat), math.ceil(new_tat - now))
+            return True, new_tat
+
+    def sliding_counter_add(
+        self,
+        key: str,
+        prev_key: str,
+        weight: float,
+        limit: int,
+        cost: int,
+        expiry: int,
+    ) -> Tuple[bool, int, int]:
+        """
+        Sliding window counter step: the estimate is the count under `key`
+        (current window) plus `weight` times the count under `prev_key`
+        (previous window). If estimate + cost - 1 < limit, add `cost` to
+        `key`, which expires after `expiry` seconds. Returns whether it was
+        added and both counts as they were before.
+        """
+        with self.batch():
+            curr = self.get(key)
+            curr = 0 if curr is None else int(curr)
+            prev = self.get(prev_key)
+            prev = 0 if prev is None else int(prev)
+            granted = curr + prev * weight + cost - 1 < limit
+            if granted:
+                self.incr(key, cost, expiry)
+            return granted, curr, prev
+
+    def sliding_log_add(
+        self, key: str, now: float, window: int, limit: int, cost: int
+    ) -> Tuple[bool, int, Optional[float]]:
+        """
+        Sliding window log step: drop the timestamps at or before
+        now - window, then record `cost` entries at `now` if the ones left
+        plus `cost` stay within `limit`. The log expires `window` seconds
+        after the last entry. Returns whether they were recorded, the count
+        before, and for a denial the timestamp that has to leave the window
+        before the request fits (None if unknown or never).
+        """
+        window_start = now - window
+        with self.batch():
+            self.remove_timestamps(key, window_start)
+            # Entries past `now` count too: another caller may have read
+            # the clock later but written first
+            count = self.count_timestamps(key, window_start, math.inf)
+            if count + cost <= limit:
+                for _ in range(cost):
+                    self.add_timestamp(key, now, window)
+                return True, count, None
+            if cost > limit:
+                return False, count, None
+            return False, count, self.timestamp_at(key, count + cost - limit - 1)
+
+
+def ring_add(
+    counts: MutableSequence[int],
+    last: Optional[int],
+    bucket: int,
+    limit: int,
+    cost: int,
+) -> Tuple[bool, int, List[int]]:
+    """
+    Advance a ring of per-bucket counts (bucket b lives in slot b % len) from
+    bucket `last` to `bucket`, then add `cost` to the current bucket if the
+    ring total stays within `limit`. Mutates `counts`. Returns whether it was
+    added, the new last bucket and the window's counts, oldest first.
+    """
+    size = len(counts)
+    if last is None or bucket - last >= size:
+        for i in range(size):
+            counts[i] = 0
+    elif bucket > last:
+        for b in range(last + 1, bucket + 1):
+            counts[b % size] = 0
+    # A clock that went backwards keeps counting into the newest bucket
+    current = bucket if last is None else max(bucket, last)
+
+    granted = sum(counts) + cost <= limit
+    if granted:
+        counts[current % size] += cost
+    window = [counts[(current + 1 + i) % size] for i in range(size)]
+    return granted, current, window
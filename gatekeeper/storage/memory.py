@@ -1,96 +1,781 @@
+import atexit
+import bisect
+import gc
+from array import array
+import heapq
+import logging
+import math
+import os
 import time
 import threading
-from typing import Optional, Any, Dict, List
-from .base import Storage
+import weakref
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from itertools import starmap
+from typing import Optional, Any, Dict, Iterable, Iterator, List, Tuple
+from . import snapshot
+from .base import Storage, ring_add
 
+logger = logging.getLogger(__name__)
 
-class InMemoryStorage(Storage):
-    def __init__(self):
-        self._data: Dict[str, Any] = {}
-        self._expiry: Dict[str, float] = {}
-        self._sorted_sets: Dict[str, List[float]] = {}
-        self._lock = threading.Lock()
-
-    def _is_expired(self, key: str) -> bool:
-        if key in self._expiry and time.time() > self._expiry[key]:
-            self._delete(key)
+# Expired keys removed by the incremental sweep on each write
+SWEEP_BATCH = 16
+
+EVICTION_POLICIES = ("lru", "ttl")
+
+# Entries copied per stripe lock hold while saving a snapshot
+SNAPSHOT_CHUNK = 1000
+
+_MISSING = object()
+
+
+class _TimestampLog:
+    """
+    Sorted timestamps for one key. In-order appends are O(1), range counts
+    are two bisections, and trimming the oldest entries only advances `head`;
+    the dead prefix is compacted once it is half the list (amortized O(1)).
+    """
+
+    __slots__ = ("items", "head")
+
+    def __init__(self, items: Optional[List[float]] = None):
+        self.items: List[float] = [] if items is None else items
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.items) - self.head
+
+    def add(self, timestamp: float):
+        items = self.items
+        if not items or timestamp >= items[-1]:
+            items.append(timestamp)
+        else:
+            bisect.insort(items, timestamp, lo=self.head)
+
+    def count(self, start: float, end: float) -> int:
+        items, head = self.items, self.head
+        return bisect.bisect_right(items, end, lo=head) - bisect.bisect_left(
+            items, start, lo=head
+        )
+
+    def at(self, index: int) -> Optional[float]:
+        index += self.head
+        return self.items[index] if index < len(self.items) else None
+
+    def trim(self, max_timestamp: float):
+        """Drop every timestamp <= max_timestamp."""
+        items = self.items
+        head = bisect.bisect_right(items, max_timestamp, lo=self.head)
+        if head == len(items):
+            items.clear()
+            head = 0
+        elif head > 32 and head * 2 >= len(items):
+            del items[:head]
+            head = 0
+        self.head = head
+
+
+class _BucketRing:
+    """Fixed array of per-bucket counts for the bucketed sliding window."""
+
+    __slots__ = ("last", "counts")
+
+    def __init__(self, buckets: int):
+        self.last: Optional[int] = None
+        self.counts = array("q", bytes(8 * buckets))
+
+    @classmethod
+    def restored(cls, last: Optional[int], counts: array) -> "_BucketRing":
+        ring = cls(0)
+        ring.last, ring.counts = last, counts
+        return ring
+
+
+class _Bucket:
+    """Token or leaky bucket state: the level and when it was last updated."""
+
+    __slots__ = ("level", "ts")
+
+    def __init__(self, level: float, ts: float):
+        self.level = level
+        self.ts = ts
+
+
+class _Stripe:
+    """One independently locked slice of the keyspace."""
+
+    __slots__ = (
+        "lock",
+        "data",
+        "expiry",
+        "sorted_sets",
+        "max_keys",
+        "eviction",
+        "heap",
+        "recent",
+        "expired_count",
+        "evicted_count",
+    )
+
+    def __init__(self, max_keys: Optional[int] = None, eviction: str = "lru"):
+        # Re-entrant so that batch() can hold it across several operations
+        self.lock = threading.RLock()
+        self.data: Dict[str, Any] = {}
+        self.expiry: Dict[str, float] = {}
+        self.sorted_sets: Dict[str, _TimestampLog] = {}
+        self.max_keys = max_keys
+        self.eviction = eviction
+        # (expires_at, key) min-heap. An entry may be stale: the key can have
+        # been deleted or given a later expiry since it was pushed, so entries
+        # are validated against `expiry` when popped.
+        self.heap: List[Tuple[float, str]] = []
+        # Access order, only tracked for LRU eviction
+        self.recent: Optional["OrderedDict[str, None]"] = (
+            OrderedDict() if max_keys is not None and eviction == "lru" else None
+        )
+        self.expired_count = 0
+        self.evicted_count = 0
+
+    def __len__(self) -> int:
+        return len(self.data) + len(self.sorted_sets)
+
+    def is_expired(self, key: str) -> bool:
+        if key in self.expiry and time.time() > self.expiry[key]:
+            self.delete(key)
+            self.expired_count += 1
             return True
         return False
 
-    def _delete(self, key: str):
-        self._data.pop(key, None)
-        self._expiry.pop(key, None)
-        self._sorted_sets.pop(key, None)
+    def delete(self, key: str):
+        self.data.pop(key, None)
+        self.expiry.pop(key, None)
+        self.sorted_sets.pop(key, None)
+        if self.recent is not None:
+            self.recent.pop(key, None)
 
-    def _set_expiry(self, key: str, expiry: Optional[int]):
-        if expiry:
-            self._expiry[key] = time.time() + expiry
-        else:
-            # If no expiry is provided, we might want to clear existing expiry?
-            # Or preserve it? Redis preserves TTL on INCR, but SET removes it unless specified.
-            # For simplicity, we'll implement overwrite behavior if expiry is passed, else preserve.
-            pass
+    def set_expiry(self, key: str, expires_at: float):
+        current = self.expiry.get(key)
+        self.expiry[key] = expires_at
+        # A later expiry is picked up when the existing heap entry is popped,
+        # so refreshing the TTL of a hot key does not grow the heap.
+        if current is None or expires_at < current:
+            heapq.heappush(self.heap, (expires_at, key))
+
+    def touch(self, key: str):
+        # Callers only touch keys that exist
+        if self.recent is not None:
+            self.recent[key] = None
+            self.recent.move_to_end(key)
+
+    def reserve(self, key: str):
+        """Make room before `key` is created, evicting if at max_keys."""
+        if self.max_keys is None or key in self.data or key in self.sorted_sets:
+            return
+        self.evict_to(self.max_keys - 1)
+
+    def evict_to(self, size: int):
+        """Evict keys until at most `size` are left."""
+        while len(self) > size:
+            victim = self._pick_victim()
+            if victim is None:
+                return
+            self.delete(victim)
+            self.evicted_count += 1
+
+    def _pick_victim(self) -> Optional[str]:
+        if self.recent is not None:
+            return next(iter(self.recent), None)
+
+        # "ttl": the key closest to expiring, else the oldest inserted key
+        while self.heap:
+            expires_at, key = heapq.heappop(self.heap)
+            actual = self.expiry.get(key)
+            if actual is None:
+                continue
+            if actual != expires_at:
+                heapq.heappush(self.heap, (actual, key))
+                continue
+            return key
+        for keys in (self.data, self.sorted_sets):
+            for key in keys:
+                return key
+        return None
+
+    def copy_entries(
+        self,
+        keys: List[str],
+        sections: Dict[int, "snapshot.Section"],
+        expiry: Dict[str, float],
+    ):
+        """
+        Add copies of the entries of `keys` that still exist to `sections`,
+        by snapshot kind, and their expiry times to `expiry`.
+        """
+        data, logs, expires = self.data, self.sorted_sets, self.expiry
+        for key in keys:
+            value = data.get(key, _MISSING)
+            if value is _MISSING:
+                log = logs.get(key)
+                if log is None:
+                    continue
+                kind, value = snapshot.LOG, log.items[log.head :]
+            else:
+                cls = type(value)
+                if cls is _Bucket:
+                    kind, value = snapshot.BUCKET, (value.level, value.ts)
+                elif cls is _BucketRing:
+                    kind, value = snapshot.RING, (value.last, array("q", value.counts))
+                else:
+                    plain = snapshot.PLAIN_KINDS.get(cls)
+                    if plain is None or (
+                        plain == snapshot.INT
+                        and not snapshot.INT64_MIN <= value <= snapshot.INT64_MAX
+                    ):
+                        continue
+                    kind = plain
+            section = sections.get(kind)
+            if section is None:
+                section = sections[kind] = ([], [])
+            section[0].append(key)
+            section[1].append(value)
+            expires_at = expires.get(key)
+            if expires_at is not None:
+                expiry[key] = expires_at
+
+    def restore(
+        self,
+        sections: Dict[int, Tuple[List[str], List[float], list]],
+        replace: bool,
+    ):
+        """
+        Add entries read from a snapshot, as (keys, expiry times latest
+        first, values) by kind. With `replace`, existing keys of the same
+        name are deleted first.
+        """
+        for kind, (keys, expiry, values) in sections.items():
+            if replace:
+                for key in self.data.keys() & keys | self.sorted_sets.keys() & keys:
+                    self.delete(key)
+
+            if kind == snapshot.LOG:
+                self.sorted_sets.update(zip(keys, map(_TimestampLog, values)))
+            else:
+                entries: Iterable[Any] = values
+                if kind == snapshot.BUCKET:
+                    entries = starmap(_Bucket, values)
+                elif kind == snapshot.RING:
+                    entries = starmap(_BucketRing.restored, values)
+                self.data.update(zip(keys, entries))
+
+            # Keys without an expiry time (inf) come first
+            timed = bisect.bisect_right(expiry, -math.inf, key=lambda e: -e)
+            self.expiry.update(zip(keys[timed:], expiry[timed:]))
+            self.heap.extend(zip(expiry[timed:], keys[timed:]))
+            if self.recent is not None:
+                self.recent.update(dict.fromkeys(keys))
+
+        heapq.heapify(self.heap)
+        if self.max_keys is not None:
+            self.evict_to(self.max_keys)
+
+    def sweep(self, now: float, limit: Optional[int] = SWEEP_BATCH) -> int:
+        """
+        Pop up to `limit` due heap entries (all of them if limit is None) and
+        delete the keys that really expired. Returns the number deleted.
+        """
+        removed = 0
+        popped = 0
+        heap = self.heap
+        while heap and heap[0][0] <= now and (limit is None or popped < limit):
+            popped += 1
+            _, key = heapq.heappop(heap)
+            actual = self.expiry.get(key)
+            if actual is None:
+                continue
+            if actual > now:
+                heapq.heappush(heap, (actual, key))
+                continue
+            self.delete(key)
+            removed += 1
+        self.expired_count += removed
+        return removed
+
+
+class InMemoryStorage(Storage):
+    """
+    Thread-safe in-process storage.
+
+    By default every key lives behind a single lock. With stripes > 1 the
+    keyspace is split by key hash into independent stripes, each with its own
+    lock and maps, so threads working on different keys rarely contend.
+
+    Expired keys are removed actively: every write sweeps a bounded number of
+    keys off an expiry heap, so keys that are never read again (old windows,
+    departed clients) do not accumulate. With max_keys set, creating a key
+    beyond the cap first evicts the least recently used key ("lru") or the
+    key closest to expiring ("ttl"). The cap is split evenly over stripes.
+
+    Snapshots: with snapshot_path set, state is loaded from that file at
+    startup (if it exists) and saved to it by close(), which also runs at
+    interpreter exit, and every snapshot_interval seconds by a background
+    thread if set. Saving holds each stripe's lock only while its entries
+    are copied; encoding and writing run outside the locks, and the file is
+    replaced atomically. Loading skips entries that expired in between.
+    Decisions made after the last snapshot are lost if the process dies
+    without close(); values other than numbers, strings, bytes and the
+    algorithms' own state are not saved.
+    """
+
+    def __init__(
+        self,
+        stripes: int = 1,
+        max_keys: Optional[int] = None,
+        eviction: str = "lru",
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: Optional[float] = None,
+    ):
+        if stripes < 1:
+            raise ValueError("stripes must be at least 1")
+        if max_keys is not None and max_keys < 1:
+            raise ValueError("max_keys must be at least 1")
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"eviction must be one of {EVICTION_POLICIES}")
+        if snapshot_interval is not None:
+            if snapshot_path is None:
+                raise ValueError("snapshot_interval requires snapshot_path")
+            if snapshot_interval <= 0:
+                raise ValueError("snapshot_interval must be positive")
+
+        per_stripe = math.ceil(max_keys / stripes) if max_keys is not None else None
+        self._stripes = [_Stripe(per_stripe, eviction) for _ in range(stripes)]
+
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._snapshotter: Optional[threading.Thread] = None
+        if snapshot_path is not None:
+            if os.path.exists(snapshot_path):
+                self.load_snapshot()
+            # A weak reference, so the hook does not keep the storage alive
+            self._exit_hook = partial(_close_at_exit, weakref.ref(self))
+            atexit.register(self._exit_hook)
+            if snapshot_interval is not None:
+                self._snapshotter = threading.Thread(
+                    target=self._snapshot_loop,
+                    name="gatekeeper-memory-snapshot",
+                    daemon=True,
+                )
+                self._snapshotter.start()
+
+    def _stripe(self, key: str) -> _Stripe:
+        stripes = self._stripes
+        if len(stripes) == 1:
+            return stripes[0]
+        return stripes[hash(key) % len(stripes)]
+
+    @contextmanager
+    def _hold(self, *keys: str) -> Iterator[None]:
+        """Hold the stripes of `keys`, in stripe order like batch()."""
+        stripes = self._stripes
+        if len(stripes) == 1:
+            with stripes[0].lock:
+                yield
+            return
+        indexes = sorted({hash(key) % len(stripes) for key in keys})
+        with ExitStack() as stack:
+            for index in indexes:
+                stack.enter_context(stripes[index].lock)
+            yield
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        if len(self._stripes) == 1:
+            with self._stripes[0].lock:
+                yield
+            return
+
+        # Keys of a batch are not known up front, so hold every stripe.
+        # Locks are always taken in the same order to avoid deadlocks.
+        with ExitStack() as stack:
+            for stripe in self._stripes:
+                stack.enter_context(stripe.lock)
+            yield
+
+    def purge_expired(self) -> int:
+        """Remove every expired key now. Returns the number removed."""
+        removed = 0
+        now = time.time()
+        for stripe in self._stripes:
+            with stripe.lock:
+                removed += stripe.sweep(now, limit=None)
+        return removed
+
+    def save_snapshot(self, path: Optional[str] = None) -> int:
+        """
+        Write every live entry to `path` (snapshot_path by default), replacing
+        the file atomically. Returns the number of entries written.
+        """
+        path = path or self.snapshot_path
+        if path is None:
+            raise ValueError("no snapshot path given")
+        with self._snapshot_lock:
+            expiry: Dict[str, float] = {}
+            sections: Dict[int, snapshot.Section] = {}
+            for stripe in self._stripes:
+                with stripe.lock:
+                    keys = [*stripe.data, *stripe.sorted_sets]
+                # A bounded pause per lock hold, whatever the key count
+                for i in range(0, len(keys), SNAPSHOT_CHUNK):
+                    with stripe.lock:
+                        stripe.copy_entries(
+                            keys[i : i + SNAPSHOT_CHUNK], sections, expiry
+                        )
+            return snapshot.write_snapshot(path, sections, expiry, time.time())
+
+    def load_snapshot(self, path: Optional[str] = None) -> int:
+        """
+        Add the entries of a snapshot that have not expired yet, replacing
+        keys of the same name. Returns the number of entries loaded.
+        """
+        path = path or self.snapshot_path
+        if path is None:
+            raise ValueError("no snapshot path given")
+        stripes = self._stripes
+        with _gc_paused():
+            sections = snapshot.read_snapshot(path, time.time())
+            if len(stripes) == 1:
+                parts = [sections]
+            else:
+                # Stripes are picked by hash(), which differs between runs
+                parts = [{} for _ in stripes]
+                for kind, (keys, expiry, values) in sections.items():
+                    for key, expires_at, value in zip(keys, expiry, values):
+                        part = parts[hash(key) % len(stripes)]
+                        if kind not in part:
+                            part[kind] = ([], [], [])
+                        columns = part[kind]
+                        columns[0].append(key)
+                        columns[1].append(expires_at)
+                        columns[2].append(value)
+            for stripe, part in zip(stripes, parts):
+                with stripe.lock:
+                    stripe.restore(part, replace=len(stripe) > 0)
+        return sum(len(keys) for keys, _, _ in sections.values())
+
+    def close(self):
+        """Stop periodic snapshots and write a final snapshot, if configured."""
+        if self.snapshot_path is None or self._closed.is_set():
+            return
+        self._closed.set()
+        atexit.unregister(self._exit_hook)
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        self.save_snapshot()
+
+    def _snapshot_loop(self):
+        while not self._closed.wait(self.snapshot_interval):
+            try:
+                self.save_snapshot()
+            except OSError:
+                # Retried at the next interval
+                logger.exception("Could not write snapshot %s", self.snapshot_path)
+
+    def stats(self) -> Dict[str, int]:
+        """Current key count and how many keys were expired or evicted."""
+        totals = {"keys": 0, "expired_keys": 0, "evicted_keys": 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                totals["keys"] += len(stripe)
+                totals["expired_keys"] += stripe.expired_count
+                totals["evicted_keys"] += stripe.evicted_count
+        return totals
 
     def get(self, key: str) -> Optional[Any]:
-        with self._lock:
-            if self._is_expired(key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            if stripe.is_expired(key):
                 return None
-            return self._data.get(key)
+            if key not in stripe.data:
+                return None
+            stripe.touch(key)
+            return stripe.data[key]
 
     def set(self, key: str, value: Any, expiry: Optional[int] = None):
-        with self._lock:
-            self._data[key] = value
+        stripe = self._stripe(key)
+        with stripe.lock:
+            now = time.time()
+            stripe.sweep(now)
+            stripe.reserve(key)
+            stripe.data[key] = value
+            stripe.touch(key)
             if expiry:
-                self._expiry[key] = time.time() + expiry
-            elif key in self._expiry:
-                del self._expiry[key]
+                stripe.set_expiry(key, now + expiry)
+            elif key in stripe.expiry:
+                del stripe.expiry[key]
 
     def incr(self, key: str, amount: int = 1, expiry: Optional[int] = None) -> int:
-        with self._lock:
-            if self._is_expired(key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            now = time.time()
+            stripe.sweep(now)
+            if stripe.is_expired(key):
                 # Expired means it's gone
                 pass
+            stripe.reserve(key)
 
-            val = self._data.get(key, 0)
+            val = stripe.data.get(key, 0)
             if not isinstance(val, int):
                 val = 0
 
             new_val = val + amount
-            self._data[key] = new_val
+            stripe.data[key] = new_val
+            stripe.touch(key)
 
             if expiry:
-                self._expiry[key] = time.time() + expiry
+                stripe.set_expiry(key, now + expiry)
 
             return new_val
 
     def add_timestamp(self, key: str, timestamp: float, expiry: Optional[int] = None):
-        with self._lock:
-            self._is_expired(key)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            now = time.time()
+            stripe.sweep(now)
+            stripe.is_expired(key)
+            stripe.reserve(key)
 
-            if key not in self._sorted_sets:
-                self._sorted_sets[key] = []
+            log = stripe.sorted_sets.get(key)
+            if log is None:
+                log = stripe.sorted_sets[key] = _TimestampLog()
 
-            self._sorted_sets[key].append(timestamp)
-            # Assuming timestamps are added in order usually, but sort to be safe
-            self._sorted_sets[key].sort()
+            log.add(timestamp)
+            stripe.touch(key)
 
             if expiry:
-                self._expiry[key] = time.time() + expiry
+                stripe.set_expiry(key, now + expiry)
 
     def count_timestamps(self, key: str, start: float, end: float) -> int:
-        with self._lock:
-            if self._is_expired(key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            if stripe.is_expired(key):
                 return 0
 
-            timestamps = self._sorted_sets.get(key, [])
-            return sum(1 for t in timestamps if start <= t <= end)
+            log = stripe.sorted_sets.get(key)
+            if log is None:
+                return 0
+            stripe.touch(key)
+            return log.count(start, end)
 
     def remove_timestamps(self, key: str, max_timestamp: float):
-        with self._lock:
-            if self._is_expired(key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            if stripe.is_expired(key):
                 return
 
-            if key in self._sorted_sets:
-                self._sorted_sets[key] = [
-                    t for t in self._sorted_sets[key] if t > max_timestamp
-                ]
+            log = stripe.sorted_sets.get(key)
+            if log is not None:
+                log.trim(max_timestamp)
+
+    def timestamp_at(self, key: str, index: int) -> Optional[float]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            if stripe.is_expired(key):
+                return None
+
+            log = stripe.sorted_sets.get(key)
+            return log.at(index) if log is not None else None
+
+    def _bucket(self, stripe: _Stripe, key: str) -> Optional[_Bucket]:
+        if stripe.is_expired(key):
+            return None
+        bucket = stripe.data.get(key)
+        return bucket if isinstance(bucket, _Bucket) else None
+
+    def _save_bucket(
+        self,
+        stripe: _Stripe,
+        key: str,
+        bucket: Optional[_Bucket],
+        level: float,
+        now: float,
+        expires_at: Optional[float],
+    ):
+        if bucket is None:
+            stripe.reserve(key)
+            bucket = stripe.data[key] = _Bucket(level, now)
+        else:
+            bucket.level, bucket.ts = level, now
+        stripe.touch(key)
+        if expires_at is not None:
+            stripe.set_expiry(key, expires_at)
+        else:
+            stripe.expiry.pop(key, None)
+
+    def token_bucket_consume(
+        self, key: str, capacity: float, refill_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.sweep(now)
+            bucket = self._bucket(stripe, key)
+            tokens = capacity
+            if bucket is not None:
+                delta = max(0, now - bucket.ts)
+                tokens = min(capacity, bucket.level + delta * refill_rate)
+            if tokens < cost:
+                return False, tokens
+
+            tokens -= cost
+            # Idle for capacity / rate, any bucket is full again
+            expires_at = now + capacity / refill_rate if refill_rate > 0 else None
+            self._save_bucket(stripe, key, bucket, tokens, now, expires_at)
+            return True, tokens
+
+    def leaky_bucket_add(
+        self, key: str, capacity: float, leak_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.sweep(now)
+            bucket = self._bucket(stripe, key)
+            level = 0.0
+            if bucket is not None:
+                delta = max(0, now - bucket.ts)
+                level = max(0.0, bucket.level - delta * leak_rate)
+            if level + cost > capacity:
+                return False, level
+
+            level += cost
+            # Idle for capacity / rate, any bucket has drained
+            expires_at = now + capacity / leak_rate if leak_rate > 0 else None
+            self._save_bucket(stripe, key, bucket, level, now, expires_at)
+            return True, level
+
+    def sliding_counter_add(
+        self,
+        key: str,
+        prev_key: str,
+        weight: float,
+        limit: int,
+        cost: int,
+        expiry: int,
+    ) -> Tuple[bool, int, int]:
+        stripe = self._stripe(key)
+        prev_stripe = self._stripe(prev_key)
+        with self._hold(key, prev_key):
+            now = time.time()
+            stripe.sweep(now)
+            counts = []
+            for owner, name in ((stripe, key), (prev_stripe, prev_key)):
+                value = None if owner.is_expired(name) else owner.data.get(name)
+                counts.append(value if isinstance(value, int) else 0)
+            curr, prev = counts
+
+            granted = curr + prev * weight + cost - 1 < limit
+            if granted:
+                stripe.reserve(key)
+                stripe.data[key] = curr + cost
+                stripe.touch(key)
+                stripe.set_expiry(key, now + expiry)
+            return granted, curr, prev
+
+    def sliding_log_add(
+        self, key: str, now: float, window: int, limit: int, cost: int
+    ) -> Tuple[bool, int, Optional[float]]:
+        window_start = now - window
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.sweep(now)
+            stripe.is_expired(key)
+            log = stripe.sorted_sets.get(key)
+            count = 0
+            if log is not None:
+                log.trim(window_start)
+                # Entries past `now` count too: another thread may have
+                # read the clock later but taken the lock first
+                count = len(log)
+
+            if count + cost <= limit:
+                if cost:
+                    if log is None:
+                        stripe.reserve(key)
+                        log = stripe.sorted_sets[key] = _TimestampLog()
+                    for _ in range(cost):
+                        log.add(now)
+                    stripe.touch(key)
+                    stripe.set_expiry(key, now + window)
+                return True, count, None
+            if cost > limit or log is None:
+                return False, count, None
+            return False, count, log.at(count + cost - limit - 1)
+
+    def bucket_ring_add(
+        self,
+        key: str,
+        buckets: int,
+        bucket: int,
+        limit: int,
+        cost: int,
+        expiry: float,
+    ) -> Tuple[bool, List[int]]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            now = time.time()
+            stripe.sweep(now)
+            stripe.is_expired(key)
+
+            ring = stripe.data.get(key)
+            if not isinstance(ring, _BucketRing) or len(ring.counts) != buckets:
+                stripe.reserve(key)
+                ring = stripe.data[key] = _BucketRing(buckets)
+
+            granted, ring.last, window = ring_add(
+                ring.counts, ring.last, bucket, limit, cost
+            )
+            stripe.touch(key)
+            stripe.set_expiry(key, now + expiry)
+            return granted, window
+
+    def gcra_consume(
+        self, key: str, increment: float, burst_offset: float, now: float
+    ) -> Tuple[bool, float]:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.sweep(now)
+            data = stripe.data
+            stored = data.get(key)
+            # An expired TAT is behind the clock, so max() discards it
+            tat = stored if stored is not None and stored > now else now
+            new_tat = tat + increment
+            if new_tat - burst_offset > now:
+                return False, tat
+
+            if stored is None:
+                stripe.reserve(key)
+            data[key] = new_tat
+            stripe.touch(key)
+            stripe.set_expiry(key, new_tat)
+            return True, new_tat
+
+
+def _close_at_exit(ref: "weakref.ref[InMemoryStorage]"):
+    storage = ref()
+    if storage is not None:
+        storage.close()
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    Hold off the cyclic garbage collector, which would otherwise traverse
+    the whole heap again and again while millions of objects are created.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
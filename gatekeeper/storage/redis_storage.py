@@ -1,11 +1,301 @@
-from typing import Optional, Any, List
+import math
+from typing import Optional, Any, Iterator, List, Tuple
 import redis
+from redis.cluster import RedisCluster
+from redis.exceptions import NoScriptError
 from .base import Storage
+from ..keys import KeyEncoder
+from .scripts import script_sha
+
+# Algorithm-level operations as Lua functions of (KEYS, ARGV). Each one is
+# both its storage operation's script and the core of the matching limiter's
+# script, which only turns the result into a decision, so the two always
+# agree on key layout and state.
+
+# KEYS[1]: hash {tokens, ts}, expiring once the bucket is full again (a
+# missing key reads as a full bucket). KEYS[2] and KEYS[3], when given, are
+# the two plain keys used by earlier versions; state found there is moved
+# into the hash on first use. ARGV: capacity, refill rate, now, cost.
+# Returns whether the cost was taken and the tokens left.
+TOKEN_BUCKET_CONSUME = """
+local function token_bucket_consume(KEYS, ARGV)
+    local key = KEYS[1]
+    local capacity = tonumber(ARGV[1])
+    local refill_rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local requested = tonumber(ARGV[4])
+
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local last_tokens = tonumber(state[1])
+    local last_ts = tonumber(state[2])
+    local migrated = false
+    if last_tokens == nil and #KEYS > 1 then
+        last_tokens = tonumber(redis.call('GET', KEYS[2]))
+        if last_tokens ~= nil then
+            last_ts = tonumber(redis.call('GET', KEYS[3]))
+            redis.call('DEL', KEYS[2], KEYS[3])
+            migrated = true
+        end
+    end
+    if last_tokens == nil then
+        last_tokens = capacity
+    end
+    if last_ts == nil then
+        last_ts = now
+    end
+
+    local delta = math.max(0, now - last_ts)
+    local tokens = math.min(capacity, last_tokens + (delta * refill_rate))
+
+    local function save(value)
+        if refill_rate <= 0 then
+            redis.call('HSET', key, 'tokens', string.format('%.17g', value), 'ts', ARGV[3])
+            return
+        end
+        local ttl_ms = math.ceil((capacity - value) / refill_rate * 1000)
+        if ttl_ms <= 0 then
+            redis.call('DEL', key)
+            return
+        end
+        redis.call('HSET', key, 'tokens', string.format('%.17g', value), 'ts', ARGV[3])
+        redis.call('PEXPIRE', key, ttl_ms)
+    end
+
+    if tokens >= requested then
+        tokens = tokens - requested
+        save(tokens)
+        return true, tokens
+    end
+    if migrated then
+        save(tokens)
+    end
+    return false, tokens
+end
+"""
+
+TOKEN_BUCKET_CONSUME_SCRIPT = (
+    TOKEN_BUCKET_CONSUME
+    + """
+local taken, tokens = token_bucket_consume(KEYS, ARGV)
+return {taken and 1 or 0, string.format('%.17g', tokens)}
+"""
+)
+
+# KEYS[1]: hash {level, ts}, expiring once the bucket has drained (a missing
+# key reads as an empty bucket); KEYS[2] and KEYS[3] as for the token
+# bucket. ARGV: capacity, leak rate, now, cost. Returns whether the cost was
+# added and the level after leaking (and adding).
+LEAKY_BUCKET_ADD = """
+local function leaky_bucket_add(KEYS, ARGV)
+    local key = KEYS[1]
+    local capacity = tonumber(ARGV[1])
+    local leak_rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local amount = tonumber(ARGV[4])
+
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local last_level = tonumber(state[1])
+    local last_ts = tonumber(state[2])
+    local migrated = false
+    if last_level == nil and #KEYS > 1 then
+        last_level = tonumber(redis.call('GET', KEYS[2]))
+        if last_level ~= nil then
+            last_ts = tonumber(redis.call('GET', KEYS[3]))
+            redis.call('DEL', KEYS[2], KEYS[3])
+            migrated = true
+        end
+    end
+    if last_level == nil then
+        last_level = 0
+    end
+    if last_ts == nil then
+        last_ts = now
+    end
+
+    local delta = math.max(0, now - last_ts)
+    local level = math.max(0, last_level - delta * leak_rate)
+
+    local function save(value)
+        if leak_rate <= 0 then
+            redis.call('HSET', key, 'level', string.format('%.17g', value), 'ts', ARGV[3])
+            return
+        end
+        local ttl_ms = math.ceil(value / leak_rate * 1000)
+        if ttl_ms <= 0 then
+            redis.call('DEL', key)
+            return
+        end
+        redis.call('HSET', key, 'level', string.format('%.17g', value), 'ts', ARGV[3])
+        redis.call('PEXPIRE', key, ttl_ms)
+    end
+
+    if level + amount <= capacity then
+        level = level + amount
+        save(level)
+        return true, level
+    end
+    if migrated then
+        save(level)
+    end
+    return false, level
+end
+"""
+
+LEAKY_BUCKET_ADD_SCRIPT = (
+    LEAKY_BUCKET_ADD
+    + """
+local added, level = leaky_bucket_add(KEYS, ARGV)
+return {added and 1 or 0, string.format('%.17g', level)}
+"""
+)
+
+# KEYS: current and previous window counters. ARGV: weight of the previous
+# window, limit, expiry in seconds, cost. Returns whether the cost was added
+# to the current window and both counts before.
+SLIDING_COUNTER_ADD = """
+local function sliding_counter_add(KEYS, ARGV)
+    local curr = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+    local cost = tonumber(ARGV[4])
+    if curr + prev * tonumber(ARGV[1]) + cost - 1 < tonumber(ARGV[2]) then
+        redis.call('INCRBY', KEYS[1], cost)
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        return true, curr, prev
+    end
+    return false, curr, prev
+end
+"""
+
+SLIDING_COUNTER_ADD_SCRIPT = (
+    SLIDING_COUNTER_ADD
+    + """
+local added, curr, prev = sliding_counter_add(KEYS, ARGV)
+return {added and 1 or 0, curr, prev}
+"""
+)
+
+# KEYS[1]: sorted set of timestamps. ARGV: now, window start, limit, window,
+# cost. Returns whether the entries were added, the count before, and for a
+# denial the score of the entry that has to leave the window first.
+SLIDING_LOG_ADD = """
+local function sliding_log_add(KEYS, ARGV)
+    local key = KEYS[1]
+    local limit, cost = tonumber(ARGV[3]), tonumber(ARGV[5])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', ARGV[2])
+    local count = redis.call('ZCARD', key)
+    if count + cost <= limit then
+        -- Members must be unique: suffix the raw timestamp with its position
+        -- in the window, which differs between calls sharing a timestamp
+        for i = 1, cost do
+            redis.call('ZADD', key, ARGV[1], ARGV[1] .. ':' .. (count + i))
+        end
+        if cost > 0 then
+            redis.call('EXPIRE', key, ARGV[4])
+        end
+        return true, count
+    end
+    if cost > limit then
+        return false, count
+    end
+    local index = count + cost - limit - 1
+    local oldest = redis.call('ZRANGE', key, index, index, 'WITHSCORES')
+    return false, count, oldest[2]
+end
+"""
+
+SLIDING_LOG_ADD_SCRIPT = (
+    SLIDING_LOG_ADD
+    + """
+local added, count, oldest = sliding_log_add(KEYS, ARGV)
+return {added and 1 or 0, count, oldest}
+"""
+)
+
+# KEYS[1]: hash of absolute bucket index to count. At most `buckets` live
+# fields (plus stale ones, deleted here), so work is O(K). ARGV: buckets,
+# current bucket, limit, cost, expiry in ms. Returns whether the cost was
+# added, the window's counts oldest first, and their total.
+BUCKET_RING_ADD = """
+local function bucket_ring_add(KEYS, ARGV)
+    local key = KEYS[1]
+    local buckets, bucket = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local limit, cost = tonumber(ARGV[3]), tonumber(ARGV[4])
+    local oldest = bucket - buckets + 1
+    local counts, total, stale = {}, 0, {}
+    for i = 1, buckets do
+        counts[i] = 0
+    end
+    local raw = redis.call('HGETALL', key)
+    for i = 1, #raw, 2 do
+        local b = tonumber(raw[i])
+        if b < oldest then
+            table.insert(stale, raw[i])
+        else
+            -- Buckets ahead of this clock count as the newest one
+            local offset = math.min(b - oldest, buckets - 1) + 1
+            local c = tonumber(raw[i + 1])
+            counts[offset] = counts[offset] + c
+            total = total + c
+        end
+    end
+    if #stale > 0 then
+        redis.call('HDEL', key, unpack(stale))
+    end
+    if total + cost > limit then
+        return false, counts, total
+    end
+    redis.call('HINCRBY', key, ARGV[2], cost)
+    redis.call('PEXPIRE', key, ARGV[5])
+    counts[buckets] = counts[buckets] + cost
+    return true, counts, total + cost
+end
+"""
+
+BUCKET_RING_ADD_SCRIPT = (
+    BUCKET_RING_ADD
+    + """
+local added, counts = bucket_ring_add(KEYS, ARGV)
+return {added and 1 or 0, counts}
+"""
+)
+
+# KEYS[1]: the theoretical arrival time (TAT), expiring once it falls behind
+# the clock. ARGV: emission interval, burst offset, cost, now. Returns
+# whether the request conforms and the TAT (advanced if it does).
+GCRA_CONSUME = """
+local function gcra_consume(KEYS, ARGV)
+    local now = tonumber(ARGV[4])
+    local tat = tonumber(redis.call('GET', KEYS[1]))
+    if tat == nil or tat < now then
+        tat = now
+    end
+    local new_tat = tat + tonumber(ARGV[1]) * tonumber(ARGV[3])
+    if new_tat - tonumber(ARGV[2]) > now then
+        return false, tat
+    end
+    local ttl_ms = math.max(1, math.ceil((new_tat - now) * 1000))
+    redis.call('SET', KEYS[1], string.format('%.17g', new_tat), 'PX', ttl_ms)
+    return true, new_tat
+end
+"""
+
+GCRA_CONSUME_SCRIPT = (
+    GCRA_CONSUME
+    + """
+local consumed, tat = gcra_consume(KEYS, ARGV)
+return {consumed and 1 or 0, string.format('%.17g', tat)}
+"""
+)
 
 
 class RedisStorage(Storage):
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(
+        self, redis_client: redis.Redis, key_encoder: Optional[KeyEncoder] = None
+    ):
         self.redis = redis_client
+        self.cross_slot_scripts = not isinstance(redis_client, RedisCluster)
+        # Limiters on this storage build their keys with it (see gatekeeper.keys)
+        self.key_encoder = key_encoder
 
     def get(self, key: str) -> Optional[Any]:
         val = self.redis.get(key)
@@ -37,7 +327,108 @@ class RedisStorage(Storage):
     def remove_timestamps(self, key: str, max_timestamp: float):
         self.redis.zremrangebyscore(key, "-inf", max_timestamp)
 
+    def timestamp_at(self, key: str, index: int) -> Optional[float]:
+        entries = self.redis.zrange(key, index, index, withscores=True)
+        return float(entries[0][1]) if entries else None
+
+    def token_bucket_consume(
+        self, key: str, capacity: float, refill_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        granted, tokens = self.execute_lua(
+            TOKEN_BUCKET_CONSUME_SCRIPT, [key], [capacity, refill_rate, now, cost]
+        )
+        return bool(granted), float(tokens)
+
+    def leaky_bucket_add(
+        self, key: str, capacity: float, leak_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        granted, level = self.execute_lua(
+            LEAKY_BUCKET_ADD_SCRIPT, [key], [capacity, leak_rate, now, cost]
+        )
+        return bool(granted), float(level)
+
+    def sliding_counter_add(
+        self,
+        key: str,
+        prev_key: str,
+        weight: float,
+        limit: int,
+        cost: int,
+        expiry: int,
+    ) -> Tuple[bool, int, int]:
+        granted, curr, prev = self.execute_lua(
+            SLIDING_COUNTER_ADD_SCRIPT, [key, prev_key], [weight, limit, expiry, cost]
+        )
+        return bool(granted), curr, prev
+
+    def sliding_log_add(
+        self, key: str, now: float, window: int, limit: int, cost: int
+    ) -> Tuple[bool, int, Optional[float]]:
+        result = self.execute_lua(
+            SLIDING_LOG_ADD_SCRIPT, [key], [now, now - window, limit, window, cost]
+        )
+        oldest = float(result[2]) if len(result) > 2 else None
+        return bool(result[0]), result[1], oldest
+
+    def bucket_ring_add(
+        self,
+        key: str,
+        buckets: int,
+        bucket: int,
+        limit: int,
+        cost: int,
+        expiry: float,
+    ) -> Tuple[bool, List[int]]:
+        granted, window = self.execute_lua(
+            BUCKET_RING_ADD_SCRIPT,
+            [key],
+            [buckets, bucket, limit, cost, math.ceil(expiry * 1000)],
+        )
+        return bool(granted), window
+
+    def gcra_consume(
+        self, key: str, increment: float, burst_offset: float, now: float
+    ) -> Tuple[bool, float]:
+        granted, tat = self.execute_lua(
+            GCRA_CONSUME_SCRIPT, [key], [increment, burst_offset, 1, now]
+        )
+        return bool(granted), float(tat)
+
+    def scan_keys(self, pattern: str, type: Optional[str] = None) -> Iterator[str]:
+        """Iterate over the keys matching `pattern` (optionally of one type)."""
+        for name in self.redis.scan_iter(match=pattern, count=1000, _type=type):
+            yield name.decode("utf-8") if isinstance(name, bytes) else name
+
     def execute_lua(self, script: str, keys: List[str], args: List[Any]) -> Any:
-        # Register script is efficient but Eval is easier for dynamic.
-        # Redis-py handles eval caching usually?
-        return self.redis.eval(script, len(keys), *keys, *args)
+        # Call the cached script by SHA. After a restart or failover the
+        # script cache is empty: EVAL runs it and caches it again.
+        try:
+            return self.redis.evalsha(script_sha(script), len(keys), *keys, *args)
+        except NoScriptError:
+            return self.redis.eval(script, len(keys), *keys, *args)
+
+    def execute_lua_many(
+        self, script: str, calls: List[Tuple[List[str], List[Any]]]
+    ) -> List[Any]:
+        # Non-transactional pipeline: every call is still atomic on its own,
+        # but the whole batch costs one network round trip.
+        sha = script_sha(script)
+        pipe = self.redis.pipeline(transaction=False)
+        for keys, args in calls:
+            pipe.evalsha(sha, len(keys), *keys, *args)
+        results = pipe.execute(raise_on_error=False)
+
+        missing = [i for i, r in enumerate(results) if isinstance(r, NoScriptError)]
+        if missing:
+            # Calls that hit NOSCRIPT did not run; replay just those with EVAL
+            pipe = self.redis.pipeline(transaction=False)
+            for i in missing:
+                keys, args = calls[i]
+                pipe.eval(script, len(keys), *keys, *args)
+            for i, result in zip(missing, pipe.execute(raise_on_error=False)):
+                results[i] = result
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
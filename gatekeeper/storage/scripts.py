@@ -0,0 +1,11 @@
+import hashlib
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def script_sha(script: str) -> str:
+    """
+    SHA1 digest Redis uses to identify a cached script (EVALSHA).
+    Computed once per script source.
+    """
+    return hashlib.sha1(script.encode("utf-8")).hexdigest()
@@ -0,0 +1,184 @@
+import bisect
+import hashlib
+import itertools
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+import redis
+from .base import Storage
+from ..keys import KeyEncoder
+from .redis_storage import RedisStorage
+
+# Points per node on the hash ring; more points even out the key spread
+DEFAULT_REPLICAS = 160
+
+
+def hash_tag(key: str) -> str:
+    """
+    The part of `key` Redis Cluster hashes: the text between the first `{`
+    and the next `}` if it is not empty, else the whole key.
+    """
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1 : end]
+    return key
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class ShardedRedisStorage(Storage):
+    """
+    Client-side sharding over independent Redis nodes.
+
+    Keys are placed on a consistent hash ring by their hash tag, so all keys
+    of one client (which limiters tag with the client key) live on the same
+    node and scripts run there unchanged. Adding or removing a node moves
+    only about 1/N of the clients.
+
+    `nodes` is a list of clients, named by host:port/db, or a mapping of
+    stable node names to clients. Names place the nodes on the ring: keep
+    them when a node's address changes, or its clients move elsewhere.
+    """
+
+    cross_slot_scripts = False
+
+    def __init__(
+        self,
+        nodes: Union[Sequence[redis.Redis], Mapping[str, redis.Redis]],
+        replicas: int = DEFAULT_REPLICAS,
+        key_encoder: Optional[KeyEncoder] = None,
+    ):
+        if not isinstance(nodes, Mapping):
+            named = {_node_name(client): client for client in nodes}
+            if len(named) != len(nodes):
+                raise ValueError(
+                    "nodes share an address; pass a mapping of names to clients"
+                )
+            nodes = named
+        if not nodes:
+            raise ValueError("at least one node is required")
+        self.key_encoder = key_encoder
+
+        self.nodes: Dict[str, RedisStorage] = {
+            name: RedisStorage(client) for name, client in nodes.items()
+        }
+        points = sorted(
+            (_ring_hash(f"{name}#{i}"), name)
+            for name in self.nodes
+            for i in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [self.nodes[name] for _, name in points]
+
+    def node_for(self, key: str) -> RedisStorage:
+        """The storage holding `key`."""
+        index = bisect.bisect(self._points, _ring_hash(hash_tag(key)))
+        return self._owners[index % len(self._owners)]
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.node_for(key).get(key)
+
+    def set(self, key: str, value: Any, expiry: Optional[int] = None):
+        self.node_for(key).set(key, value, expiry)
+
+    def incr(self, key: str, amount: int = 1, expiry: Optional[int] = None) -> int:
+        return self.node_for(key).incr(key, amount, expiry)
+
+    def add_timestamp(self, key: str, timestamp: float, expiry: Optional[int] = None):
+        self.node_for(key).add_timestamp(key, timestamp, expiry)
+
+    def count_timestamps(self, key: str, start: float, end: float) -> int:
+        return self.node_for(key).count_timestamps(key, start, end)
+
+    def remove_timestamps(self, key: str, max_timestamp: float):
+        self.node_for(key).remove_timestamps(key, max_timestamp)
+
+    def timestamp_at(self, key: str, index: int) -> Optional[float]:
+        return self.node_for(key).timestamp_at(key, index)
+
+    # Keys of one algorithm step share a hash tag, so one node runs it
+
+    def token_bucket_consume(
+        self, key: str, capacity: float, refill_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        return self.node_for(key).token_bucket_consume(
+            key, capacity, refill_rate, cost, now
+        )
+
+    def leaky_bucket_add(
+        self, key: str, capacity: float, leak_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        return self.node_for(key).leaky_bucket_add(key, capacity, leak_rate, cost, now)
+
+    def sliding_counter_add(
+        self,
+        key: str,
+        prev_key: str,
+        weight: float,
+        limit: int,
+        cost: int,
+        expiry: int,
+    ) -> Tuple[bool, int, int]:
+        return self.node_for(key).sliding_counter_add(
+            key, prev_key, weight, limit, cost, expiry
+        )
+
+    def sliding_log_add(
+        self, key: str, now: float, window: int, limit: int, cost: int
+    ) -> Tuple[bool, int, Optional[float]]:
+        return self.node_for(key).sliding_log_add(key, now, window, limit, cost)
+
+    def bucket_ring_add(
+        self,
+        key: str,
+        buckets: int,
+        bucket: int,
+        limit: int,
+        cost: int,
+        expiry: float,
+    ) -> Tuple[bool, List[int]]:
+        return self.node_for(key).bucket_ring_add(
+            key, buckets, bucket, limit, cost, expiry
+        )
+
+    def gcra_consume(
+        self, key: str, increment: float, burst_offset: float, now: float
+    ) -> Tuple[bool, float]:
+        return self.node_for(key).gcra_consume(key, increment, burst_offset, now)
+
+    def scan_keys(self, pattern: str, type: Optional[str] = None) -> Iterator[str]:
+        """Iterate over the keys matching `pattern` on every node."""
+        return itertools.chain.from_iterable(
+            node.scan_keys(pattern, type) for node in self.nodes.values()
+        )
+
+    def execute_lua(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        # Every key of a call shares the first key's hash tag
+        return self.node_for(keys[0]).execute_lua(script, keys, args)
+
+    def execute_lua_many(
+        self, script: str, calls: List[Tuple[List[str], List[Any]]]
+    ) -> List[Any]:
+        # One pipeline per node involved, results put back in call order
+        by_node: Dict[int, Tuple[RedisStorage, List[int]]] = {}
+        for i, (keys, _) in enumerate(calls):
+            node = self.node_for(keys[0])
+            by_node.setdefault(id(node), (node, []))[1].append(i)
+
+        results: List[Any] = [None] * len(calls)
+        for node, indices in by_node.values():
+            outcomes = node.execute_lua_many(script, [calls[i] for i in indices])
+            for i, outcome in zip(indices, outcomes):
+                results[i] = outcome
+        return results
+
+
+def _node_name(client: redis.Redis) -> str:
+    kwargs = client.connection_pool.connection_kwargs
+    if "path" in kwargs:
+        return f"{kwargs['path']}/{kwargs.get('db', 0)}"
+    return f"{kwargs.get('host', 'localhost')}:{kwargs.get('port', 6379)}/{kwargs.get('db', 0)}"
@@ -0,0 +1,713 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .base import Storage, ring_add
+
+try:
+    import fcntl
+
+    _HAVE_FCNTL = True
+except ImportError:  # pragma: no cover - not POSIX
+    _HAVE_FCNTL = False
+
+MAGIC = b"GKSHM\x00\x00\x01"
+
+# File layout: a header page, then `stripes` regions of slots_per_stripe
+# fixed-size slots each. The header holds the table shape and one used-slot
+# counter per stripe; byte-range locks on the header serialize each stripe
+# across processes.
+HEADER_SIZE = 4096
+_HEADER = struct.Struct("<8sIII")
+_USED_OFFSET = 1024
+_USED = struct.Struct("<I")
+_INIT_LOCK = 0
+_LOCK_BASE = 1
+MAX_STRIPES = (HEADER_SIZE - _USED_OFFSET) // _USED.size
+
+# Slot: state, kind, value length, key digest, expiry (0.0 = none), then the
+# value's first bytes. Longer values continue in chunk slots of the same
+# stripe, found under digests derived from the key's.
+_SLOT = struct.Struct("<BBxxI16sd")
+_EMPTY, _LIVE = 0, 1
+
+# Value kinds
+_INT, _FLOAT, _STR, _LOG, _RING, _BUCKET, _CHUNK = range(1, 8)
+_Q = struct.Struct("<q")
+_D = struct.Struct("<d")
+_DD = struct.Struct("<dd")
+# Marks a bucket ring that has not counted any bucket yet
+_NO_BUCKET = -(2**63)
+
+# Expired slots removed by the incremental sweep on each write
+SWEEP_BATCH = 4
+# Writes fail once a stripe is this full, even after sweeping
+MAX_LOAD = 0.9
+
+
+class _ThreadState(threading.local):
+    # Set while the thread holds every stripe in batch()
+    batch = False
+
+
+class SharedMemoryStorage(Storage):
+    """
+    Storage shared by the processes of one host through a memory-mapped
+    file, e.g. the workers of a gunicorn or uvicorn server.
+
+    Keys live in a fixed-size open-addressing hash table (linear probing,
+    backward-shift deletion) of `slots` slots of `slot_size` bytes, split
+    into `stripes` independently locked regions. Each operation holds its
+    key's stripe with a thread lock plus an fcntl byte-range lock, so
+    read-modify-write steps are atomic across threads and processes.
+
+    Keys are stored as 128-bit blake2b digests. Values up to
+    slot_size - 32 bytes take one slot; longer ones (timestamp logs, bucket
+    rings) continue in further slots of the same stripe.
+
+    The first process to open `path` creates the table; later ones (and
+    restarts) attach to it and use its shape, ignoring their own arguments.
+    Put the file on a RAM-backed filesystem such as /dev/shm. Expired keys
+    are swept a few slots per write. Writes raise RuntimeError once a
+    stripe is full even after sweeping, so size `slots` for the peak
+    number of live keys with headroom. POSIX only.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        slots: int = 1 << 16,
+        stripes: int = 16,
+        slot_size: int = 64,
+    ):
+        if not _HAVE_FCNTL:
+            raise RuntimeError("SharedMemoryStorage requires fcntl (POSIX)")
+        if not 1 <= stripes <= MAX_STRIPES:
+            raise ValueError(f"stripes must be between 1 and {MAX_STRIPES}")
+        if slots < stripes:
+            raise ValueError("slots must be at least stripes")
+        if slot_size < _SLOT.size + _DD.size or slot_size % 8:
+            raise ValueError(
+                f"slot_size must be a multiple of 8 and at least {_SLOT.size + _DD.size}"
+            )
+
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._attach(slots // stripes, stripes, slot_size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+        self._payload = self.slot_size - _SLOT.size
+        self._thread_locks = [threading.Lock() for _ in range(self.stripes)]
+        self._local = _ThreadState()
+        # Per-process sweep position in each stripe
+        self._cursors = [0] * self.stripes
+
+    def _attach(self, slots_per_stripe: int, stripes: int, slot_size: int):
+        fd = self._fd
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, _INIT_LOCK)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            if len(header) == _HEADER.size and header[:8] == MAGIC:
+                _, stripes, slots_per_stripe, slot_size = _HEADER.unpack(header)
+            elif header.strip(b"\x00"):
+                raise ValueError(f"{self.path} is not a SharedMemoryStorage file")
+            else:
+                size = HEADER_SIZE + stripes * slots_per_stripe * slot_size
+                os.ftruncate(fd, size)
+                os.pwrite(
+                    fd, _HEADER.pack(MAGIC, stripes, slots_per_stripe, slot_size), 0
+                )
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, _INIT_LOCK)
+
+        self.stripes = stripes
+        self.slots_per_stripe = slots_per_stripe
+        self.slot_size = slot_size
+        self._mm = mmap.mmap(fd, HEADER_SIZE + stripes * slots_per_stripe * slot_size)
+
+    def close(self):
+        """Unmap the table. The file and its data stay for other processes."""
+        self._mm.close()
+        os.close(self._fd)
+
+    # Locking
+
+    def _lock(self, stripe: int) -> bool:
+        if self._local.batch:
+            return False
+        self._thread_locks[stripe].acquire()
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, _LOCK_BASE + stripe)
+        return True
+
+    def _unlock(self, stripe: int, held: bool):
+        if held:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, _LOCK_BASE + stripe)
+            self._thread_locks[stripe].release()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        if self._local.batch:
+            yield
+            return
+        # Keys of a batch are not known up front, so hold every stripe: the
+        # thread locks in order, then all byte-range locks in one call
+        for lock in self._thread_locks:
+            lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.stripes, _LOCK_BASE)
+            self._local.batch = True
+            try:
+                yield
+            finally:
+                self._local.batch = False
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.stripes, _LOCK_BASE)
+        finally:
+            for lock in reversed(self._thread_locks):
+                lock.release()
+
+    # Hash table. Callers hold the stripe.
+
+    def _locate(self, key: str) -> Tuple[bytes, int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        return digest, int.from_bytes(digest[:8], "little") % self.stripes
+
+    def _home(self, digest: bytes) -> int:
+        h = int.from_bytes(digest[:8], "little") // self.stripes
+        return h % self.slots_per_stripe
+
+    def _base(self, stripe: int) -> int:
+        return HEADER_SIZE + stripe * self.slots_per_stripe * self.slot_size
+
+    def _probe(self, stripe: int, digest: bytes) -> Tuple[int, bool]:
+        """Offset of `digest`'s slot and True, or of the free slot and False."""
+        mm = self._mm
+        size = self.slot_size
+        base = self._base(stripe)
+        index = self._home(digest)
+        for _ in range(self.slots_per_stripe):
+            offset = base + index * size
+            if mm[offset] == _EMPTY:
+                return offset, False
+            if mm[offset + 8 : offset + 24] == digest:
+                return offset, True
+            index += 1
+            if index == self.slots_per_stripe:
+                index = 0
+        return -1, False
+
+    def _find(self, stripe: int, digest: bytes, now: float) -> int:
+        """Offset of the live slot for `digest`, or -1. Drops it if expired."""
+        offset, found = self._probe(stripe, digest)
+        if not found:
+            return -1
+        expiry = _D.unpack_from(self._mm, offset + 24)[0]
+        if expiry and now > expiry:
+            self._remove_entry(stripe, offset)
+            return -1
+        return offset
+
+    def _remove(self, stripe: int, offset: int):
+        """Empty a slot, shifting later slots of its probe run back."""
+        mm = self._mm
+        size = self.slot_size
+        n = self.slots_per_stripe
+        base = self._base(stripe)
+        hole = (offset - base) // size
+        j = hole
+        while True:
+            j = j + 1 if j + 1 < n else 0
+            j_offset = base + j * size
+            if mm[j_offset] == _EMPTY:
+                break
+            home = self._home(mm[j_offset + 8 : j_offset + 24])
+            # The entry may fill the hole unless its home lies in (hole, j]
+            if (j - home) % n >= (j - hole) % n:
+                mm[base + hole * size : base + (hole + 1) * size] = mm[
+                    j_offset : j_offset + size
+                ]
+                hole = j
+        hole_offset = base + hole * size
+        mm[hole_offset : hole_offset + size] = bytes(size)
+        self._add_used(stripe, -1)
+
+    def _remove_entry(self, stripe: int, offset: int):
+        """Remove a value's head slot and its chunk slots."""
+        mm = self._mm
+        _, kind, length, digest, _ = _SLOT.unpack_from(mm, offset)
+        if kind == _CHUNK:
+            self._remove(stripe, offset)
+            return
+        chunks = self._chunk_count(length)
+        self._remove(stripe, offset)
+        for k in range(1, chunks):
+            chunk_offset, found = self._probe(stripe, _chunk_digest(digest, k))
+            if found:
+                self._remove(stripe, chunk_offset)
+
+    def _chunk_count(self, length: int) -> int:
+        return max(1, -(-length // self._payload))
+
+    def _add_used(self, stripe: int, delta: int):
+        offset = _USED_OFFSET + stripe * _USED.size
+        _USED.pack_into(
+            self._mm, offset, _USED.unpack_from(self._mm, offset)[0] + delta
+        )
+
+    def _used(self, stripe: int) -> int:
+        return _USED.unpack_from(self._mm, _USED_OFFSET + stripe * _USED.size)[0]
+
+    def _read(
+        self, stripe: int, digest: bytes, now: float
+    ) -> Optional[Tuple[int, float, bytes, int]]:
+        """(kind, expiry, value bytes, slot offset) stored for `digest`, or None."""
+        offset = self._find(stripe, digest, now)
+        if offset < 0:
+            return None
+        mm = self._mm
+        _, kind, length, _, expiry = _SLOT.unpack_from(mm, offset)
+        payload = self._payload
+        start = offset + _SLOT.size
+        if length <= payload:
+            return kind, expiry, mm[start : start + length], offset
+
+        parts = [mm[start : start + payload]]
+        for k in range(1, self._chunk_count(length)):
+            chunk_offset, found = self._probe(stripe, _chunk_digest(digest, k))
+            if not found:
+                # A chunk was swept on its own: the value is gone
+                self._remove_entry(stripe, offset)
+                return None
+            part = min(payload, length - k * payload)
+            chunk_start = chunk_offset + _SLOT.size
+            parts.append(mm[chunk_start : chunk_start + part])
+        return kind, expiry, b"".join(parts), offset
+
+    def _write(
+        self,
+        stripe: int,
+        digest: bytes,
+        kind: int,
+        data: bytes,
+        expiry: float,
+        offset: int = -1,
+    ):
+        """
+        Store a value for `digest`. `offset` is its slot from a _read() under
+        the same lock, if any, which lets one-slot updates skip the probe.
+        """
+        mm = self._mm
+        payload = self._payload
+        if offset >= 0 and len(data) <= payload:
+            if _SLOT.unpack_from(mm, offset)[2] <= payload:
+                _SLOT.pack_into(mm, offset, _LIVE, kind, len(data), digest, expiry)
+                start = offset + _SLOT.size
+                mm[start : start + len(data)] = data
+                return
+
+        offset, found = self._probe(stripe, digest)
+        old_chunks = 0
+        if found:
+            old_chunks = self._chunk_count(_SLOT.unpack_from(mm, offset)[2])
+        chunks = self._chunk_count(len(data))
+
+        new_slots = chunks - old_chunks if found else chunks
+        if new_slots > 0:
+            self._reserve(stripe, new_slots)
+            # Sweeping may have moved or dropped the slot
+            offset, found = self._probe(stripe, digest)
+            if not found:
+                old_chunks = 0
+
+        for k in range(chunks):
+            part = data[k * payload : (k + 1) * payload]
+            if k == 0:
+                slot_digest, slot_kind, slot_offset, existed = (
+                    digest,
+                    kind,
+                    offset,
+                    found,
+                )
+            else:
+                slot_digest, slot_kind = _chunk_digest(digest, k), _CHUNK
+                slot_offset, existed = self._probe(stripe, slot_digest)
+            if not existed:
+                self._add_used(stripe, 1)
+            _SLOT.pack_into(
+                mm, slot_offset, _LIVE, slot_kind, len(data), slot_digest, expiry
+            )
+            start = slot_offset + _SLOT.size
+            mm[start : start + len(part)] = part
+
+        for k in range(chunks, old_chunks):
+            chunk_offset, existed = self._probe(stripe, _chunk_digest(digest, k))
+            if existed:
+                self._remove(stripe, chunk_offset)
+
+    def _reserve(self, stripe: int, slots: int):
+        limit = int(self.slots_per_stripe * MAX_LOAD)
+        if self._used(stripe) + slots <= limit:
+            return
+        self._sweep(stripe, time.time(), None)
+        if self._used(stripe) + slots > limit:
+            raise RuntimeError(
+                f"SharedMemoryStorage {self.path} is full: "
+                f"create it with more than {self.stripes * self.slots_per_stripe} slots"
+            )
+
+    def _sweep(
+        self, stripe: int, now: float, limit: Optional[int] = SWEEP_BATCH
+    ) -> int:
+        """
+        Check up to `limit` slots from this process's cursor (the whole
+        stripe if None) and drop the expired ones. Returns how many.
+        """
+        mm = self._mm
+        size = self.slot_size
+        n = self.slots_per_stripe
+        base = self._base(stripe)
+        index = self._cursors[stripe]
+        removed = 0
+        # Removals count against the budget too; a full pass may remove
+        # every used slot on top of visiting each index
+        budget = n + self._used(stripe) if limit is None else min(limit, n)
+        for _ in range(budget):
+            offset = base + index * size
+            if mm[offset] != _EMPTY:
+                expiry = _D.unpack_from(mm, offset + 24)[0]
+                if expiry and now > expiry:
+                    # The next slot of the run shifts into this one, so
+                    # check the same index again
+                    self._remove(stripe, offset)
+                    removed += 1
+                    continue
+            index = index + 1 if index + 1 < n else 0
+        self._cursors[stripe] = index
+        return removed
+
+    # Storage interface
+
+    def get(self, key: str) -> Optional[Any]:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            entry = self._read(stripe, digest, time.time())
+        finally:
+            self._unlock(stripe, held)
+        return None if entry is None else _decode(entry[0], entry[2])
+
+    def set(self, key: str, value: Any, expiry: Optional[int] = None):
+        kind, data = _encode(value)
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            now = time.time()
+            self._sweep(stripe, now)
+            self._write(stripe, digest, kind, data, now + expiry if expiry else 0.0)
+        finally:
+            self._unlock(stripe, held)
+
+    def incr(self, key: str, amount: int = 1, expiry: Optional[int] = None) -> int:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            now = time.time()
+            self._sweep(stripe, now)
+            entry = self._read(stripe, digest, now)
+            value, expires_at, offset = 0, 0.0, -1
+            if entry is not None:
+                expires_at, offset = entry[1], entry[3]
+                if entry[0] == _INT:
+                    value = _Q.unpack(entry[2])[0]
+            value += amount
+            if expiry:
+                expires_at = now + expiry
+            self._write(stripe, digest, _INT, _Q.pack(value), expires_at, offset)
+            return value
+        finally:
+            self._unlock(stripe, held)
+
+    def _log(self, stripe: int, digest: bytes, now: float) -> Tuple[array, float]:
+        entry = self._read(stripe, digest, now)
+        log = array("d")
+        if entry is not None and entry[0] == _LOG:
+            log.frombytes(entry[2])
+            return log, entry[1]
+        return log, 0.0
+
+    def add_timestamp(self, key: str, timestamp: float, expiry: Optional[int] = None):
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            now = time.time()
+            self._sweep(stripe, now)
+            log, expires_at = self._log(stripe, digest, now)
+            if not log or timestamp >= log[-1]:
+                log.append(timestamp)
+            else:
+                log.insert(bisect.bisect_right(log, timestamp), timestamp)
+            if expiry:
+                expires_at = now + expiry
+            self._write(stripe, digest, _LOG, log.tobytes(), expires_at)
+        finally:
+            self._unlock(stripe, held)
+
+    def count_timestamps(self, key: str, start: float, end: float) -> int:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            log, _ = self._log(stripe, digest, time.time())
+        finally:
+            self._unlock(stripe, held)
+        return bisect.bisect_right(log, end) - bisect.bisect_left(log, start)
+
+    def remove_timestamps(self, key: str, max_timestamp: float):
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            log, expires_at = self._log(stripe, digest, time.time())
+            cut = bisect.bisect_right(log, max_timestamp)
+            if cut:
+                self._write(stripe, digest, _LOG, log[cut:].tobytes(), expires_at)
+        finally:
+            self._unlock(stripe, held)
+
+    def timestamp_at(self, key: str, index: int) -> Optional[float]:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            log, _ = self._log(stripe, digest, time.time())
+        finally:
+            self._unlock(stripe, held)
+        return log[index] if 0 <= index < len(log) else None
+
+    def token_bucket_consume(
+        self, key: str, capacity: float, refill_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            self._sweep(stripe, now)
+            entry = self._read(stripe, digest, now)
+            offset = -1 if entry is None else entry[3]
+            if entry is not None and entry[0] == _BUCKET:
+                tokens, ts = _DD.unpack(entry[2])
+                tokens = min(capacity, tokens + max(0, now - ts) * refill_rate)
+            else:
+                tokens = capacity
+            if tokens < cost:
+                return False, tokens
+            tokens -= cost
+            # Idle for capacity / rate, any bucket is full again
+            expires_at = now + capacity / refill_rate if refill_rate > 0 else 0.0
+            self._write(
+                stripe, digest, _BUCKET, _DD.pack(tokens, now), expires_at, offset
+            )
+            return True, tokens
+        finally:
+            self._unlock(stripe, held)
+
+    def leaky_bucket_add(
+        self, key: str, capacity: float, leak_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            self._sweep(stripe, now)
+            entry = self._read(stripe, digest, now)
+            level = 0.0
+            offset = -1 if entry is None else entry[3]
+            if entry is not None and entry[0] == _BUCKET:
+                level, ts = _DD.unpack(entry[2])
+                level = max(0.0, level - max(0, now - ts) * leak_rate)
+            if level + cost > capacity:
+                return False, level
+            level += cost
+            # Idle for capacity / rate, any bucket has drained
+            expires_at = now + capacity / leak_rate if leak_rate > 0 else 0.0
+            self._write(
+                stripe, digest, _BUCKET, _DD.pack(level, now), expires_at, offset
+            )
+            return True, level
+        finally:
+            self._unlock(stripe, held)
+
+    def sliding_counter_add(
+        self,
+        key: str,
+        prev_key: str,
+        weight: float,
+        limit: int,
+        cost: int,
+        expiry: int,
+    ) -> Tuple[bool, int, int]:
+        digest, stripe = self._locate(key)
+        prev_digest, prev_stripe = self._locate(prev_key)
+        # Both stripes, in stripe order like batch()
+        stripes = sorted({stripe, prev_stripe})
+        held = [self._lock(s) for s in stripes]
+        try:
+            now = time.time()
+            self._sweep(stripe, now)
+            # Previous window first: dropping it when expired can shift the
+            # current window's slot, whose offset the write below reuses
+            prev_entry = self._read(prev_stripe, prev_digest, now)
+            prev = 0
+            if prev_entry is not None and prev_entry[0] == _INT:
+                prev = _Q.unpack(prev_entry[2])[0]
+            entry = self._read(stripe, digest, now)
+            curr, offset = 0, -1
+            if entry is not None:
+                offset = entry[3]
+                if entry[0] == _INT:
+                    curr = _Q.unpack(entry[2])[0]
+
+            granted = curr + prev * weight + cost - 1 < limit
+            if granted:
+                self._write(
+                    stripe, digest, _INT, _Q.pack(curr + cost), now + expiry, offset
+                )
+            return granted, curr, prev
+        finally:
+            for s, h in zip(reversed(stripes), reversed(held)):
+                self._unlock(s, h)
+
+    def sliding_log_add(
+        self, key: str, now: float, window: int, limit: int, cost: int
+    ) -> Tuple[bool, int, Optional[float]]:
+        window_start = now - window
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            self._sweep(stripe, now)
+            log, expires_at = self._log(stripe, digest, now)
+            cut = bisect.bisect_right(log, window_start)
+            if cut:
+                del log[:cut]
+            # Entries past `now` count too: another process may have read
+            # the clock later but taken the lock first
+            count = len(log)
+
+            granted = count + cost <= limit
+            if granted and cost:
+                at = bisect.bisect_right(log, now)
+                log[at:at] = array("d", [now] * cost)
+                expires_at = now + window
+            if cut or (granted and cost):
+                # One rewrite of the log for the trim and the new entries
+                self._write(stripe, digest, _LOG, log.tobytes(), expires_at)
+        finally:
+            self._unlock(stripe, held)
+
+        if granted:
+            return True, count, None
+        if cost > limit:
+            return False, count, None
+        return False, count, log[count + cost - limit - 1]
+
+    def bucket_ring_add(
+        self,
+        key: str,
+        buckets: int,
+        bucket: int,
+        limit: int,
+        cost: int,
+        expiry: float,
+    ) -> Tuple[bool, List[int]]:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            now = time.time()
+            self._sweep(stripe, now)
+            entry = self._read(stripe, digest, now)
+            ring = array("q")
+            if entry is not None and entry[0] == _RING:
+                ring.frombytes(entry[2])
+            if len(ring) != buckets + 1:
+                ring = array("q", [_NO_BUCKET] + [0] * buckets)
+
+            last = None if ring[0] == _NO_BUCKET else ring[0]
+            counts = ring[1:]
+            granted, last, window = ring_add(counts, last, bucket, limit, cost)
+            if granted:
+                ring[0] = last
+                ring[1:] = counts
+                self._write(stripe, digest, _RING, ring.tobytes(), now + expiry)
+            return granted, window
+        finally:
+            self._unlock(stripe, held)
+
+    def gcra_consume(
+        self, key: str, increment: float, burst_offset: float, now: float
+    ) -> Tuple[bool, float]:
+        digest, stripe = self._locate(key)
+        held = self._lock(stripe)
+        try:
+            self._sweep(stripe, now)
+            entry = self._read(stripe, digest, now)
+            tat, offset = now, -1 if entry is None else entry[3]
+            if entry is not None and entry[0] == _FLOAT:
+                tat = max(_D.unpack(entry[2])[0], now)
+            new_tat = tat + increment
+            if new_tat - burst_offset > now:
+                return False, tat
+            self._write(stripe, digest, _FLOAT, _D.pack(new_tat), new_tat, offset)
+            return True, new_tat
+        finally:
+            self._unlock(stripe, held)
+
+    def purge_expired(self) -> int:
+        """Remove every expired key now. Returns the number of slots freed."""
+        removed = 0
+        now = time.time()
+        for stripe in range(self.stripes):
+            held = self._lock(stripe)
+            try:
+                removed += self._sweep(stripe, now, limit=None)
+            finally:
+                self._unlock(stripe, held)
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Table size and how many slots are in use (expired ones included)."""
+        with self.batch():
+            used = sum(self._used(stripe) for stripe in range(self.stripes))
+        return {"slots": self.stripes * self.slots_per_stripe, "used_slots": used}
+
+
+def _chunk_digest(digest: bytes, index: int) -> bytes:
+    return hashlib.blake2b(
+        digest + index.to_bytes(4, "little"), digest_size=16
+    ).digest()
+
+
+def _encode(value: Any) -> Tuple[int, bytes]:
+    if isinstance(value, int):
+        return _INT, _Q.pack(value)
+    if isinstance(value, float):
+        return _FLOAT, _D.pack(value)
+    if isinstance(value, str):
+        return _STR, value.encode("utf-8")
+    raise TypeError(
+        f"SharedMemoryStorage stores int, float and str values, not {type(value).__name__}"
+    )
+
+
+def _decode(kind: int, data: bytes) -> Any:
+    if kind == _INT:
+        return _Q.unpack(data)[0]
+    if kind == _FLOAT:
+        return _D.unpack(data)[0]
+    if kind == _STR:
+        return data.decode("utf-8")
+    # Timestamp logs, rings and buckets are only read through their own
+    # operations, as with InMemoryStorage
+    return None
@@ -0,0 +1,207 @@
+import bisect
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+MAGIC = b"GKSNAP\x00\x01"
+
+# File layout: the header, then one section per value kind. A section is its
+# kind and entry count followed by columns, each a length-prefixed blob: the
+# keys, their expiry times (inf = none), then the kind's own columns. Entries
+# are sorted by expiry, latest first, so a load finds the live ones with one
+# bisection instead of checking each entry. Strings are stored as one blob
+# split on NUL, or cut by a column of lengths if one of them contains NUL.
+_HEADER = struct.Struct("<8scxxxxxxxd")
+_SECTION = struct.Struct("<BxxxI")
+_COLUMN = struct.Struct("<Q")
+
+# Value kinds. BUCKET values are (level, ts), RING values (last bucket or
+# None, counts), LOG values the sorted timestamps.
+INT, FLOAT, TEXT, BYTES, BUCKET, RING, LOG = range(1, 8)
+
+# Kinds of the plain values kept by InMemoryStorage.set() and incr()
+PLAIN_KINDS = {int: INT, float: FLOAT, str: TEXT, bytes: BYTES}
+
+INT64_MIN, INT64_MAX = -(2**63), 2**63 - 1
+_NO_LAST = INT64_MIN
+_BYTE_ORDER = b"<" if sys.byteorder == "little" else b">"
+
+Section = Tuple[List[str], List[Any]]
+
+
+def write_snapshot(
+    path: str, sections: Dict[int, Section], expiry: Dict[str, float], now: float
+) -> int:
+    """
+    Write the (keys, values) of each kind whose expiry time (from `expiry`,
+    none if missing) is after `now`. The file is written next to `path` and
+    renamed over it, so readers only ever see a complete snapshot. Returns
+    the number of entries written.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    written = 0
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, _BYTE_ORDER, now))
+            for kind, (keys, values) in sections.items():
+                stamps = [expiry.get(key, math.inf) for key in keys]
+                order = [i for i, expires_at in enumerate(stamps) if expires_at > now]
+                if not order:
+                    continue
+                order.sort(key=stamps.__getitem__, reverse=True)
+                keys = [keys[i] for i in order]
+                values = [values[i] for i in order]
+                stamps = [stamps[i] for i in order]
+
+                f.write(_SECTION.pack(kind, len(keys)))
+                columns = _encode_strings(keys, "\x00")
+                columns.append(array("d", stamps))
+                columns += _encode(kind, values)
+                for column in columns:
+                    raw = column if isinstance(column, bytes) else column.tobytes()
+                    f.write(_COLUMN.pack(len(raw)))
+                    f.write(raw)
+                written += len(keys)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return written
+
+
+def read_snapshot(
+    path: str, now: float
+) -> Dict[int, Tuple[List[str], List[float], List[Any]]]:
+    """
+    Read the entries of a snapshot that have not expired by `now`, as
+    (keys, expiry times, values) per kind, latest expiry first.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise ValueError(f"{path} is not a storage snapshot")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return _read_sections(path, view, now)
+            finally:
+                view.release()
+
+
+def _read_sections(path: str, view: memoryview, now: float):
+    magic, order, _ = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a storage snapshot")
+    swap = order != _BYTE_ORDER
+
+    sections = {}
+    offset = _HEADER.size
+    while offset < len(view):
+        kind, _ = _SECTION.unpack_from(view, offset)
+        offset += _SECTION.size
+
+        def column(typecode: str = "") -> Any:
+            nonlocal offset
+            (size,) = _COLUMN.unpack_from(view, offset)
+            offset += _COLUMN.size
+            raw = view[offset : offset + size]
+            offset += size
+            if not typecode:
+                return bytes(raw)
+            values = array(typecode)
+            values.frombytes(raw)
+            if swap:
+                values.byteswap()
+            return values
+
+        lengths, blob, stamps = column("I"), column(), column("d")
+        # Expiry times descend: the live entries are a prefix
+        live = bisect.bisect_left(stamps, -now, key=lambda e: -e)
+        keys = _decode_strings(lengths, blob.decode("utf-8"), "\x00", live)
+        values = _decode(kind, column, live)
+        sections[kind] = (keys, stamps[:live].tolist(), values)
+    return sections
+
+
+def _encode(kind: int, values: List[Any]) -> List[Any]:
+    if kind == INT:
+        return [array("q", values)]
+    if kind == FLOAT:
+        return [array("d", values)]
+    if kind == TEXT:
+        return _encode_strings(values, "\x00")
+    if kind == BYTES:
+        return _encode_strings(values, b"\x00")
+    if kind == BUCKET:
+        return [array("d", [v[0] for v in values]), array("d", [v[1] for v in values])]
+    if kind == RING:
+        return [
+            array("q", [_NO_LAST if v[0] is None else v[0] for v in values]),
+            array("I", [len(v[1]) for v in values]),
+            b"".join(v[1].tobytes() for v in values),
+        ]
+    if kind == LOG:
+        return [
+            array("I", map(len, values)),
+            b"".join(array("d", v).tobytes() for v in values),
+        ]
+    raise ValueError(f"unknown snapshot value kind {kind}")
+
+
+def _decode(kind: int, column: Callable[..., Any], live: int) -> List[Any]:
+    if kind == INT:
+        return column("q")[:live].tolist()
+    if kind == FLOAT:
+        return column("d")[:live].tolist()
+    if kind == TEXT:
+        lengths = column("I")
+        return _decode_strings(lengths, column().decode("utf-8"), "\x00", live)
+    if kind == BYTES:
+        lengths = column("I")
+        return _decode_strings(lengths, column(), b"\x00", live)
+    if kind == BUCKET:
+        levels, stamps = column("d"), column("d")
+        return list(zip(levels[:live].tolist(), stamps[:live].tolist()))
+    if kind == RING:
+        lasts, sizes, counts = column("q"), column("I"), column("q")
+        sizes = sizes[:live]
+        return [
+            (None if last == _NO_LAST else last, counts[end - size : end])
+            for last, size, end in zip(lasts, sizes, accumulate(sizes))
+        ]
+    if kind == LOG:
+        sizes, stamps = column("I"), column("d")
+        # One list for all logs, sliced per key
+        sizes = sizes[:live]
+        flat = stamps[: sum(sizes)].tolist()
+        return [flat[end - size : end] for size, end in zip(sizes, accumulate(sizes))]
+    raise ValueError(f"unknown snapshot value kind {kind}")
+
+
+def _encode_strings(items: Sequence[Any], sep: Any) -> List[Any]:
+    """The lengths column (empty if `sep` can split the blob) and the blob."""
+    blob = sep.join(items)
+    if blob.count(sep) == len(items) - 1:
+        lengths = array("I")
+    else:
+        lengths = array("I", map(len, items))
+        blob = sep[:0].join(items)
+    return [lengths, blob.encode("utf-8") if isinstance(blob, str) else blob]
+
+
+def _decode_strings(lengths: array, blob: Any, sep: Any, live: int) -> List[Any]:
+    if not lengths:
+        return blob.split(sep)[:live] if live else []
+    pieces = []
+    start = 0
+    for end in accumulate(lengths[:live]):
+        pieces.append(blob[start:end])
+        start = end
+    return pieces
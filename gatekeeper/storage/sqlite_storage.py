@@ -1,115 +1,591 @@
 import sqlite3
+from array import array
+import threading
 import time
-from typing import Optional, Any
-from .base import Storage
+import weakref
+from contextlib import contextmanager
+from typing import Optional, Any, Iterator, List, Tuple
+from .base import Storage, ring_add
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class _ThreadConnection:
+    """
+    A thread's own connection. Only that thread's local state refers to it,
+    so it is closed once the thread exits.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        weakref.finalize(self, conn.close)
+
+
+class _ThreadState(threading.local):
+    connection: Optional[_ThreadConnection] = None
+    depth = 0
 
 
 class SQLiteStorage(Storage):
-    def __init__(self, db_path: str = "gatekeeper.db"):
-        # check_same_thread=False allows using connection across threads
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    """
+    SQLite-backed storage, persistent across restarts.
+
+    Every operation that writes runs in its own write transaction (BEGIN
+    IMMEDIATE), so read-modify-write steps are serialized across threads and
+    processes. Pure reads (get, count_timestamps, timestamp_at) are single
+    SELECTs in autocommit mode: they never take the write lock, and with WAL
+    they run alongside the writer.
+
+    Connections:
+        File databases get one connection per thread, closed when the thread
+        exits. ":memory:" databases
+        (which exist per connection) and group-commit mode share a single
+        connection guarded by a lock.
+
+    Performance options and their durability trade-offs:
+        wal=True: WAL journaling. Readers no longer block the writer, and with
+            the default synchronous="NORMAL" a commit is not fsynced; it is
+            safe against application crashes but the last commits can be
+            lost on power failure or OS crash.
+        synchronous: override SQLite's synchronous pragma ("OFF", "NORMAL",
+            "FULL", "EXTRA"). "OFF" can corrupt the database on power loss.
+        commit_interval > 0: group commit. Writes stay in one open
+            transaction that is committed at most every commit_interval
+            seconds (by the next operation or a background flusher), so many
+            decisions share one commit. Up to commit_interval seconds of
+            decisions are lost if the process dies without close() (or if a
+            statement fails and the open group is rolled back). Other
+            processes only see the writes after the commit, and writers in
+            other processes wait while a group is open.
+
+    Expired rows:
+        Reads ignore expired rows, and nothing is deleted on the request
+        path. Instead, at most once every sweep_interval seconds the next
+        transaction also deletes up to sweep_batch expired rows per table,
+        found through the expiry indexes (None disables this; call
+        purge_expired() yourself). With incremental_vacuum=True freed pages
+        are returned to the filesystem after each sweep; it only applies to
+        databases created with it (existing files need a one-off VACUUM
+        after setting PRAGMA auto_vacuum=INCREMENTAL).
+    """
+
+    def __init__(
+        self,
+        db_path: str = "gatekeeper.db",
+        wal: bool = False,
+        synchronous: Optional[str] = None,
+        commit_interval: float = 0.0,
+        sweep_interval: Optional[float] = 1.0,
+        sweep_batch: int = 500,
+        incremental_vacuum: bool = False,
+    ):
+        if synchronous is None and wal:
+            synchronous = "NORMAL"
+        if synchronous is not None and synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}")
+        if commit_interval < 0:
+            raise ValueError("commit_interval must not be negative")
+        if sweep_batch < 1:
+            raise ValueError("sweep_batch must be at least 1")
+
+        self.db_path = db_path
+        self.wal = wal and db_path != ":memory:"
+        self.synchronous = synchronous
+        self.commit_interval = commit_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.incremental_vacuum = incremental_vacuum
+
+        self._shared = db_path == ":memory:" or commit_interval > 0
+        # Serializes the shared connection; per-thread connections rely on
+        # SQLite's own locking instead.
+        self._lock = threading.RLock()
+        self._local = _ThreadState()
+        self._connections: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+        self._shared_conn: Optional[sqlite3.Connection] = None
+        self._shared_depth = 0
+        self._last_commit = time.monotonic()
+        self._closed = threading.Event()
+        self._next_sweep = time.monotonic()
+
         self._init_db()
 
-    def _init_db(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS kv_store (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                expiry REAL
+        self._flusher: Optional[threading.Thread] = None
+        if commit_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="gatekeeper-sqlite-flush", daemon=True
             )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS timestamps (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key TEXT,
-                timestamp REAL,
-                expiry REAL
-            )
-        """)
-        self.cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_timestamps_key ON timestamps(key)"
+            self._flusher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are managed explicitly below
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None, timeout=30
         )
-        self.conn.commit()
+        if self.synchronous is not None:
+            conn.execute(f"PRAGMA synchronous={self.synchronous.upper()}")
+        return conn
 
-    def _cleanup_expired(self, key: str):
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The connection used by the calling thread."""
+        if self._shared:
+            if self._shared_conn is None:
+                self._shared_conn = self._connect()
+            return self._shared_conn
+        state = self._local
+        if state.connection is None:
+            state.connection = _ThreadConnection(self._connect())
+            with self._lock:
+                self._connections.add(state.connection)
+        return state.connection.conn
+
+    def _init_db(self):
+        conn = self.conn
+        if self.incremental_vacuum:
+            # Only takes effect before the first table is created
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        if self.wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS kv_store (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expiry REAL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS timestamps (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT,
+                    timestamp REAL,
+                    expiry REAL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_timestamps_key ON timestamps(key)"
+            )
+            # Token/leaky bucket state: one row per bucket so that a decision
+            # is a single UPSERT. `granted` records the outcome of the last
+            # decision so it can be read back with RETURNING.
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    ts REAL NOT NULL,
+                    expiry REAL,
+                    granted INTEGER NOT NULL
+                )
+            """)
+            # Bucketed sliding window rings: counts packed as 64-bit ints
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bucket_rings (
+                    key TEXT PRIMARY KEY,
+                    last INTEGER NOT NULL,
+                    counts BLOB NOT NULL,
+                    expiry REAL
+                )
+            """)
+            for table in _EXPIRING_TABLES:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_expiry ON {table}(expiry)"
+                )
+
+    @contextmanager
+    def _transaction(self, write: bool = True) -> Iterator[sqlite3.Connection]:
+        """
+        Run the enclosed statements in one write transaction. Nested uses
+        (e.g. inside batch()) join the outermost transaction. With
+        write=False the statements only read, and an outermost use runs them
+        without a transaction of its own.
+        """
+        if self._shared:
+            with self._lock:
+                conn = self.conn
+                self._shared_depth += 1
+                try:
+                    with self._outermost(conn, self._shared_depth == 1, write):
+                        yield conn
+                finally:
+                    self._shared_depth -= 1
+        else:
+            state = self._local
+            conn = self.conn
+            state.depth += 1
+            try:
+                with self._outermost(conn, state.depth == 1, write):
+                    yield conn
+            finally:
+                state.depth -= 1
+
+    @contextmanager
+    def _outermost(
+        self, conn: sqlite3.Connection, outermost: bool, write: bool
+    ) -> Iterator[None]:
+        if not outermost or not write:
+            # Reads run in autocommit mode, or inside an open group commit
+            yield
+            return
+
+        # In group-commit mode the previous transaction may still be open
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            if self.sweep_interval is not None and time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + self.sweep_interval
+                self._sweep(conn, time.time(), self.sweep_batch)
+        except BaseException:
+            conn.rollback()
+            raise
+        if self.commit_interval <= 0:
+            conn.commit()
+        elif time.monotonic() - self._last_commit >= self.commit_interval:
+            self._commit_shared()
+
+    def _commit_shared(self):
+        conn = self._shared_conn
+        if conn is not None and conn.in_transaction:
+            conn.commit()
+        self._last_commit = time.monotonic()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.commit_interval):
+            self.flush()
+
+    def flush(self):
+        """Commit writes held back by group commit."""
+        with self._lock:
+            if self._shared_depth == 0:
+                self._commit_shared()
+
+    def close(self):
+        """Flush pending writes, stop the flusher and close all connections."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            if self._shared_conn is not None:
+                self._commit_shared()
+                self._shared_conn.close()
+                self._shared_conn = None
+            for connection in list(self._connections):
+                connection.conn.close()
+            self._connections.clear()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        with self._transaction():
+            yield
+
+    def _sweep(self, conn: sqlite3.Connection, now: float, limit: int) -> int:
+        """Delete up to `limit` expired rows per table. Returns rows deleted."""
+        removed = 0
+        for table in _EXPIRING_TABLES:
+            removed += conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN "
+                f"(SELECT rowid FROM {table} WHERE expiry < ? LIMIT ?)",
+                (now, limit),
+            ).rowcount
+        if removed and self.incremental_vacuum:
+            # Frees one page per step; fetchall() runs every step
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+        return removed
+
+    def purge_expired(self) -> int:
+        """Delete every expired row now. Returns the number deleted."""
+        removed = 0
         now = time.time()
-        self.cursor.execute(
-            "DELETE FROM kv_store WHERE key = ? AND expiry IS NOT NULL AND expiry < ?",
-            (key, now),
-        )
-        self.cursor.execute(
-            "DELETE FROM timestamps WHERE key = ? AND expiry IS NOT NULL AND expiry < ?",
-            (key, now),
-        )
-        self.conn.commit()
+        while True:
+            # Separate transactions so a large backlog never holds the write
+            # lock for long
+            with self._transaction() as conn:
+                deleted = self._sweep(conn, now, self.sweep_batch)
+            removed += deleted
+            if not deleted:
+                return removed
 
     def get(self, key: str) -> Optional[Any]:
-        self._cleanup_expired(key)
-        self.cursor.execute("SELECT value FROM kv_store WHERE key = ?", (key,))
-        row = self.cursor.fetchone()
-        return row[0] if row else None
+        with self._transaction(write=False) as conn:
+            row = conn.execute(
+                "SELECT value FROM kv_store WHERE key = ? "
+                "AND (expiry IS NULL OR expiry >= ?)",
+                (key, time.time()),
+            ).fetchone()
+            return row[0] if row else None
 
     def set(self, key: str, value: Any, expiry: Optional[int] = None):
         exp_time = time.time() + expiry if expiry else None
-        self.cursor.execute(
-            "REPLACE INTO kv_store (key, value, expiry) VALUES (?, ?, ?)",
-            (key, str(value), exp_time),
-        )
-        self.conn.commit()
+        with self._transaction() as conn:
+            conn.execute(
+                "REPLACE INTO kv_store (key, value, expiry) VALUES (?, ?, ?)",
+                (key, str(value), exp_time),
+            )
 
     def incr(self, key: str, amount: int = 1, expiry: Optional[int] = None) -> int:
-        self._cleanup_expired(key)
+        # One statement: an expired row restarts from `amount`, a live one is
+        # incremented, and a missing one is inserted.
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.execute(
+                _INCR_SQL,
+                {
+                    "key": key,
+                    "amount": amount,
+                    "now": now,
+                    "expiry": now + expiry if expiry else None,
+                },
+            ).fetchone()[0]
 
-        self.cursor.execute("SELECT value, expiry FROM kv_store WHERE key = ?", (key,))
-        row = self.cursor.fetchone()
+    def add_timestamp(self, key: str, timestamp: float, expiry: Optional[int] = None):
+        exp_time = time.time() + expiry if expiry else None
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO timestamps (key, timestamp, expiry) VALUES (?, ?, ?)",
+                (key, timestamp, exp_time),
+            )
 
-        if row:
-            val = int(row[0]) + amount
-            current_expiry = row[1]
-        else:
-            val = amount
-            current_expiry = None
+    def count_timestamps(self, key: str, start: float, end: float) -> int:
+        with self._transaction(write=False) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM timestamps WHERE key = ? "
+                "AND timestamp BETWEEN ? AND ? AND (expiry IS NULL OR expiry >= ?)",
+                (key, start, end, time.time()),
+            ).fetchone()[0]
 
-        # Determine new expiry
-        if expiry:
-            new_expiry = time.time() + expiry
-        else:
-            new_expiry = current_expiry
+    def remove_timestamps(self, key: str, max_timestamp: float):
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM timestamps WHERE key = ? AND timestamp <= ?",
+                (key, max_timestamp),
+            )
 
-        self.cursor.execute(
-            "REPLACE INTO kv_store (key, value, expiry) VALUES (?, ?, ?)",
-            (key, str(val), new_expiry),
-        )
-        self.conn.commit()
-        return val
+    def timestamp_at(self, key: str, index: int) -> Optional[float]:
+        with self._transaction(write=False) as conn:
+            row = conn.execute(
+                "SELECT timestamp FROM timestamps WHERE key = ? "
+                "AND (expiry IS NULL OR expiry >= ?) "
+                "ORDER BY timestamp LIMIT 1 OFFSET ?",
+                (key, time.time(), index),
+            ).fetchone()
+        return row[0] if row is not None else None
 
-    def add_timestamp(self, key: str, timestamp: float, expiry: Optional[int] = None):
-        # We don't strictly need to cleanup here but good practice
-        # self._cleanup_expired(key)
-        # Actually cleanup is expensive if done too often.
-        # Maybe skip it on add? But then we accumulate garbage.
-        # Let's keep it but maybe optimize later.
+    def token_bucket_consume(
+        self, key: str, capacity: float, refill_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        granted = cost <= capacity
+        with self._transaction() as conn:
+            row = conn.execute(
+                _TOKEN_BUCKET_SQL,
+                {
+                    "key": key,
+                    "capacity": capacity,
+                    "rate": refill_rate,
+                    "cost": cost,
+                    "now": now,
+                    # Idle for capacity / rate, any bucket is full again
+                    "expiry": now + capacity / refill_rate if refill_rate > 0 else None,
+                    "initial_level": capacity - cost if granted else capacity,
+                    "initial_granted": granted,
+                },
+            ).fetchone()
+        return bool(row[0]), row[1]
 
-        exp_time = time.time() + expiry if expiry else None
-        self.cursor.execute(
-            "INSERT INTO timestamps (key, timestamp, expiry) VALUES (?, ?, ?)",
-            (key, timestamp, exp_time),
-        )
-        self.conn.commit()
+    def leaky_bucket_add(
+        self, key: str, capacity: float, leak_rate: float, cost: int, now: float
+    ) -> Tuple[bool, float]:
+        granted = cost <= capacity
+        with self._transaction() as conn:
+            row = conn.execute(
+                _LEAKY_BUCKET_SQL,
+                {
+                    "key": key,
+                    "capacity": capacity,
+                    "rate": leak_rate,
+                    "cost": cost,
+                    "now": now,
+                    # Idle for capacity / rate, any bucket has drained
+                    "expiry": now + capacity / leak_rate if leak_rate > 0 else None,
+                    "initial_level": cost if granted else 0,
+                    "initial_granted": granted,
+                },
+            ).fetchone()
+        return bool(row[0]), row[1]
 
-    def count_timestamps(self, key: str, start: float, end: float) -> int:
-        self._cleanup_expired(key)
-        self.cursor.execute(
-            "SELECT COUNT(*) FROM timestamps WHERE key = ? AND timestamp BETWEEN ? AND ?",
-            (key, start, end),
-        )
-        return self.cursor.fetchone()[0]
+    def gcra_consume(
+        self, key: str, increment: float, burst_offset: float, now: float
+    ) -> Tuple[bool, float]:
+        # Reuses the buckets table: `level` holds the TAT
+        granted = increment <= burst_offset
+        with self._transaction() as conn:
+            row = conn.execute(
+                _GCRA_SQL,
+                {
+                    "key": key,
+                    "now": now,
+                    "increment": increment,
+                    "burst_offset": burst_offset,
+                    "initial_tat": now + increment if granted else now,
+                    "initial_granted": granted,
+                },
+            ).fetchone()
+        return bool(row[0]), row[1]
 
-    def remove_timestamps(self, key: str, max_timestamp: float):
-        # self._cleanup_expired(key) # Can skip here
-        self.cursor.execute(
-            "DELETE FROM timestamps WHERE key = ? AND timestamp <= ?",
-            (key, max_timestamp),
-        )
-        self.conn.commit()
+    def sliding_counter_add(
+        self,
+        key: str,
+        prev_key: str,
+        weight: float,
+        limit: int,
+        cost: int,
+        expiry: int,
+    ) -> Tuple[bool, int, int]:
+        now = time.time()
+        with self._transaction() as conn:
+            counts = dict(
+                conn.execute(
+                    "SELECT key, CAST(value AS INTEGER) FROM kv_store "
+                    "WHERE key IN (?, ?) AND (expiry IS NULL OR expiry >= ?)",
+                    (key, prev_key, now),
+                ).fetchall()
+            )
+            curr, prev = counts.get(key, 0), counts.get(prev_key, 0)
+            granted = curr + prev * weight + cost - 1 < limit
+            if granted:
+                conn.execute(
+                    _INCR_SQL,
+                    {"key": key, "amount": cost, "now": now, "expiry": now + expiry},
+                )
+            return granted, curr, prev
+
+    def sliding_log_add(
+        self, key: str, now: float, window: int, limit: int, cost: int
+    ) -> Tuple[bool, int, Optional[float]]:
+        window_start = now - window
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM timestamps WHERE key = ? AND timestamp <= ?",
+                (key, window_start),
+            )
+            # Rows past `now` count too: another writer may have read
+            # the clock later but taken the lock first
+            count = conn.execute(
+                "SELECT COUNT(*) FROM timestamps WHERE key = ? "
+                "AND (expiry IS NULL OR expiry >= ?)",
+                (key, now),
+            ).fetchone()[0]
+            if count + cost <= limit:
+                conn.executemany(
+                    "INSERT INTO timestamps (key, timestamp, expiry) VALUES (?, ?, ?)",
+                    [(key, now, now + window)] * cost,
+                )
+                return True, count, None
+            if cost > limit:
+                return False, count, None
+            row = conn.execute(
+                "SELECT timestamp FROM timestamps WHERE key = ? "
+                "AND (expiry IS NULL OR expiry >= ?) "
+                "ORDER BY timestamp LIMIT 1 OFFSET ?",
+                (key, now, count + cost - limit - 1),
+            ).fetchone()
+            return False, count, row[0] if row is not None else None
+
+    def bucket_ring_add(
+        self,
+        key: str,
+        buckets: int,
+        bucket: int,
+        limit: int,
+        cost: int,
+        expiry: float,
+    ) -> Tuple[bool, List[int]]:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT last, counts FROM bucket_rings WHERE key = ? "
+                "AND (expiry IS NULL OR expiry >= ?)",
+                (key, now),
+            ).fetchone()
+            last, counts = None, array("q", bytes(8 * buckets))
+            if row is not None and len(row[1]) == 8 * buckets:
+                last, counts = row[0], array("q", row[1])
+
+            granted, last, window = ring_add(counts, last, bucket, limit, cost)
+            if granted:
+                conn.execute(
+                    "REPLACE INTO bucket_rings (key, last, counts, expiry) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, last, counts.tobytes(), now + expiry),
+                )
+            return granted, window
+
+
+# Tables with an `expiry` column, swept by _sweep()
+_EXPIRING_TABLES = ("kv_store", "timestamps", "buckets", "bucket_rings")
+
+_INCR_SQL = """
+    INSERT INTO kv_store (key, value, expiry) VALUES (:key, :amount, :expiry)
+    ON CONFLICT(key) DO UPDATE SET
+        value = CASE
+            WHEN expiry IS NOT NULL AND expiry < :now THEN :amount
+            ELSE CAST(value AS INTEGER) + :amount
+        END,
+        expiry = CASE
+            WHEN :expiry IS NOT NULL THEN :expiry
+            WHEN expiry IS NOT NULL AND expiry < :now THEN NULL
+            ELSE expiry
+        END
+    RETURNING CAST(value AS INTEGER)
+"""
+
+# In an UPSERT's SET clause every column reference is the row *before* the
+# update, so the refilled/leaked level is recomputed in each expression.
+# State is advanced to `now` even on a denial; refilling/leaking is
+# deterministic, so that is equivalent to leaving the row untouched.
+_TOKEN_BUCKET_SQL = """
+    INSERT INTO buckets (key, level, ts, expiry, granted)
+    VALUES (:key, :initial_level, :now, :expiry, :initial_granted)
+    ON CONFLICT(key) DO UPDATE SET
+        level = min(:capacity, level + max(0, :now - ts) * :rate) - CASE
+            WHEN min(:capacity, level + max(0, :now - ts) * :rate) >= :cost
+            THEN :cost ELSE 0
+        END,
+        granted = min(:capacity, level + max(0, :now - ts) * :rate) >= :cost,
+        ts = max(ts, :now),
+        expiry = :expiry
+    RETURNING granted, level
+"""
+
+_LEAKY_BUCKET_SQL = """
+    INSERT INTO buckets (key, level, ts, expiry, granted)
+    VALUES (:key, :initial_level, :now, :expiry, :initial_granted)
+    ON CONFLICT(key) DO UPDATE SET
+        level = max(0, level - max(0, :now - ts) * :rate) + CASE
+            WHEN max(0, level - max(0, :now - ts) * :rate) + :cost <= :capacity
+            THEN :cost ELSE 0
+        END,
+        granted = max(0, level - max(0, :now - ts) * :rate) + :cost <= :capacity,
+        ts = max(ts, :now),
+        expiry = :expiry
+    RETURNING granted, level
+"""
+
+# An expired row has a TAT behind the clock (expiry is the TAT itself), so
+# max(level, :now) treats it like a missing one.
+_GCRA_SQL = """
+    INSERT INTO buckets (key, level, ts, expiry, granted)
+    VALUES (:key, :initial_tat, :now, :initial_tat, :initial_granted)
+    ON CONFLICT(key) DO UPDATE SET
+        level = max(level, :now) + CASE
+            WHEN max(level, :now) + :increment - :burst_offset <= :now
+            THEN :increment ELSE 0
+        END,
+        granted = max(level, :now) + :increment - :burst_offset <= :now,
+        ts = :now,
+        expiry = max(level, :now) + CASE
+            WHEN max(level, :now) + :increment - :burst_offset <= :now
+            THEN :increment ELSE 0
+        END
+    RETURNING granted, level
+"""
@@ -0,0 +1,84 @@
+import functools
+import time
+from typing import Optional
+import pytest
+import redis
+from gatekeeper import (
+    InMemoryStorage,
+    RedisStorage,
+    SharedMemoryStorage,
+    SQLiteStorage,
+)
+from gatekeeper.storage import Storage
+
+
+class PrimitiveStorage(InMemoryStorage):
+    """Runs every algorithm-level operation through the primitives."""
+
+    token_bucket_consume = Storage.token_bucket_consume
+    leaky_bucket_add = Storage.leaky_bucket_add
+    sliding_counter_add = Storage.sliding_counter_add
+    sliding_log_add = Storage.sliding_log_add
+    bucket_ring_add = Storage.bucket_ring_add
+    gcra_consume = Storage.gcra_consume
+
+
+@functools.cache
+def get_redis_client() -> Optional[redis.Redis]:
+    """A client of the local Redis server, None if it cannot be reached."""
+    client = redis.Redis(host="localhost", port=6379, socket_connect_timeout=0.1)
+    try:
+        client.ping()
+    except (redis.ConnectionError, redis.TimeoutError):
+        return None
+    return client
+
+
+@pytest.fixture
+def redis_client() -> redis.Redis:
+    client = get_redis_client()
+    if client is None:
+        pytest.skip("Redis is not available")
+    return client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake time.time(); tests move it by changing clock[0]."""
+    now = [1_000_000.5]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+STORAGES = [
+    "memory",
+    "memory_striped",
+    "sqlite",
+    "shared_memory",
+    "primitives",
+    "redis",
+]
+
+
+@pytest.fixture(params=STORAGES)
+def storage_factory(request, tmp_path):
+    """
+    Factory of a fresh storage: tests taking it run once per backend in
+    STORAGES. Redis is skipped when no server is reachable.
+    """
+    name = request.param
+    if name == "memory":
+        return InMemoryStorage
+    if name == "memory_striped":
+        return lambda: InMemoryStorage(stripes=8)
+    if name == "sqlite":
+        return lambda: SQLiteStorage(":memory:")
+    if name == "shared_memory":
+        path = str(tmp_path / "limits")
+        return lambda: SharedMemoryStorage(path, slots=4096)
+    if name == "primitives":
+        return PrimitiveStorage
+    if name == "redis":
+        client = request.getfixturevalue("redis_client")
+        return lambda: RedisStorage(client)
+    raise ValueError(f"unknown storage {name!r}")
@@ -0,0 +1,90 @@
+import asyncio
+import time
+import pytest
+import redis.asyncio
+from gatekeeper import (
+    AsyncInMemoryStorage,
+    AsyncSQLiteStorage,
+    AsyncRedisStorage,
+    AsyncFixedWindowLimiter,
+    AsyncSlidingWindowLogLimiter,
+    AsyncSlidingWindowCounterLimiter,
+    AsyncTokenBucketLimiter,
+    AsyncLeakyBucketLimiter,
+    InMemoryStorage,
+)
+
+
+# Factories, because async clients are bound to the event loop that uses them
+storage_factories = {
+    "AsyncInMemoryStorage": AsyncInMemoryStorage,
+    "AsyncSQLiteStorage": lambda: AsyncSQLiteStorage(":memory:"),
+    "AsyncRedisStorage": lambda: AsyncRedisStorage(
+        redis.asyncio.Redis(host="localhost", port=6379)
+    ),
+}
+
+
+@pytest.fixture(params=storage_factories)
+def make_storage(request):
+    if request.param == "AsyncRedisStorage":
+        # Skips the test when no server is reachable
+        request.getfixturevalue("redis_client")
+    return storage_factories[request.param]
+
+
+limiter_factories = [
+    lambda s: AsyncFixedWindowLimiter(max_requests=2, window_seconds=10, storage=s),
+    lambda s: AsyncSlidingWindowLogLimiter(
+        max_requests=2, window_seconds=10, storage=s
+    ),
+    lambda s: AsyncSlidingWindowCounterLimiter(
+        max_requests=2, window_seconds=10, storage=s
+    ),
+    lambda s: AsyncTokenBucketLimiter(capacity=2, refill_rate=0.01, storage=s),
+    lambda s: AsyncLeakyBucketLimiter(capacity=2, leak_rate=0.01, storage=s),
+]
+limiter_ids = ["fixed", "sliding_log", "sliding_counter", "token", "leaky"]
+
+
+@pytest.mark.parametrize("make_limiter", limiter_factories, ids=limiter_ids)
+def test_async_allow(make_storage, make_limiter):
+    async def scenario():
+        limiter = make_limiter(make_storage())
+        key = f"async_{time.time()}"
+
+        assert await limiter.allow(key) is True
+        assert await limiter.allow(key) is True
+        assert await limiter.allow(key) is False
+        assert await limiter.allow_many([f"{key}_a", f"{key}_a", f"{key}_a"]) == [
+            True,
+            True,
+            False,
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_async_concurrent_checks(make_storage):
+    async def scenario():
+        limiter = AsyncTokenBucketLimiter(
+            capacity=50, refill_rate=0.01, storage=make_storage()
+        )
+        key = f"async_concurrent_{time.time()}"
+
+        results = await asyncio.gather(*(limiter.allow(key) for _ in range(80)))
+        assert results.count(True) == 50
+
+    asyncio.run(scenario())
+
+
+def test_async_redis_limiter_has_no_local_storage():
+    storage = AsyncRedisStorage(redis.asyncio.Redis(host="localhost", port=6379))
+    storage.cross_slot_scripts = False
+    limiter = AsyncLeakyBucketLimiter(capacity=2, leak_rate=0.01, storage=storage)
+
+    # The wrapped limiter only carries the async storage's settings
+    assert not isinstance(limiter._limiter.storage, InMemoryStorage)
+    assert limiter._limiter._cross_slot is False
+    assert limiter._use_lua is True
+    assert limiter._limiter._cross_slot is False
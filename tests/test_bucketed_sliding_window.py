@@ -0,0 +1,86 @@
+import random
+import time
+import pytest
+from gatekeeper import (
+    AsyncBucketedSlidingWindowLimiter,
+    BucketedSlidingWindowLimiter,
+    InMemoryStorage,
+    SQLiteStorage,
+)
+
+
+class TestBucketedSlidingWindow:
+    def test_quota_frees_up_bucket_by_bucket(self, clock, storage_factory):
+        limiter = BucketedSlidingWindowLimiter(
+            4, window_seconds=10, buckets=5, storage=storage_factory()
+        )
+        key = f"bsw_{time.perf_counter_ns()}"
+
+        # Buckets are 2s wide: [1_000_000, 1_000_002), [1_000_002, ...)
+        assert limiter.allow_many([key, key]) == [True, True]
+        clock[0] += 2
+        assert limiter.allow_many([key, key, key]) == [True, True, False]
+
+        # The first bucket leaves the window when bucket 1_000_010 starts
+        decision = limiter.check(key, cost=2)
+        assert decision.allowed is False
+        assert decision.retry_after == pytest.approx(7.5)
+        clock[0] += 7.4
+        assert limiter.allow(key) is False
+        clock[0] += 0.1
+        assert limiter.allow(key, cost=2) is True
+        assert limiter.allow(key) is False
+
+    def test_never_exceeds_limit_over_covered_span(self, clock, storage_factory):
+        limiter = BucketedSlidingWindowLimiter(
+            20, window_seconds=4, buckets=8, storage=storage_factory()
+        )
+        key = f"bsw_{time.perf_counter_ns()}"
+        # Every allowed request stays counted for at least window - width
+        span = limiter.window_seconds - limiter.bucket_width
+
+        rng = random.Random(7)
+        allowed = []
+        for _ in range(1500):
+            clock[0] += rng.expovariate(10)
+            if limiter.allow(key):
+                allowed.append(clock[0])
+                recent = [t for t in allowed if t > clock[0] - span]
+                assert len(recent) <= 20
+        assert len(allowed) > 200
+
+
+def test_state_is_bounded_by_bucket_count(clock):
+    storage = InMemoryStorage()
+    limiter = BucketedSlidingWindowLimiter(
+        10**6, window_seconds=60, buckets=6, storage=storage
+    )
+    for _ in range(1000):
+        clock[0] += 0.5
+        assert limiter.allow("k", cost=3)
+
+    ring = storage._stripe("bsw:{k}").data["bsw:{k}"]
+    assert len(ring.counts) == 6
+    # Five full 10s buckets (20 requests each) plus the current partial one
+    assert 5 * 60 < sum(ring.counts) <= 6 * 60
+
+
+def test_sqlite_keeps_one_row_per_key(clock):
+    storage = SQLiteStorage(":memory:")
+    limiter = BucketedSlidingWindowLimiter(100, 10, storage=storage)
+    for _ in range(50):
+        clock[0] += 0.3
+        limiter.allow("k")
+
+    assert storage.conn.execute("SELECT COUNT(*) FROM bucket_rings").fetchone()[0] == 1
+
+
+def test_async_bucketed_sliding_window(clock):
+    import asyncio
+
+    limiter = AsyncBucketedSlidingWindowLimiter(2, 10)
+
+    async def scenario():
+        return [await limiter.allow("k") for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [True, True, False]
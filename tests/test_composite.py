@@ -0,0 +1,111 @@
+import asyncio
+import time
+import pytest
+from gatekeeper import (
+    AsyncCompositeLimiter,
+    AsyncInMemoryStorage,
+    BucketedSlidingWindowLimiter,
+    CompositeLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    LeakyBucketLimiter,
+    LeasedLimiter,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+from gatekeeper.storage.sharded_redis_storage import hash_tag
+
+# Rules allowing 3 requests that do not free any up within a minute
+RULES = {
+    "fixed_window": lambda: FixedWindowLimiter(3, 300),
+    "sliding_window_log": lambda: SlidingWindowLogLimiter(3, 300),
+    "sliding_window_counter": lambda: SlidingWindowCounterLimiter(3, 300),
+    "token_bucket": lambda: TokenBucketLimiter(3, 0.001),
+    "leaky_bucket": lambda: LeakyBucketLimiter(3, 0.001),
+    "bucketed_sliding_window": lambda: BucketedSlidingWindowLimiter(3, 300, 5),
+    "gcra": lambda: GCRALimiter(3, 300),
+}
+
+
+class TestCompositeLimiter:
+    def test_denied_requests_are_not_counted(self, clock, storage_factory):
+        limiter = CompositeLimiter(
+            [FixedWindowLimiter(3, 60), TokenBucketLimiter(4, 0.01)],
+            storage=storage_factory(),
+        )
+        key = f"composite_{time.perf_counter_ns()}"
+
+        assert limiter.check(key, cost=2) == (True, 1, 0.0)
+        # Over the window's limit; the bucket keeps its tokens and the
+        # window does not count the denial
+        decision = limiter.check(key, cost=2)
+        assert decision.allowed is False
+        assert decision.remaining == 1
+        assert decision.retry_after == pytest.approx(19.5)
+        assert limiter.check(key) == (True, 0, 0.0)
+
+        # Both rules short: retry once the slower one has room
+        assert limiter.check(key, cost=2).retry_after == pytest.approx(100)
+        clock[0] += 100
+        assert limiter.check(key, cost=2) == (True, 0, 0.0)
+
+    @pytest.mark.parametrize("rule", RULES.values(), ids=RULES)
+    def test_all_or_nothing(self, clock, storage_factory, rule):
+        limiter = CompositeLimiter(
+            [rule(), FixedWindowLimiter(2, 60)], storage=storage_factory()
+        )
+        key = f"composite_{time.perf_counter_ns()}"
+
+        assert limiter.allow_many([key] * 3) == [True, True, False]
+        # A new minute: the first rule still has the request denied above
+        clock[0] += 60
+        assert limiter.allow(key) is True
+        assert limiter.allow(key) is False
+
+    def test_rules_of_one_algorithm_keep_separate_state(self, clock, storage_factory):
+        limiter = CompositeLimiter(
+            [TokenBucketLimiter(2, 0.001), TokenBucketLimiter(5, 0.001)],
+            storage=storage_factory(),
+        )
+        key = f"composite_{time.perf_counter_ns()}"
+
+        assert limiter.allow_many([key] * 3) == [True, True, False]
+
+    def test_weight_above_any_limit(self, clock, storage_factory):
+        limiter = CompositeLimiter(
+            [FixedWindowLimiter(10, 1), GCRALimiter(3, 60)], storage=storage_factory()
+        )
+        key = f"composite_{time.perf_counter_ns()}"
+
+        assert limiter.check(key, cost=4).retry_after == float("inf")
+        assert limiter.check(key, cost=3) == (True, 0, 0.0)
+
+
+def test_script_keys_share_one_slot(clock):
+    limiter = CompositeLimiter([factory() for factory in RULES.values()])
+    keys, _ = limiter._script_call("user:1", 1, time.time())
+    assert len(keys) == len(RULES) + 1  # the counter window reads two keys
+    assert {hash_tag(k) for k in keys} == {"user:1"}
+    assert len(set(keys)) == len(keys)
+
+
+def test_rejects_rules_without_script():
+    with pytest.raises(ValueError):
+        CompositeLimiter([])
+    with pytest.raises(ValueError):
+        CompositeLimiter([LeasedLimiter(FixedWindowLimiter(10, 1), 2)])
+    with pytest.raises(ValueError):
+        CompositeLimiter([CompositeLimiter([FixedWindowLimiter(10, 1)])])
+
+
+def test_async_limiter(clock):
+    limiter = AsyncCompositeLimiter(
+        [FixedWindowLimiter(5, 1), TokenBucketLimiter(2, 0.01)],
+        storage=AsyncInMemoryStorage(),
+    )
+
+    async def run():
+        return [await limiter.allow("k") for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, False]
@@ -0,0 +1,139 @@
+import asyncio
+import random
+import time
+import pytest
+from gatekeeper import (
+    AsyncCountMinSketchLimiter,
+    CompositeLimiter,
+    CountMinSketchLimiter,
+    HashedKeyEncoder,
+)
+from gatekeeper.storage.sharded_redis_storage import hash_tag
+
+
+def sketch(storage, **kwargs):
+    # A sketch of its own per test, since Redis keeps them across tests
+    return CountMinSketchLimiter(
+        name=f"cms_{time.perf_counter_ns()}", storage=storage, **kwargs
+    )
+
+
+class TestCountMinSketch:
+    def test_quota_frees_up_sub_window_by_sub_window(self, clock, storage_factory):
+        limiter = sketch(
+            storage_factory(), max_requests=4, window_seconds=10, sub_windows=5
+        )
+
+        # Sub-windows are 2s wide: [1_000_000, 1_000_002), [1_000_002, ...)
+        assert limiter.allow_many(["a", "a"]) == [True, True]
+        clock[0] += 2
+        assert limiter.allow_many(["a", "a", "a"]) == [True, True, False]
+        assert limiter.allow("b") is True
+
+        decision = limiter.check("a", cost=2)
+        assert decision == (False, 0, pytest.approx(7.5))
+        clock[0] += 7.5
+        assert limiter.check("a", cost=2) == (True, 0, 0.0)
+        assert limiter.check("a", cost=5).retry_after == float("inf")
+
+    def test_never_exceeds_limit_when_keys_collide(self, clock, storage_factory):
+        # Far more keys than counters: estimates are high, never low
+        limiter = sketch(
+            storage_factory(),
+            max_requests=5,
+            window_seconds=60,
+            width=16,
+            depth=2,
+        )
+        rng = random.Random(3)
+        allowed = {}
+        for _ in range(2000):
+            key = f"ip{rng.randrange(300)}"
+            if limiter.allow(key):
+                allowed[key] = allowed.get(key, 0) + 1
+        assert max(allowed.values()) <= 5
+        # Each grant needs some counter below the limit: at most 5 per counter
+        assert sum(allowed.values()) <= 2 * 16 * 5
+
+    def test_estimates_within_error_bound(self, clock, storage_factory):
+        limiter = sketch(
+            storage_factory(), max_requests=10**6, window_seconds=60, width=2048
+        )
+        rng = random.Random(5)
+        keys = [f"ip{rng.getrandbits(32)}" for _ in range(5000)]
+        limiter.allow_many(keys)
+
+        # Each key was counted once: e/width * N bounds the overcount
+        bound = 2.72 / 2048 * len(keys)
+        over = [10**6 - 1 - d.remaining for d in limiter.check_many(keys, [0] * 5000)]
+        assert min(over) >= 0
+        assert sum(o > bound for o in over) / len(over) < 0.02
+
+    def test_heavy_hitters(self, clock, storage_factory):
+        limiter = sketch(storage_factory(), max_requests=50, window_seconds=60, top_k=3)
+        keys = ["hot"] * 40 + ["warm"] * 20 + ["mild"] * 10
+        keys += [f"cold{i}" for i in range(100)]
+        random.Random(9).shuffle(keys)
+        limiter.allow_many(keys)
+
+        top = limiter.heavy_hitters()
+        assert [key for key, _ in top] == ["hot", "warm", "mild"]
+        assert top[0][1] >= 40
+        assert limiter.heavy_hitters(1) == top[:1]
+
+
+def test_local_heavy_hitters_follow_the_window(clock):
+    limiter = CountMinSketchLimiter(100, 60, width=1024, top_k=2)
+    limiter.allow_many(["a"] * 10 + ["b"] * 10 + ["c"] * 5)
+    assert limiter.heavy_hitters() == [("a", 10), ("b", 10)]
+
+    # A window later, earlier traffic no longer counts or blocks new keys
+    clock[0] += 61
+    limiter.allow_many(["a"] + ["d"] * 3)
+    assert limiter.heavy_hitters() == [("d", 3), ("a", 1)]
+
+    clock[0] += 61
+    assert limiter.heavy_hitters() == []
+
+
+def test_local_memory_is_fixed(clock):
+    limiter = CountMinSketchLimiter(100, 60, width=1024, depth=3, sub_windows=4)
+    for i in range(20_000):
+        clock[0] += 0.01
+        limiter.allow(f"ip{i}")
+
+    assert [len(s) for s in limiter._sketches] == [3 * 1024] * 4
+    assert len(limiter.storage._stripe("any").data) == 0
+
+
+def test_redis_keys_share_one_slot(clock):
+    limiter = CountMinSketchLimiter(10, 60, name="edge", top_k=5)
+    keys, args = limiter._script_call("203.0.113.7", 1, clock[0])
+    assert len(keys) == limiter.sub_windows + 1
+    assert {hash_tag(k) for k in keys} == {"edge"}
+    assert len(args) == 8 + limiter.depth
+
+    hashed = CountMinSketchLimiter(10, 60, key_encoder=HashedKeyEncoder())
+    keys, _ = hashed._script_call("203.0.113.7", 1, clock[0])
+    assert keys[-1].startswith("m:{") and len({hash_tag(k) for k in keys}) == 1
+
+
+def test_rejects_invalid_parameters():
+    with pytest.raises(ValueError):
+        CountMinSketchLimiter(10, 60, width=0)
+    with pytest.raises(ValueError):
+        CountMinSketchLimiter(10, 60, sub_windows=0)
+    with pytest.raises(ValueError):
+        CountMinSketchLimiter(10, 60, top_k=-1)
+    with pytest.raises(ValueError):
+        CompositeLimiter([CountMinSketchLimiter(10, 60)])
+
+
+def test_async_limiter(clock):
+    limiter = AsyncCountMinSketchLimiter(2, 10, top_k=2)
+
+    async def run():
+        allowed = [await limiter.allow("k") for _ in range(3)]
+        return allowed, await limiter.heavy_hitters()
+
+    assert asyncio.run(run()) == ([True, True, False], [("k", 2)])
@@ -0,0 +1,115 @@
+import asyncio
+import math
+import time
+import pytest
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    AsyncTokenBucketLimiter,
+    Decision,
+    FixedWindowLimiter,
+    GCRALimiter,
+    LeakyBucketLimiter,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+
+@pytest.fixture
+def sleeps(clock, monkeypatch):
+    """Sleeping advances the fake clock instantly; returns the sleeps taken."""
+    taken = []
+
+    def sleep(seconds):
+        taken.append(seconds)
+        clock[0] += seconds
+
+    async def async_sleep(seconds):
+        sleep(seconds)
+
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(time, "sleep", sleep)
+    monkeypatch.setattr(asyncio, "sleep", async_sleep)
+    return taken
+
+
+# Each limiter admits 4 units, then needs time to admit more
+limiter_factories = {
+    "fixed_window": lambda s: FixedWindowLimiter(4, 10, s),
+    "sliding_window_log": lambda s: SlidingWindowLogLimiter(4, 10, s),
+    "sliding_window_counter": lambda s: SlidingWindowCounterLimiter(4, 10, s),
+    "token_bucket": lambda s: TokenBucketLimiter(4, 0.5, s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(4, 0.5, s),
+    "bucketed_sliding_window": lambda s: BucketedSlidingWindowLimiter(4, 10, 5, s),
+    "gcra": lambda s: GCRALimiter(4, 8, storage=s),
+}
+
+
+@pytest.mark.parametrize("factory", limiter_factories.values(), ids=limiter_factories)
+class TestDecisions:
+    def test_weighted_costs(self, clock, storage_factory, factory):
+        limiter = factory(storage_factory())
+        key = f"weighted_{time.perf_counter_ns()}"
+
+        assert limiter.check(key, cost=3) == Decision(True, 1, 0.0)
+        decision = limiter.check(key, cost=2)
+        assert decision.allowed is False
+        assert decision.retry_after > 0
+        assert limiter.allow(key, cost=5) is False
+        assert limiter.check(key, cost=5).retry_after == math.inf
+
+    def test_retry_after_is_exact(self, clock, storage_factory, factory):
+        now = clock
+        limiter = factory(storage_factory())
+        key = f"retry_{time.perf_counter_ns()}"
+
+        assert limiter.allow(key, cost=2) is True
+        now[0] += 1.5
+        assert limiter.allow(key, cost=2) is True
+        decision = limiter.check(key)
+        assert decision.allowed is False
+
+        now[0] += decision.retry_after - 0.01
+        assert limiter.allow(key) is False
+        now[0] += 0.01
+        assert limiter.allow(key) is True
+
+    def test_acquire_sleeps_once_for_retry_after(
+        self, sleeps, storage_factory, factory
+    ):
+        limiter = factory(storage_factory())
+        key = f"acquire_{time.perf_counter_ns()}"
+
+        assert limiter.allow(key, cost=4) is True
+        retry_after = limiter.check(key).retry_after
+
+        # Give up straight away when capacity cannot arrive in time
+        assert limiter.acquire(key, timeout=retry_after / 2) is False
+        assert limiter.acquire(key, cost=5) is False
+        assert sleeps == []
+
+        assert limiter.acquire(key, timeout=retry_after + 1) is True
+        assert len(sleeps) == 1
+        assert sleeps[0] == pytest.approx(retry_after, abs=0.02)
+
+
+def test_check_many_reports_each_key(clock):
+    limiter = TokenBucketLimiter(capacity=5, refill_rate=2)
+
+    assert limiter.check_many(["a", "b", "a"], [4, 1, 2]) == [
+        Decision(True, 1, 0.0),
+        Decision(True, 4, 0.0),
+        Decision(False, 1, 0.5),
+    ]
+
+
+def test_async_acquire(sleeps):
+    limiter = AsyncTokenBucketLimiter(capacity=2, refill_rate=4)
+
+    async def scenario():
+        assert await limiter.allow("k", cost=2) is True
+        assert (await limiter.check("k")).retry_after == pytest.approx(0.25)
+        assert await limiter.acquire("k", cost=2, timeout=1) is True
+
+    asyncio.run(scenario())
+    assert sleeps == [pytest.approx(0.5)]
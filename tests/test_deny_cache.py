@@ -0,0 +1,102 @@
+import time
+import pytest
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    InMemoryStorage,
+    LeakyBucketLimiter,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+from gatekeeper.algorithms.deny_cache import DenyCache
+
+
+class CountingStorage(InMemoryStorage):
+    """Counts counter increments that reach the backend."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def incr(self, *args, **kwargs):
+        self.calls += 1
+        return super().incr(*args, **kwargs)
+
+
+def test_denials_skip_backend_until_window_end(clock):
+    storage = CountingStorage()
+    limiter = FixedWindowLimiter(
+        max_requests=2, window_seconds=10, storage=storage, deny_cache_size=100
+    )
+
+    assert [limiter.allow("k") for _ in range(3)] == [True, True, False]
+    assert storage.calls == 3
+
+    assert not any(limiter.allow("k") for _ in range(50))
+    assert storage.calls == 3
+    assert limiter.deny_cache.stats() == {"hits": 50, "misses": 3, "size": 1}
+
+    # The window ends at 1_000_010: the cached denial expires with it
+    clock[0] = 1_000_009.99
+    assert limiter.allow("k") is False
+    clock[0] = 1_000_010.0
+    assert limiter.allow("k") is True
+
+
+def test_smaller_costs_are_not_answered_from_cache(clock):
+    limiter = TokenBucketLimiter(capacity=5, refill_rate=1, deny_cache_size=100)
+
+    assert limiter.allow_many(["k", "k"], costs=[4, 2]) == [True, False]
+    # 1 token left: a cost of 2 or more is cached, a single token is not
+    assert limiter.allow_many(["k", "k"], costs=[3, 1]) == [False, True]
+    assert limiter.deny_cache.stats()["hits"] == 1
+
+    # The denial expires at its refill time, but the cost-1 request drained
+    # the bucket meanwhile, so the backend denies once more
+    clock[0] += 1
+    assert limiter.allow_many(["k"], costs=[2]) == [False]
+    clock[0] += 1
+    assert limiter.allow_many(["k"], costs=[2]) == [True]
+
+
+def test_cache_is_bounded():
+    cache = DenyCache(max_keys=2)
+    for key in ("a", "b", "c"):
+        cache.add(key, 1, until=float("inf"))
+
+    assert cache.stats()["size"] == 2
+    assert not cache.denies("a", 1, 0.0)
+    assert cache.denies("c", 1, 0.0)
+
+
+limiter_factories = {
+    "fixed_window": lambda s, c: FixedWindowLimiter(5, 2, s, c),
+    "sliding_window_log": lambda s, c: SlidingWindowLogLimiter(5, 2, s, c),
+    "sliding_window_counter": lambda s, c: SlidingWindowCounterLimiter(5, 2, s, c),
+    "token_bucket": lambda s, c: TokenBucketLimiter(5, 2.5, s, c),
+    "leaky_bucket": lambda s, c: LeakyBucketLimiter(5, 2.5, s, c),
+    "bucketed_sliding_window": lambda s, c: BucketedSlidingWindowLimiter(5, 2, 4, s, c),
+    "gcra": lambda s, c: GCRALimiter(5, 2, storage=s, deny_cache_size=c),
+}
+
+
+@pytest.mark.parametrize("factory", limiter_factories.values(), ids=limiter_factories)
+def test_cached_decisions_match_backend(clock, storage_factory, factory):
+    plain = factory(storage_factory(), 0)
+    cached = factory(storage_factory(), 1000)
+    # Off the window grid, so no step lands within float noise of a boundary
+    clock[0] += 0.0001
+    # Redis storages share one server: keep the two limiters' keys apart
+    suffix = time.perf_counter_ns()
+    plain_key, cached_key = f"plain_{suffix}", f"cached_{suffix}"
+
+    # Bursty traffic over several windows: the cache never changes a decision
+    for step in range(400):
+        clock[0] += 0.013 if step % 50 else 0.9
+        costs = [1 + step % 3]
+        assert cached.allow_many([cached_key], costs) == plain.allow_many(
+            [plain_key], costs
+        )
+        assert cached.allow(cached_key) == plain.allow(plain_key)
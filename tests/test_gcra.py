@@ -0,0 +1,82 @@
+import asyncio
+import math
+import time
+import pytest
+from gatekeeper import (
+    AsyncGCRALimiter,
+    AsyncInMemoryStorage,
+    GCRALimiter,
+    InMemoryStorage,
+)
+
+
+class TestGCRA:
+    def test_burst_then_steady_rate(self, clock, storage_factory):
+        # One request per 0.5s, bursts of up to 4
+        limiter = GCRALimiter(4, 2, storage=storage_factory())
+        key = f"gcra_{time.perf_counter_ns()}"
+
+        decisions = [limiter.check(key) for _ in range(5)]
+        assert [d.allowed for d in decisions] == [True, True, True, True, False]
+        assert [d.remaining for d in decisions] == [3, 2, 1, 0, 0]
+        assert decisions[-1].retry_after == pytest.approx(0.5)
+
+        # After the burst, requests are spaced by the emission interval
+        clock[0] += 0.4
+        assert limiter.allow(key) is False
+        clock[0] += 0.1
+        assert limiter.allow(key) is True
+        assert limiter.allow(key) is False
+
+    def test_burst_smaller_than_rate(self, clock, storage_factory):
+        limiter = GCRALimiter(10, 1, burst=2, storage=storage_factory())
+        key = f"gcra_{time.perf_counter_ns()}"
+
+        assert limiter.allow_many([key, key, key]) == [True, True, False]
+        clock[0] += 0.1
+        assert limiter.allow(key) is True
+
+    def test_weighted_costs(self, clock, storage_factory):
+        limiter = GCRALimiter(4, 2, storage=storage_factory())
+        key = f"gcra_{time.perf_counter_ns()}"
+
+        assert limiter.check(key, cost=3) == (True, 1, 0.0)
+        decision = limiter.check(key, cost=2)
+        assert decision.allowed is False
+        assert decision.remaining == 1
+        assert decision.retry_after == pytest.approx(0.5)
+
+        clock[0] += 0.5
+        assert limiter.allow(key, cost=2) is True
+        # More than the burst can never pass
+        assert limiter.check(key, cost=5).retry_after == math.inf
+
+    def test_idle_key_recovers_full_burst(self, clock, storage_factory):
+        limiter = GCRALimiter(4, 2, storage=storage_factory())
+        key = f"gcra_{time.perf_counter_ns()}"
+
+        assert limiter.allow_many([key] * 4) == [True] * 4
+        clock[0] += 60
+        assert limiter.allow_many([key] * 5) == [True] * 4 + [False]
+
+
+def test_state_is_one_expiring_value(clock):
+    storage = InMemoryStorage()
+    limiter = GCRALimiter(4, 2, storage=storage)
+
+    assert limiter.allow_many(["a", "a"]) == [True, True]
+    assert storage.get("gcra:{a}") == pytest.approx(clock[0] + 1.0)
+    assert len(storage._stripes[0]) == 1
+
+    # The TAT is dropped once the clock has passed it
+    clock[0] += 1.01
+    assert storage.get("gcra:{a}") is None
+
+
+def test_async_limiter(clock):
+    limiter = AsyncGCRALimiter(2, 1, storage=AsyncInMemoryStorage())
+
+    async def run():
+        return [await limiter.allow("k") for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, False]
@@ -0,0 +1,116 @@
+import re
+import time
+import pytest
+import redis
+from gatekeeper import (
+    AsyncInMemoryStorage,
+    AsyncTokenBucketLimiter,
+    BucketedSlidingWindowLimiter,
+    CompositeLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    HashedKeyEncoder,
+    InMemoryStorage,
+    KeyEncoder,
+    LeakyBucketLimiter,
+    RedisStorage,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+from gatekeeper.storage.sharded_redis_storage import hash_tag
+
+LIMITERS = {
+    "fixed_window": lambda s, e: FixedWindowLimiter(3, 10, s, key_encoder=e),
+    "sliding_window_log": lambda s, e: SlidingWindowLogLimiter(3, 10, s, key_encoder=e),
+    "sliding_window_counter": lambda s, e: SlidingWindowCounterLimiter(
+        3, 10, s, key_encoder=e
+    ),
+    "token_bucket": lambda s, e: TokenBucketLimiter(3, 0.01, s, key_encoder=e),
+    "leaky_bucket": lambda s, e: LeakyBucketLimiter(3, 0.01, s, key_encoder=e),
+    "bucketed_sliding_window": lambda s, e: BucketedSlidingWindowLimiter(
+        3, 10, 5, s, key_encoder=e
+    ),
+    "gcra": lambda s, e: GCRALimiter(3, 300, storage=s, key_encoder=e),
+}
+
+LONG_KEY = "sk_live_" + "x" * 120
+
+
+def test_hashed_layout():
+    encoder = HashedKeyEncoder()
+    key = encoder.encode("tb", LONG_KEY)
+
+    assert re.fullmatch(r"t:\{[A-Za-z0-9_-]{11}\}", key)
+    assert encoder.encode("tb", LONG_KEY) == key
+    assert encoder.encode("lb", LONG_KEY) == "k:" + key[2:]
+    assert encoder.encode("tb", LONG_KEY + "y") != key
+    # Unknown prefixes are kept, the salt changes every digest
+    assert encoder.encode("custom", "a").startswith("custom:{")
+    assert HashedKeyEncoder(salt=b"other").encode("tb", LONG_KEY) != key
+    assert len(HashedKeyEncoder(digest_size=16).digest("a")) == 22
+
+    with pytest.raises(ValueError):
+        HashedKeyEncoder(digest_size=2)
+
+
+def test_base_encoder_keeps_raw_layout():
+    limiter = TokenBucketLimiter(3, 1, key_encoder=KeyEncoder())
+    assert limiter._key("tb", "user:1") == TokenBucketLimiter(3, 1)._key("tb", "user:1")
+
+
+@pytest.mark.parametrize("encoder", [None, HashedKeyEncoder()])
+@pytest.mark.parametrize("factory", LIMITERS.values(), ids=LIMITERS)
+def test_empty_keys_are_rejected(factory, encoder):
+    limiter = factory(InMemoryStorage(), encoder)
+    with pytest.raises(ValueError):
+        limiter.allow("")
+
+
+@pytest.mark.parametrize("factory", LIMITERS.values(), ids=LIMITERS)
+def test_script_keys_are_compact_and_tagged(factory):
+    limiter = factory(RedisStorage(redis.Redis()), HashedKeyEncoder())
+    keys, _ = limiter._script_call(LONG_KEY, 1, 1_000_000.5)
+
+    assert all(LONG_KEY not in k and len(k) < 32 for k in keys)
+    assert len({hash_tag(k) for k in keys}) == 1
+
+
+def test_storage_encoder_is_the_default():
+    encoder = HashedKeyEncoder()
+    storage = RedisStorage(redis.Redis(), key_encoder=encoder)
+    assert TokenBucketLimiter(3, 1, storage).key_encoder is encoder
+
+    # A limiter's own encoder wins
+    raw = KeyEncoder()
+    assert TokenBucketLimiter(3, 1, storage, key_encoder=raw).key_encoder is raw
+
+    storage = InMemoryStorage()
+    storage.key_encoder = encoder
+    assert GCRALimiter(3, 1, storage=storage).key_encoder is encoder
+
+
+@pytest.mark.parametrize("factory", LIMITERS.values(), ids=LIMITERS)
+def test_limits_hold_with_hashed_keys(storage_factory, factory):
+    limiter = factory(storage_factory(), HashedKeyEncoder())
+    key = f"{LONG_KEY}_{time.perf_counter_ns()}"
+
+    assert limiter.allow_many([key] * 4 + ["other"]) == [True] * 3 + [False, True]
+
+
+def test_composite_rules_share_the_encoder():
+    limiter = CompositeLimiter(
+        [FixedWindowLimiter(2, 10), TokenBucketLimiter(5, 0.01)],
+        key_encoder=HashedKeyEncoder(),
+    )
+    keys, _ = limiter._script_call(LONG_KEY, 1, 1_000_000.5)
+    assert [k.split(":")[:2] for k in keys] == [["rule0", "f"], ["rule1", "t"]]
+    assert limiter.allow_many(["k"] * 3) == [True, True, False]
+
+
+def test_async_limiter_uses_adapter_encoder():
+    storage = InMemoryStorage()
+    storage.key_encoder = HashedKeyEncoder()
+    limiter = AsyncTokenBucketLimiter(2, 0.01, storage=AsyncInMemoryStorage(storage))
+
+    assert limiter._limiter.key_encoder is storage.key_encoder
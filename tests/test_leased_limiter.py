@@ -0,0 +1,80 @@
+import time
+import pytest
+from gatekeeper import (
+    FixedWindowLimiter,
+    InMemoryStorage,
+    LeasedLimiter,
+    TokenBucketLimiter,
+)
+
+
+class CountingStorage(InMemoryStorage):
+    """Counts limiter decisions that reach the shared backend."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def token_bucket_consume(self, *args):
+        self.calls += 1
+        return super().token_bucket_consume(*args)
+
+
+def test_leases_cut_backend_calls():
+    storage = CountingStorage()
+    shared = TokenBucketLimiter(capacity=1000, refill_rate=0.001, storage=storage)
+    limiter = LeasedLimiter(shared, lease_size=50, lease_ttl=60)
+
+    assert all(limiter.allow("hot") for _ in range(500))
+    assert storage.calls == 10
+
+
+def test_pods_never_exceed_shared_quota():
+    storage = InMemoryStorage()
+    pods = [
+        LeasedLimiter(
+            TokenBucketLimiter(capacity=95, refill_rate=0.001, storage=storage),
+            lease_size=10,
+            lease_ttl=60,
+        )
+        for _ in range(3)
+    ]
+
+    allowed = sum(pod.allow("partner") for _ in range(50) for pod in pods)
+    # The last units that do not fit a whole lease are still handed out
+    assert allowed == 95
+
+
+def test_lease_expires():
+    storage = InMemoryStorage()
+    shared = FixedWindowLimiter(max_requests=100, window_seconds=60, storage=storage)
+    limiter = LeasedLimiter(shared, lease_size=10, lease_ttl=0.2)
+
+    assert limiter.allow("key") is True
+    time.sleep(0.3)
+    assert limiter.allow("key") is True
+    # Two leases of 10 were taken from the window
+    assert shared.allow_many(["key"], [80]) == [True]
+    assert shared.allow("key") is False
+
+
+def test_denied_lease_is_refunded():
+    shared = FixedWindowLimiter(max_requests=25, window_seconds=3600)
+    limiter = LeasedLimiter(shared, lease_size=10, lease_ttl=3600)
+
+    # Two leases, then the third is denied and the tail is granted directly
+    assert sum(limiter.allow("key") for _ in range(30)) == 25
+    assert shared.allow("key") is False
+
+
+def test_allow_many_mixes_local_and_leased():
+    shared = TokenBucketLimiter(capacity=20, refill_rate=0.001)
+    limiter = LeasedLimiter(shared, lease_size=5, lease_ttl=60)
+
+    assert limiter.allow_many(["a", "b", "a"], costs=[1, 7, 4]) == [True, True, True]
+    assert limiter.allow_many(["a"], costs=[1]) == [True]
+
+
+def test_invalid_lease_size():
+    with pytest.raises(ValueError):
+        LeasedLimiter(TokenBucketLimiter(capacity=1, refill_rate=1), lease_size=0)
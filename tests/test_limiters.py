@@ -91,3 +91,51 @@ class TestLimiters:
 
         time.sleep(0.6)
         assert limiter.allow(key) is True
+
+    @pytest.mark.parametrize(
+        "make_limiter",
+        [
+            lambda s: FixedWindowLimiter(max_requests=2, window_seconds=10, storage=s),
+            lambda s: SlidingWindowLogLimiter(
+                max_requests=2, window_seconds=10, storage=s
+            ),
+            lambda s: SlidingWindowCounterLimiter(
+                max_requests=2, window_seconds=10, storage=s
+            ),
+            lambda s: TokenBucketLimiter(capacity=2, refill_rate=0.01, storage=s),
+            lambda s: LeakyBucketLimiter(capacity=2, leak_rate=0.01, storage=s),
+        ],
+        ids=["fixed", "sliding_log", "sliding_counter", "token", "leaky"],
+    )
+    def test_allow_many(self, storage, make_limiter):
+        limiter = make_limiter(storage)
+        prefix = f"many_{storage.__class__.__name__}_{time.time()}"
+        a, b, c = f"{prefix}_a", f"{prefix}_b", f"{prefix}_c"
+
+        assert limiter.allow_many([a, b]) == [True, True]
+        assert limiter.allow_many([a, a, b]) == [True, False, True]
+        # Weighted costs: 2 units fill the limit at once, 3 more do not fit
+        assert limiter.allow_many([c, c], costs=[2, 3]) == [True, False]
+        assert limiter.allow(c) is False
+
+        with pytest.raises(ValueError):
+            limiter.allow_many([a, b], costs=[1])
+
+
+def test_lua_capability_detected_once():
+    class LuaStorage(InMemoryStorage):
+        def execute_lua(self, script, keys, args):
+            return [1, 0, "0"]
+
+    assert InMemoryStorage().supports_lua is False
+    assert SQLiteStorage(":memory:").supports_lua is False
+    assert LuaStorage().supports_lua is True
+
+    local = TokenBucketLimiter(capacity=1, refill_rate=0.01)
+    scripted = TokenBucketLimiter(capacity=1, refill_rate=0.01, storage=LuaStorage())
+    assert local._use_lua is False
+    assert scripted._use_lua is True
+
+    assert [local.allow("k"), local.allow("k")] == [True, False]
+    # Every call goes to the (stub) script, never to the local fallback
+    assert [scripted.allow("k"), scripted.allow("k")] == [True, True]
@@ -0,0 +1,150 @@
+import os
+import time
+import pytest
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    InMemoryStorage,
+    LeakyBucketLimiter,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+from gatekeeper.storage import snapshot
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "limits.snapshot")
+
+
+def limiters(storage):
+    return [
+        FixedWindowLimiter(3, 60, storage),
+        SlidingWindowLogLimiter(3, 60, storage),
+        SlidingWindowCounterLimiter(3, 60, storage),
+        TokenBucketLimiter(3, 0.01, storage),
+        LeakyBucketLimiter(3, 0.01, storage),
+        BucketedSlidingWindowLimiter(3, 60, 6, storage),
+        GCRALimiter(3, 60, storage=storage),
+    ]
+
+
+@pytest.mark.parametrize("stripes", [1, 4])
+def test_restart_keeps_limits(clock, path, stripes):
+    storage = InMemoryStorage(stripes=stripes, snapshot_path=path)
+    for limiter in limiters(storage):
+        assert limiter.allow_many(["a", "a", "b"]) == [True] * 3
+    storage.close()
+
+    clock[0] += 1
+    restarted = InMemoryStorage(stripes=stripes, snapshot_path=path)
+    assert restarted.stats()["keys"] == storage.stats()["keys"]
+    for limiter in limiters(restarted):
+        assert limiter.allow_many(["a", "a", "b", "c"]) == [True, False, True, True]
+
+
+def test_plain_values_round_trip(clock, path):
+    storage = InMemoryStorage()
+    storage.set("int", -(2**63))
+    storage.set("float", 2.5, expiry=60)
+    storage.set("text", "nul\x00é")
+    storage.set("bytes", b"\x00\xff")
+    storage.set("huge", 2**64)
+    storage.set("tuple", (1, 2))
+    assert storage.save_snapshot(path) == 4
+
+    restored = InMemoryStorage()
+    assert restored.load_snapshot(path) == 4
+    assert [restored.get(k) for k in ("int", "float", "text", "bytes")] == [
+        -(2**63),
+        2.5,
+        "nul\x00é",
+        b"\x00\xff",
+    ]
+    assert restored.get("huge") is None
+    clock[0] += 61
+    assert restored.get("float") is None
+
+
+def test_load_skips_expired_entries(clock, path):
+    storage = InMemoryStorage()
+    for i in range(100):
+        storage.incr(f"k{i}", 1, expiry=i + 1)
+    storage.add_timestamp("log", clock[0], expiry=50)
+    storage.save_snapshot(path)
+
+    clock[0] += 49.5
+    restored = InMemoryStorage()
+    assert restored.load_snapshot(path) == 52
+    assert restored.get("k48") is None
+    assert restored.get("k49") == 1
+    assert restored.count_timestamps("log", 0, clock[0]) == 1
+
+    # The restored expiry times are enforced by the sweep
+    clock[0] += 25
+    assert restored.purge_expired() == 26
+    assert restored.stats()["keys"] == 26
+
+
+def test_load_replaces_keys_and_respects_max_keys(clock, path):
+    storage = InMemoryStorage()
+    for i in range(10):
+        storage.set(f"k{i}", i)
+    storage.save_snapshot(path)
+
+    restored = InMemoryStorage(max_keys=5)
+    restored.add_timestamp("k0", clock[0])
+    restored.load_snapshot(path)
+    # k0 is replaced, then the least recently used keys go
+    assert restored.stats()["keys"] == 5
+    assert restored.stats()["evicted_keys"] == 5
+    assert restored.count_timestamps("k0", 0, clock[0]) == 0
+    assert restored.get("k9") == 9
+
+
+def test_failed_write_keeps_previous_snapshot(monkeypatch, path):
+    storage = InMemoryStorage()
+    storage.set("k", 1)
+    storage.save_snapshot(path)
+
+    def fail(kind, values):
+        raise OSError("disk full")
+
+    storage.set("k", 2)
+    monkeypatch.setattr(snapshot, "_encode", fail)
+    with pytest.raises(OSError):
+        storage.save_snapshot(path)
+    assert os.listdir(os.path.dirname(path)) == ["limits.snapshot"]
+
+    restored = InMemoryStorage()
+    restored.load_snapshot(path)
+    assert restored.get("k") == 1
+
+
+def test_periodic_snapshots(path):
+    storage = InMemoryStorage(snapshot_path=path, snapshot_interval=0.05)
+    storage.set("k", 1)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert os.path.exists(path)
+
+    storage.set("k", 2)
+    storage.close()
+    assert InMemoryStorage(snapshot_path=path).get("k") == 2
+
+
+def test_invalid_configuration(tmp_path, path):
+    with pytest.raises(ValueError):
+        InMemoryStorage(snapshot_interval=1)
+    with pytest.raises(ValueError):
+        InMemoryStorage(snapshot_path=path, snapshot_interval=0)
+    with pytest.raises(ValueError):
+        InMemoryStorage().save_snapshot()
+
+    other = tmp_path / "other"
+    other.write_bytes(b"not a snapshot at all")
+    with pytest.raises(ValueError):
+        InMemoryStorage(snapshot_path=str(other))
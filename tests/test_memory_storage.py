@@ -0,0 +1,124 @@
+import threading
+import time
+import pytest
+from gatekeeper import (
+    InMemoryStorage,
+    LeakyBucketLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+
+def test_striped_concurrent_increments():
+    storage = InMemoryStorage(stripes=8)
+
+    def worker():
+        for i in range(2000):
+            storage.incr(f"key:{i % 50}", 1, 60)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(storage.get(f"key:{i}") == 8 * 40 for i in range(50))
+
+
+def test_striped_batch_and_timestamps():
+    storage = InMemoryStorage(stripes=4)
+    limiter = SlidingWindowLogLimiter(
+        max_requests=2, window_seconds=10, storage=storage
+    )
+
+    assert limiter.allow_many(["a", "b", "a", "a"]) == [True, True, True, False]
+
+
+def test_invalid_stripe_count():
+    with pytest.raises(ValueError):
+        InMemoryStorage(stripes=0)
+
+
+def test_expired_keys_swept_without_access():
+    storage = InMemoryStorage()
+    for window in range(100):
+        storage.incr(f"fixed:user:{window}", 1, 1)
+    assert storage.stats()["keys"] == 100
+
+    time.sleep(1.1)
+    # Writes to unrelated keys sweep a bounded batch each
+    for i in range(10):
+        storage.incr(f"fixed:other:{i}", 1, 60)
+
+    stats = storage.stats()
+    assert stats["keys"] == 10
+    assert stats["expired_keys"] == 100
+
+
+def test_purge_expired():
+    storage = InMemoryStorage(stripes=4)
+    for i in range(20):
+        storage.add_timestamp(f"log:{i}", time.time(), 1)
+    storage.set("forever", 1)
+
+    time.sleep(1.1)
+    assert storage.purge_expired() == 20
+    assert storage.stats()["keys"] == 1
+    assert storage.get("forever") == 1
+
+
+def test_bucket_keys_expire_once_full_or_drained():
+    storage = InMemoryStorage()
+    limiters = [
+        TokenBucketLimiter(capacity=2, refill_rate=2, storage=storage),
+        LeakyBucketLimiter(capacity=2, leak_rate=2, storage=storage),
+    ]
+    for limiter in limiters:
+        assert all(limiter.allow_many([f"client:{i}" for i in range(50)]))
+    assert storage.stats()["keys"] == 100
+
+    time.sleep(1.1)
+    assert storage.purge_expired() == 100
+
+
+def test_max_keys_lru_eviction():
+    storage = InMemoryStorage(max_keys=3)
+    storage.set("a", 1)
+    storage.set("b", 2)
+    storage.set("c", 3)
+    storage.get("a")  # "b" is now the least recently used
+
+    storage.set("d", 4)
+
+    assert storage.get("b") is None
+    assert [storage.get(k) for k in ("a", "c", "d")] == [1, 3, 4]
+    assert storage.stats() == {"keys": 3, "expired_keys": 0, "evicted_keys": 1}
+
+
+def test_max_keys_ttl_eviction():
+    storage = InMemoryStorage(max_keys=2, eviction="ttl")
+    storage.set("long", 1, 100)
+    storage.set("short", 2, 10)
+
+    storage.set("new", 3, 50)
+
+    assert storage.get("short") is None
+    assert storage.get("long") == 1
+    assert storage.stats()["evicted_keys"] == 1
+
+
+def test_timestamps_out_of_order_count_and_trim():
+    storage = InMemoryStorage()
+    for ts in [5.0, 1.0, 3.0, 2.0, 4.0, 3.0]:
+        storage.add_timestamp("log", ts)
+
+    assert storage.count_timestamps("log", 2.0, 3.0) == 3
+    assert storage.count_timestamps("log", 0.0, 10.0) == 6
+
+    storage.remove_timestamps("log", 3.0)
+    assert storage.count_timestamps("log", 0.0, 10.0) == 2
+
+    for i in range(100):
+        storage.add_timestamp("log", 10.0 + i)
+        storage.remove_timestamps("log", 5.0 + i)
+    assert storage.count_timestamps("log", 0.0, 1000.0) == 5
@@ -0,0 +1,188 @@
+import asyncio
+import time
+import pytest
+from gatekeeper import (
+    AsyncFixedWindowLimiter,
+    FixedWindowLimiter,
+    InMemoryStorage,
+    LeasedLimiter,
+    Metrics,
+    RedisStorage,
+    TokenBucketLimiter,
+)
+
+
+def samples(metrics):
+    return {
+        (name, tuple(sorted(labels.items()))): value
+        for name, _, labels, value in metrics.collect()
+    }
+
+
+def test_decisions_paths_and_storage_ops():
+    metrics = Metrics()
+    storage = metrics.instrument(InMemoryStorage(), name="mem")
+    limiter = metrics.instrument(
+        TokenBucketLimiter(capacity=2, refill_rate=0.001, storage=storage)
+    )
+
+    assert [limiter.allow("k"), limiter.allow("k"), limiter.allow("k")] == [
+        True,
+        True,
+        False,
+    ]
+    assert limiter.allow_many(["a", "b"]) == [True, True]
+    assert limiter.check("k").allowed is False
+
+    values = samples(metrics)
+    decisions = "gatekeeper_decisions_total"
+    assert (
+        values[(decisions, (("limiter", "TokenBucketLimiter"), ("result", "allowed")))]
+        == 4
+    )
+    assert (
+        values[(decisions, (("limiter", "TokenBucketLimiter"), ("result", "denied")))]
+        == 2
+    )
+    assert (
+        values[
+            (
+                "gatekeeper_decision_paths_total",
+                (("limiter", "TokenBucketLimiter"), ("path", "local")),
+            )
+        ]
+        == 6
+    )
+    # allow, allow, allow, check_many, check
+    latency = values[
+        ("gatekeeper_decision_seconds", (("limiter", "TokenBucketLimiter"),))
+    ]
+    assert latency["count"] == 5
+    op = values[
+        (
+            "gatekeeper_storage_op_seconds",
+            (("op", "token_bucket_consume"), ("storage", "mem")),
+        )
+    ]
+    assert op["count"] == 6
+    assert op["buckets"][-1] == (float("inf"), 6)
+
+
+def test_lua_path_and_deny_cache_hits():
+    class LuaStorage(InMemoryStorage):
+        def execute_lua(self, script, keys, args):
+            return [0, 0, "10"]
+
+    metrics = Metrics()
+    limiter = metrics.instrument(
+        TokenBucketLimiter(1, 1, storage=LuaStorage(), deny_cache_size=10), name="tb"
+    )
+    assert not any(limiter.allow("k") for _ in range(4))
+
+    values = samples(metrics)
+    assert (
+        values[
+            ("gatekeeper_decision_paths_total", (("limiter", "tb"), ("path", "lua")))
+        ]
+        == 1
+    )
+    assert values[("gatekeeper_deny_cache_hits_total", (("limiter", "tb"),))] == 3
+
+
+def test_leased_decisions_are_counted():
+    metrics = Metrics()
+    shared = metrics.instrument(TokenBucketLimiter(25, 0.001), name="shared")
+    limiter = metrics.instrument(LeasedLimiter(shared, lease_size=10), name="leased")
+
+    # Two leases, then the tail of the bucket is forwarded request by request
+    assert sum(limiter.allow("k") for _ in range(30)) == 25
+    assert limiter.allow("k", cost=30) is False
+
+    values = samples(metrics)
+    for label in ("shared", "leased"):
+        decisions = "gatekeeper_decisions_total"
+        assert values[(decisions, (("limiter", label), ("result", "allowed")))] == 25
+        assert values[(decisions, (("limiter", label), ("result", "denied")))] == 6
+    lease_path = (("limiter", "leased"), ("path", "lease"))
+    assert values[("gatekeeper_decision_paths_total", lease_path)] == 21
+
+
+def test_lease_refunds_are_not_counted_as_decisions(redis_client):
+    metrics = Metrics()
+    storage = RedisStorage(redis_client)
+    shared = metrics.instrument(FixedWindowLimiter(25, 60, storage), name="shared")
+    limiter = LeasedLimiter(shared, lease_size=10)
+    key = f"refund_{time.perf_counter_ns()}"
+
+    assert sum(shared.allow(key) for _ in range(20)) == 20
+    # The lease is denied and refunded, then the request is forwarded
+    assert limiter.allow(key) is True
+
+    # Single decisions are one INCR; the lease and the forwarded request are
+    # scripted, the refund is not a decision
+    values = samples(metrics)
+    paths = "gatekeeper_decision_paths_total"
+    assert values[(paths, (("limiter", "shared"), ("path", "local")))] == 20
+    assert values[(paths, (("limiter", "shared"), ("path", "lua")))] == 2
+
+
+def test_storage_errors_are_counted():
+    class Broken(InMemoryStorage):
+        def incr(self, key, amount=1, expiry=None):
+            raise ConnectionError("down")
+
+    metrics = Metrics()
+    limiter = FixedWindowLimiter(5, 1, storage=metrics.instrument(Broken(), name="b"))
+    with pytest.raises(ConnectionError):
+        limiter.allow("k")
+
+    values = samples(metrics)
+    assert (
+        values[("gatekeeper_storage_errors_total", (("op", "incr"), ("storage", "b")))]
+        == 1
+    )
+
+
+def test_async_limiter_records_each_call_once():
+    metrics = Metrics()
+    limiter = metrics.instrument(AsyncFixedWindowLimiter(1, 60), name="afw")
+
+    async def scenario():
+        return [await limiter.allow("k"), await limiter.allow("k")]
+
+    assert asyncio.run(scenario()) == [True, False]
+    values = samples(metrics)
+    assert (
+        values[
+            ("gatekeeper_decisions_total", (("limiter", "afw"), ("result", "allowed")))
+        ]
+        == 1
+    )
+    assert (
+        values[
+            ("gatekeeper_decisions_total", (("limiter", "afw"), ("result", "denied")))
+        ]
+        == 1
+    )
+    assert values[("gatekeeper_decision_seconds", (("limiter", "afw"),))]["count"] == 2
+
+
+def test_uninstrumented_objects_are_untouched():
+    Metrics().instrument(TokenBucketLimiter(1, 1))
+    limiter = TokenBucketLimiter(1, 1)
+    storage = InMemoryStorage()
+
+    assert "allow" not in vars(limiter)
+    assert "get" not in vars(storage)
+
+
+def test_prometheus_text_format():
+    metrics = Metrics()
+    limiter = metrics.instrument(FixedWindowLimiter(1, 60), name='a"b')
+    limiter.allow("k")
+
+    text = metrics.render_prometheus()
+    assert "# TYPE gatekeeper_decisions_total counter" in text
+    assert 'gatekeeper_decisions_total{limiter="a\\"b",result="allowed"} 1' in text
+    assert 'gatekeeper_decision_seconds_bucket{limiter="a\\"b",le="+Inf"} 1' in text
+    assert 'gatekeeper_decision_seconds_count{limiter="a\\"b"} 1' in text
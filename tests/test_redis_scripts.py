@@ -0,0 +1,116 @@
+import time
+import pytest
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    GCRALimiter,
+    LeakyBucketLimiter,
+    RedisStorage,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+
+def test_script_reloaded_after_flush(redis_client):
+    limiter = TokenBucketLimiter(
+        capacity=3, refill_rate=0.01, storage=RedisStorage(redis_client)
+    )
+    key = f"script_flush_{time.time()}"
+
+    assert limiter.allow(key) is True
+    # Simulates a Redis restart/failover emptying the script cache
+    redis_client.script_flush()
+    assert limiter.allow(key) is True
+
+    redis_client.script_flush()
+    assert limiter.allow_many([key, key]) == [True, False]
+
+
+# Each admits 4 units, then needs time to admit more
+SCRIPTED = {
+    "token_bucket": lambda s: TokenBucketLimiter(4, 0.5, s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(4, 0.5, s),
+    "sliding_window_counter": lambda s: SlidingWindowCounterLimiter(4, 10, s),
+    "sliding_window_log": lambda s: SlidingWindowLogLimiter(4, 10, s),
+    "bucketed_sliding_window": lambda s: BucketedSlidingWindowLimiter(4, 10, 5, s),
+    "gcra": lambda s: GCRALimiter(4, 8, storage=s),
+}
+
+
+@pytest.mark.parametrize("factory", SCRIPTED.values(), ids=SCRIPTED)
+def test_storage_operations_match_limiter_scripts(redis_client, factory):
+    limiter = factory(RedisStorage(redis_client))
+    scripted, mixed = (f"parity_{name}_{time.perf_counter_ns()}" for name in "ab")
+    now = 1_000_000.5
+
+    # `mixed` alternates between the limiter's script and the storage step
+    for step, (cost, elapsed) in enumerate(
+        [(1, 0), (2, 0.1), (2, 0.2), (1, 1.5), (3, 2.5), (5, 0), (1, 9), (4, 12)]
+    ):
+        now += elapsed
+        expected = limiter._decide(scripted, cost, now)
+        decide = limiter._allow_local if step % 2 else limiter._decide
+        decision = decide(mixed, cost, now)
+
+        assert decision.allowed == expected.allowed
+        assert decision.remaining == expected.remaining
+        assert decision.retry_after == pytest.approx(expected.retry_after)
+
+
+def bucket_limiters(redis_client):
+    storage = RedisStorage(redis_client)
+    # Full again (or drained) 10 ms after the last request
+    return {
+        "tb": TokenBucketLimiter(capacity=2, refill_rate=200, storage=storage),
+        "lb": LeakyBucketLimiter(capacity=2, leak_rate=200, storage=storage),
+    }
+
+
+@pytest.mark.parametrize("prefix", ["tb", "lb"])
+def test_bucket_state_is_one_expiring_hash(redis_client, prefix):
+    limiter = bucket_limiters(redis_client)[prefix]
+    limiter.refill_rate = limiter.leak_rate = 0.5
+    key = f"bucket_hash_{time.perf_counter_ns()}"
+
+    assert limiter.allow_many([key, key, key]) == [True, True, False]
+    assert redis_client.keys(f"{prefix}:*{key}*") == [f"{prefix}:{{{key}}}".encode()]
+    assert redis_client.type(f"{prefix}:{{{key}}}") == b"hash"
+    # Time to refill or drain 2 units at 0.5/s
+    assert 3000 < redis_client.pttl(f"{prefix}:{{{key}}}") <= 4000
+
+
+@pytest.mark.parametrize("prefix", ["tb", "lb"])
+def test_bucket_keyspace_bounded_under_churn(redis_client, prefix):
+    limiter = bucket_limiters(redis_client)[prefix]
+    run = time.perf_counter_ns()
+
+    for batch in range(5):
+        keys = [f"churn_{run}_{batch}_{i}" for i in range(200)]
+        assert all(limiter.allow_many(keys))
+        # One key per client seen recently, none from earlier rounds
+        assert len(redis_client.keys(f"{prefix}:*churn_{run}_*")) <= 200
+        time.sleep(0.05)
+
+    assert redis_client.keys(f"{prefix}:*churn_{run}_*") == []
+
+
+def test_legacy_bucket_keys_migrated(redis_client):
+    limiter = bucket_limiters(redis_client)["tb"]
+    limiter.refill_rate = 0.5
+    now = time.time()
+    active, idle = (f"legacy_{n}_{time.perf_counter_ns()}" for n in ("a", "b"))
+    for key in (active, idle):
+        redis_client.set(f"tb:{key}:tokens", 0)
+        redis_client.set(f"tb:{key}:ts", now)
+
+    # Converted on the next decision, keeping the empty bucket
+    assert limiter.allow(active) is False
+    assert not redis_client.exists(f"tb:{active}:tokens", f"tb:{active}:ts")
+    assert redis_client.type(f"tb:{{{active}}}") == b"hash"
+    assert redis_client.pttl(f"tb:{{{active}}}") > 0
+
+    # Idle clients are converted by the sweep
+    assert limiter.migrate_legacy_keys() == 1
+    assert not redis_client.exists(f"tb:{idle}:tokens", f"tb:{idle}:ts")
+    assert redis_client.pttl(f"tb:{{{idle}}}") > 0
+    assert limiter.allow(idle) is False
@@ -0,0 +1,123 @@
+import os
+import time
+import pytest
+import redis
+from redis.crc import key_slot
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    FixedWindowLimiter,
+    GCRALimiter,
+    LeakyBucketLimiter,
+    ShardedRedisStorage,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+from gatekeeper.storage.sharded_redis_storage import hash_tag
+
+LIMITERS = {
+    "fixed_window": lambda s: FixedWindowLimiter(3, 10, s),
+    "sliding_window_log": lambda s: SlidingWindowLogLimiter(3, 10, s),
+    "sliding_window_counter": lambda s: SlidingWindowCounterLimiter(3, 10, s),
+    "token_bucket": lambda s: TokenBucketLimiter(3, 0.01, s),
+    "leaky_bucket": lambda s: LeakyBucketLimiter(3, 0.01, s),
+    "bucketed_sliding_window": lambda s: BucketedSlidingWindowLimiter(3, 10, 5, s),
+    "gcra": lambda s: GCRALimiter(3, 300, storage=s),
+}
+
+
+def unconnected_storage(names):
+    # Clients only connect on their first command
+    return ShardedRedisStorage({name: redis.Redis() for name in names})
+
+
+def test_hash_tag():
+    assert hash_tag("tb:{user:1}") == "user:1"
+    assert hash_tag("swc:{a}:123") == "a"
+    assert hash_tag("plain") == "plain"
+    assert hash_tag("empty:{}") == "empty:{}"
+    assert hash_tag("x:{a}b}") == "a"
+
+
+@pytest.mark.parametrize("factory", LIMITERS.values(), ids=LIMITERS)
+def test_script_keys_share_one_slot(factory):
+    limiter = factory(unconnected_storage(["a", "b"]))
+    for key in ("user:1", "10.0.0.1", "a}b", "{x}"):
+        keys, _ = limiter._script_call(key, 1, 1_000_000.5)
+        assert len({key_slot(k.encode()) for k in keys}) == 1
+        assert len({id(limiter.storage.node_for(k)) for k in keys}) == 1
+
+
+def test_consistent_hashing_moves_few_keys():
+    keys = [f"tb:{{client:{i}}}" for i in range(4000)]
+    before = unconnected_storage(["a", "b", "c"])
+    after = unconnected_storage(["a", "b", "c", "d"])
+
+    placed = {k: before.node_for(k) for k in keys}
+    counts = {}
+    for node in placed.values():
+        counts[id(node)] = counts.get(id(node), 0) + 1
+    assert all(900 < c < 1800 for c in counts.values())
+
+    names = {id(node): name for name, node in before.nodes.items()}
+    moved = [
+        k
+        for k in keys
+        if after.nodes.get(names[id(placed[k])]) is not after.node_for(k)
+    ]
+    # About a quarter of the keys move, all of them to the new node
+    assert 0.15 < len(moved) / len(keys) < 0.35
+    assert all(after.node_for(k) is after.nodes["d"] for k in moved)
+
+
+def test_nodes_need_distinct_names():
+    pools = [redis.ConnectionPool(host="localhost", port=6379) for _ in range(2)]
+    with pytest.raises(ValueError):
+        ShardedRedisStorage([redis.Redis(connection_pool=pool) for pool in pools])
+    with pytest.raises(ValueError):
+        ShardedRedisStorage({})
+
+
+def get_shard_clients():
+    """
+    Clients for the nodes in GATEKEEPER_REDIS_SHARDS (comma separated URLs
+    of local redis-server instances), else three databases of the default
+    local server standing in for independent nodes.
+    """
+    urls = os.environ.get("GATEKEEPER_REDIS_SHARDS")
+    try:
+        if urls:
+            clients = {url: redis.Redis.from_url(url) for url in urls.split(",")}
+        else:
+            clients = {
+                f"db{db}": redis.Redis(
+                    host="localhost", port=6379, db=db, socket_connect_timeout=0.1
+                )
+                for db in (13, 14, 15)
+            }
+        if all(client.ping() for client in clients.values()):
+            return clients
+    except (redis.ConnectionError, redis.TimeoutError):
+        pass
+    return None
+
+
+shard_clients = get_shard_clients()
+
+
+@pytest.mark.skipif(shard_clients is None, reason="Redis is not available")
+@pytest.mark.parametrize("factory", LIMITERS.values(), ids=LIMITERS)
+def test_limiters_on_shards(factory):
+    storage = ShardedRedisStorage(shard_clients)
+    limiter = factory(storage)
+    run = time.perf_counter_ns()
+    keys = [f"shard_{run}_{i}" for i in range(30)]
+
+    assert limiter.allow_many(keys * 4) == [True] * 90 + [False] * 30
+    assert all(limiter.check(k).allowed is False for k in keys)
+
+    # The clients are spread over every node
+    used = {
+        name for name, client in shard_clients.items() if client.keys(f"*shard_{run}_*")
+    }
+    assert used == set(shard_clients)
@@ -0,0 +1,158 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+import pytest
+from gatekeeper import (
+    AsyncSharedMemoryStorage,
+    AsyncTokenBucketLimiter,
+    FixedWindowLimiter,
+    SharedMemoryStorage,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "limits")
+
+
+def test_values_and_expiry(path):
+    storage = SharedMemoryStorage(path, slots=256, stripes=4)
+    storage.set("int", 3)
+    storage.set("float", 1.5)
+    storage.set("str", "x" * 500)
+    storage.set("short", "gone", expiry=1)
+
+    assert storage.get("int") == 3
+    assert storage.get("float") == 1.5
+    assert storage.get("str") == "x" * 500
+    assert storage.incr("int", 2) == 5
+    assert storage.get("missing") is None
+
+    time.sleep(1.1)
+    assert storage.get("short") is None
+
+
+def test_long_values_release_their_slots(path):
+    storage = SharedMemoryStorage(path, slots=256, stripes=1)
+    storage.set("v", "x" * 330)  # head slot plus 10 chunks of 32 bytes
+    assert storage.stats()["used_slots"] == 11
+
+    storage.set("v", "short")
+    assert storage.stats()["used_slots"] == 1
+    assert storage.get("v") == "short"
+
+
+def test_reopen_keeps_data_and_shape(path):
+    storage = SharedMemoryStorage(path, slots=256, stripes=4)
+    storage.incr("hits", 7)
+    storage.close()
+
+    reopened = SharedMemoryStorage(path, slots=1 << 20, stripes=64)
+    assert (reopened.stripes, reopened.slots_per_stripe) == (4, 64)
+    assert reopened.get("hits") == 7
+
+
+def test_rejects_foreign_file(path):
+    with open(path, "wb") as f:
+        f.write(b"not a table")
+    with pytest.raises(ValueError):
+        SharedMemoryStorage(path)
+
+
+def test_full_table_and_reclaimed_slots(path):
+    storage = SharedMemoryStorage(path, slots=64, stripes=1)
+    for i in range(57):
+        storage.set(f"k{i}", i, expiry=1)
+    with pytest.raises(RuntimeError):
+        storage.set("one_too_many", 1)
+
+    time.sleep(1.1)
+    # Expired keys make room again
+    storage.set("one_too_many", 1)
+    storage.purge_expired()
+    assert storage.stats()["used_slots"] == 1
+    assert storage.get("one_too_many") == 1
+
+
+def test_deletions_keep_probe_runs_intact(path):
+    storage = SharedMemoryStorage(path, slots=128, stripes=1)
+    rng = random.Random(3)
+    live = {}
+    for step in range(2000):
+        key = f"k{rng.randrange(150)}"
+        if key in live and rng.random() < 0.5:
+            # Expire the key now so the next lookup deletes it
+            storage.set(key, 0, expiry=-1)
+            assert storage.get(key) is None
+            del live[key]
+        elif key in live or len(live) < 100:
+            storage.set(key, step)
+            live[key] = step
+    for key, value in live.items():
+        assert storage.get(key) == value
+    assert storage.stats()["used_slots"] == len(live)
+
+
+def test_sliding_counter_update_survives_removing_the_previous_window(path):
+    storage = SharedMemoryStorage(path, slots=1024, stripes=1)
+    # Three keys sharing a home slot, far from where the sweep starts
+    by_home = {}
+    for i in range(100_000):
+        home = storage._home(storage._locate(f"k{i}")[0])
+        keys = by_home.setdefault(home, [])
+        keys.append(f"k{i}")
+        if home > 512 and len(keys) == 3:
+            break
+    prev, curr, other = keys
+    for key in keys:
+        storage.set(key, 1)
+    storage.set(prev, 1, expiry=-1)
+
+    # Dropping the expired previous window shifts the run back a slot
+    assert storage.sliding_counter_add(curr, prev, 0.5, 10, 1, 60) == (True, 1, 0)
+    assert storage.get(curr) == 2
+    assert storage.get(other) == 1
+
+
+def _worker(path, rounds, results):
+    storage = SharedMemoryStorage(path)
+    limiter = FixedWindowLimiter(300, 3600, storage)
+    bucket = TokenBucketLimiter(100, 0.001, storage)
+    log = SlidingWindowLogLimiter(50, 3600, storage)
+    allowed = sum(limiter.allow("shared") for _ in range(rounds))
+    taken = sum(bucket.allow("shared") for _ in range(rounds // 4))
+    logged = sum(log.allow("shared") for _ in range(rounds // 8))
+    for _ in range(rounds):
+        storage.incr("counter")
+    results.put((allowed, taken, logged))
+
+
+def test_limits_hold_across_processes(path):
+    SharedMemoryStorage(path, slots=1024).close()
+    ctx = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(path, 200, results)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    totals = [results.get(timeout=60) for _ in procs]
+    for p in procs:
+        p.join()
+
+    assert [sum(column) for column in zip(*totals)] == [300, 100, 50]
+    assert SharedMemoryStorage(path).get("counter") == 800
+
+
+def test_async_adapter(path):
+    limiter = AsyncTokenBucketLimiter(2, 0.01, storage=AsyncSharedMemoryStorage(path))
+
+    async def run():
+        return [await limiter.allow("k") for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, False]
+    assert os.path.getsize(path) > 0
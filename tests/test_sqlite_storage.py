@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+import time
+import pytest
+from gatekeeper import LeakyBucketLimiter, SQLiteStorage, TokenBucketLimiter
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"wal": True}, {"wal": True, "commit_interval": 0.01}],
+    ids=["default", "wal", "group_commit"],
+)
+def test_concurrent_increments(tmp_path, options):
+    storage = SQLiteStorage(str(tmp_path / "limits.db"), **options)
+
+    def worker():
+        for _ in range(100):
+            storage.incr("counter", 1, 60)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert storage.get("counter") == "400"
+    storage.close()
+
+
+def _open_files(path):
+    fds = "/proc/self/fd"
+    return sum(
+        os.path.realpath(os.path.join(fds, fd)) == path for fd in os.listdir(fds)
+    )
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_connections_of_finished_threads_are_closed(tmp_path):
+    path = os.path.realpath(tmp_path / "limits.db")
+    storage = SQLiteStorage(path)
+
+    for _ in range(50):
+        thread = threading.Thread(target=storage.incr, args=("counter", 1, 60))
+        thread.start()
+        thread.join()
+
+    assert storage.get("counter") == "50"
+    # The main thread's connection is the only one left
+    assert len(storage._connections) == 1
+    assert _open_files(path) == 1
+    storage.close()
+    assert _open_files(path) == 0
+
+
+def test_wal_mode(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "limits.db"), wal=True)
+    journal_mode = storage.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert journal_mode == "wal"
+    storage.close()
+
+
+def test_group_commit_flushes_in_background(tmp_path):
+    path = str(tmp_path / "limits.db")
+    storage = SQLiteStorage(path, commit_interval=0.05)
+    storage.set("key", "value")
+
+    time.sleep(0.2)
+    other = sqlite3.connect(path)
+    row = other.execute("SELECT value FROM kv_store WHERE key = 'key'").fetchone()
+    other.close()
+    assert row == ("value",)
+
+    storage.close()
+
+
+def test_close_commits_pending_writes(tmp_path):
+    path = str(tmp_path / "limits.db")
+    storage = SQLiteStorage(path, commit_interval=60)
+    storage.set("key", "value")
+    storage.close()
+
+    assert SQLiteStorage(path).get("key") == "value"
+
+
+def test_reads_do_not_wait_for_the_write_lock(tmp_path):
+    path = str(tmp_path / "limits.db")
+    storage = SQLiteStorage(path, wal=True)
+    storage.set("key", "value")
+    storage.add_timestamp("log", 1.0)
+
+    # Another process holds the write lock
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    start = time.monotonic()
+    assert storage.get("key") == "value"
+    assert storage.count_timestamps("log", 0, 2) == 1
+    assert storage.timestamp_at("log", 0) == 1.0
+    assert time.monotonic() - start < 1
+    writer.rollback()
+    writer.close()
+    storage.close()
+
+
+@pytest.mark.parametrize(
+    "make_limiter",
+    [
+        lambda s: TokenBucketLimiter(capacity=100, refill_rate=0.001, storage=s),
+        lambda s: LeakyBucketLimiter(capacity=100, leak_rate=0.001, storage=s),
+    ],
+    ids=["token", "leaky"],
+)
+def test_concurrent_bucket_decisions_are_atomic(tmp_path, make_limiter):
+    limiter = make_limiter(SQLiteStorage(str(tmp_path / "limits.db"), wal=True))
+    results = []
+
+    def worker():
+        results.extend(limiter.allow("client") for _ in range(50))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == 100
+
+
+def test_expired_counter_restarts(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "limits.db"))
+    assert storage.incr("counter", 5, 1) == 5
+    assert storage.incr("counter", 1) == 6
+
+    time.sleep(1.1)
+    assert storage.incr("counter", 1, 1) == 1
+
+
+def count_rows(storage, table):
+    return storage.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_sweeper_deletes_expired_rows_of_untouched_keys(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "limits.db"), sweep_interval=0)
+    for window in range(50):
+        storage.incr(f"fixed:user:{window}", 1, 1)
+        storage.add_timestamp("sliding_log:user", time.time(), 1)
+    assert count_rows(storage, "kv_store") == 50
+    assert count_rows(storage, "timestamps") == 50
+
+    time.sleep(1.1)
+    assert storage.get("fixed:user:0") is None  # expired rows are invisible
+    storage.incr("fixed:other", 1, 60)
+
+    assert count_rows(storage, "kv_store") == 1
+    assert count_rows(storage, "timestamps") == 0
+
+
+def test_purge_expired_with_incremental_vacuum(tmp_path):
+    storage = SQLiteStorage(
+        str(tmp_path / "limits.db"),
+        sweep_interval=None,
+        sweep_batch=100,
+        incremental_vacuum=True,
+    )
+    assert storage.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # incremental
+
+    with storage.batch():
+        for i in range(1000):
+            storage.set(f"key:{i}", "x" * 100, 1)
+    storage.set("forever", "1")
+
+    time.sleep(1.1)
+    assert storage.purge_expired() == 1000
+    assert count_rows(storage, "kv_store") == 1
+    assert storage.conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
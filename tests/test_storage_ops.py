@@ -0,0 +1,132 @@
+import sys
+import threading
+import time
+import pytest
+from gatekeeper import (
+    BucketedSlidingWindowLimiter,
+    GCRALimiter,
+    LeakyBucketLimiter,
+    SlidingWindowCounterLimiter,
+    SlidingWindowLogLimiter,
+    TokenBucketLimiter,
+)
+
+
+class TestAlgorithmOperations:
+    def test_sliding_counter_add(self, clock, storage_factory):
+        storage = storage_factory()
+        key = f"op_{time.perf_counter_ns()}"
+        curr, prev = f"swc:{{{key}}}:2", f"swc:{{{key}}}:1"
+        storage.incr(prev, 2, 60)
+
+        # Estimate 0 + 2 * 0.5 = 1: room for two more under a limit of 3
+        assert storage.sliding_counter_add(curr, prev, 0.5, 3, 2, 60) == (
+            True,
+            0,
+            2,
+        )
+        assert storage.sliding_counter_add(curr, prev, 0.5, 3, 1, 60) == (
+            False,
+            2,
+            2,
+        )
+        assert storage.sliding_counter_add(curr, prev, 0.0, 3, 1, 60) == (
+            True,
+            2,
+            2,
+        )
+        assert int(storage.get(curr)) == 3
+
+    def test_sliding_log_add(self, clock, storage_factory):
+        storage = storage_factory()
+        key = f"sliding_log:{{op_{time.perf_counter_ns()}}}"
+        now = clock[0]
+
+        assert storage.sliding_log_add(key, now, 10, 3, 2) == (True, 0, None)
+        assert storage.sliding_log_add(key, now + 5, 10, 3, 1) == (True, 2, None)
+        # Full: one of the first two entries has to leave the window
+        assert storage.sliding_log_add(key, now + 6, 10, 3, 2) == (False, 3, now)
+        assert storage.sliding_log_add(key, now + 6, 10, 3, 4) == (False, 3, None)
+        # Both leave the window together
+        assert storage.sliding_log_add(key, now + 10, 10, 3, 2) == (True, 1, None)
+
+    def test_sliding_log_counts_entries_past_now(self, clock, storage_factory):
+        storage = storage_factory()
+        key = f"sliding_log:{{op_{time.perf_counter_ns()}}}"
+        now = clock[0]
+
+        # A writer that read the clock later got the lock first
+        assert storage.sliding_log_add(key, now + 0.5, 10, 3, 2) == (True, 0, None)
+        assert storage.sliding_log_add(key, now, 10, 3, 2)[:2] == (False, 2)
+
+    def test_operations_share_limiter_state(self, clock, storage_factory):
+        storage = storage_factory()
+        key = f"op_{time.perf_counter_ns()}"
+        now = clock[0]
+
+        tokens = TokenBucketLimiter(4, 0.001, storage)
+        assert tokens.allow_many([key, key]) == [True, True]
+        assert storage.token_bucket_consume(
+            tokens._key("tb", key), 4, 0.001, 3, now
+        ) == (False, pytest.approx(2))
+
+        leaky = LeakyBucketLimiter(4, 0.001, storage)
+        assert leaky.allow_many([key, key, key]) == [True] * 3
+        assert storage.leaky_bucket_add(leaky._key("lb", key), 4, 0.001, 1, now) == (
+            True,
+            pytest.approx(4),
+        )
+
+        gcra = GCRALimiter(4, 40, storage=storage)
+        assert gcra.allow_many([key] * 4) == [True] * 4
+        granted, tat = storage.gcra_consume(gcra._key("gcra", key), 10, 40, now)
+        assert (granted, tat) == (False, pytest.approx(now + 40))
+
+        ring = BucketedSlidingWindowLimiter(4, 40, 4, storage)
+        assert ring.allow_many([key] * 3) == [True] * 3
+        bucket = ring._bucket(now)
+        granted, window = storage.bucket_ring_add(
+            ring._key("bsw", key), 4, bucket, 4, 2, 40
+        )
+        assert (granted, window) == (False, [0, 0, 0, 3])
+
+        counter = SlidingWindowCounterLimiter(3, 60, storage)
+        assert counter.allow_many([key, key]) == [True, True]
+        curr, prev, weight, expiry = counter._window(key, now)
+        assert storage.sliding_counter_add(curr, prev, weight, 3, 2, expiry) == (
+            False,
+            2,
+            0,
+        )
+
+        log = SlidingWindowLogLimiter(3, 60, storage)
+        assert log.allow_many([key, key]) == [True, True]
+        assert storage.sliding_log_add(log._key("sliding_log", key), now, 60, 3, 1) == (
+            True,
+            2,
+            None,
+        )
+        assert log.allow(key) is False
+
+
+def test_sliding_log_holds_under_contention(storage_factory):
+    interval = sys.getswitchinterval()
+    limiter = SlidingWindowLogLimiter(200, 60, storage_factory())
+    key = f"contended_{time.perf_counter_ns()}"
+    allowed = []
+
+    def worker():
+        allowed.append(sum(limiter.allow(key) for _ in range(50)))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    # Switch threads often, also between reading the clock and taking the lock
+    sys.setswitchinterval(1e-6)
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert sum(allowed) == 200